@@ -34,6 +34,8 @@ from _pygit2 import *
 
 # High level API
 from .repository import Repository
+from .checkpoint import WalkCheckpoint, WalkUpdate
+from .diffcache import DiffCache, DiffSummary
 from .version import __version__
 from .settings import Settings
 from .credentials import *
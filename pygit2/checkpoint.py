@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2010-2014 The pygit2 contributors
+#
+# This file is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License, version 2,
+# as published by the Free Software Foundation.
+#
+# In addition to the permissions in the GNU General Public License,
+# the authors give you unlimited permission to link the compiled
+# version of this file into combinations with other programs,
+# and to distribute those combinations without any restriction
+# coming from the use of this file.  (The General Public License
+# restrictions do apply in other respects; for example, they cover
+# modification of the file, and distribution when not linked into
+# a combined executable.)
+#
+# This file is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; see the file COPYING.  If not, write to
+# the Free Software Foundation, 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+
+# Import from the future
+from __future__ import absolute_import
+
+# Import from the Standard Library
+from collections import namedtuple
+import json
+import os
+import tempfile
+
+
+WalkUpdate = namedtuple('WalkUpdate', ['walker', 'checkpoint', 'created',
+                                       'moved', 'deleted'])
+WalkUpdate.__doc__ = """
+    The result of Repository.walk_since: a walker over the commits added
+    since the checkpoint, the checkpoint to give next time, and the names
+    of the references created, moved and deleted since the old checkpoint.
+    """
+
+
+class WalkCheckpoint(object):
+    """
+    The commits some references pointed to at a given time, as returned by
+    Repository.checkpoint. Give it to Repository.walk_since to only walk
+    the commits added after it was taken.
+
+    The *tips* attribute maps the reference names to the hex ids of the
+    commits.
+    """
+
+    def __init__(self, tips=None):
+        self.tips = dict(tips or ())
+
+
+    def __len__(self):
+        return len(self.tips)
+
+
+    def __eq__(self, other):
+        return isinstance(other, WalkCheckpoint) and self.tips == other.tips
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def changes(self, other):
+        """
+        Return the names of the references created, moved and deleted from
+        this checkpoint to the *other* one, as three sorted lists.
+        """
+        old, new = self.tips, other.tips
+        created = sorted(name for name in new if name not in old)
+        moved = sorted(name for name in new
+                       if name in old and old[name] != new[name])
+        deleted = sorted(name for name in old if name not in new)
+        return created, moved, deleted
+
+
+    @classmethod
+    def load(cls, path):
+        """Read a checkpoint from the file written by save."""
+        with open(path, 'rb') as f:
+            return cls(json.loads(f.read().decode('utf-8')))
+
+
+    def save(self, path):
+        """
+        Write the checkpoint to the file at *path*. The file is replaced at
+        once, so a crash never leaves half a checkpoint behind.
+        """
+        dirname = os.path.dirname(os.path.abspath(path))
+        data = json.dumps(self.tips, sort_keys=True).encode('utf-8')
+
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2010-2014 The pygit2 contributors
+#
+# This file is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License, version 2,
+# as published by the Free Software Foundation.
+#
+# In addition to the permissions in the GNU General Public License,
+# the authors give you unlimited permission to link the compiled
+# version of this file into combinations with other programs,
+# and to distribute those combinations without any restriction
+# coming from the use of this file.  (The General Public License
+# restrictions do apply in other respects; for example, they cover
+# modification of the file, and distribution when not linked into
+# a combined executable.)
+#
+# This file is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; see the file COPYING.  If not, write to
+# the Free Software Foundation, 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301, USA.
+
+# Import from the future
+from __future__ import absolute_import
+
+# Import from the Standard Library
+from collections import namedtuple
+from hashlib import sha1
+from threading import Lock
+import json
+import os
+import tempfile
+
+# Import from pygit2
+from _pygit2 import Oid
+
+
+class DiffSummary(namedtuple('DiffSummary', ['deltas', 'files_changed',
+                                             'insertions', 'deletions',
+                                             'files'])):
+    """
+    The deltas of a diff, as yielded by Diff.deltas, and its statistics, as
+    found in Diff.stats. The deltas and files are tuples, so a summary held
+    by a DiffCache cannot be changed by its users.
+    """
+    __slots__ = ()
+
+
+def summarize_diff(diff):
+    """Return the DiffSummary of the given diff."""
+    stats = diff.stats
+    return DiffSummary(tuple(diff.deltas), stats.files_changed,
+                       stats.insertions, stats.deletions, tuple(stats.files))
+
+
+def _dump(summary):
+    deltas = [(status, old_path, new_path, old_oid.hex, new_oid.hex, sim)
+              for status, old_path, new_path, old_oid, new_oid, sim
+              in summary.deltas]
+    return json.dumps([deltas] + list(summary[1:]))
+
+
+def _load(data):
+    deltas, files_changed, insertions, deletions, files = json.loads(data)
+    deltas = tuple((status, old_path, new_path, Oid(hex=old_oid),
+                    Oid(hex=new_oid), sim)
+                   for status, old_path, new_path, old_oid, new_oid, sim
+                   in deltas)
+    files = tuple(tuple(x) for x in files)
+    return DiffSummary(deltas, files_changed, insertions, deletions, files)
+
+
+class DiffCache(object):
+    """
+    Least recently used cache of diff summaries, keyed by the ids of the two
+    trees and the diff options. Git objects never change, so an entry never
+    goes stale.
+
+    At most *size* summaries are kept in memory. If *path* is given, every
+    summary is also stored in a file below that directory, and looked up
+    there when it is not in memory.
+
+    The *hits* and *misses* attributes count the lookups.
+    """
+
+    def __init__(self, size=256, path=None):
+        self.size = size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # Links of a circular doubly linked list, [prev, next, key, summary],
+        # from the least to the most recently used; the root is a sentinel
+        self._entries = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+        self._lock = Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    @staticmethod
+    def key(old_tree, new_tree, options):
+        """
+        Return the key for the diff of *old_tree* to *new_tree* (trees or
+        oids) with the given dictionary of diff options.
+        """
+        options = json.dumps(options, sort_keys=True).encode('utf-8')
+        return '%s-%s-%s' % (getattr(old_tree, 'hex', old_tree),
+                             getattr(new_tree, 'hex', new_tree),
+                             sha1(options).hexdigest())
+
+
+    def get(self, key):
+        """Return the summary stored under *key*, or None."""
+        summary = None
+        with self._lock:
+            link = self._entries.get(key)
+            if link is not None:
+                self._unlink(link)
+                self._append(link)
+                summary = link[3]
+
+        if summary is None and self.path is not None:
+            summary = self._read(key)
+            if summary is not None:
+                self._remember(key, summary)
+
+        with self._lock:
+            if summary is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return summary
+
+
+    def put(self, key, summary):
+        """Store *summary* under *key*."""
+        self._remember(key, summary)
+        if self.path is not None:
+            self._write(key, summary)
+
+
+    def clear(self):
+        """Forget the summaries held in memory, and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._root[:] = [self._root, self._root, None, None]
+            self.hits = 0
+            self.misses = 0
+
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+
+    def _append(self, link):
+        root = self._root
+        last = root[0]
+        link[0], link[1] = last, root
+        last[1] = root[0] = link
+
+
+    def _remember(self, key, summary):
+        with self._lock:
+            link = self._entries.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+            link = [None, None, key, summary]
+            self._append(link)
+            self._entries[key] = link
+            while len(self._entries) > self.size:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._entries[oldest[2]]
+
+
+    def _filename(self, key):
+        name = sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, name[:2], name[2:])
+
+
+    def _read(self, key):
+        try:
+            with open(self._filename(key), 'rb') as f:
+                return _load(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+
+    def _write(self, key, summary):
+        filename = self._filename(key)
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+
+        # Write to a temporary file first, so readers never see half of it
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_dump(summary).encode('utf-8'))
+            os.rename(tmp, filename)
+        except (IOError, OSError, ValueError):
+            os.remove(tmp)
+            # Someone else stored it first
+            if not os.path.exists(filename):
+                raise
@@ -26,17 +26,26 @@
 # Boston, MA 02110-1301, USA.
 
 # Import from the Standard Library
+from fnmatch import fnmatchcase
 from string import hexdigits
+import os
 
 # Import from pygit2
 from _pygit2 import Repository as _Repository
 from _pygit2 import GIT_BRANCH_LOCAL, GIT_BRANCH_REMOTE
 from _pygit2 import Oid, GIT_OID_HEXSZ, GIT_OID_MINPREFIXLEN
-from _pygit2 import GIT_CHECKOUT_SAFE_CREATE, GIT_DIFF_NORMAL
-from _pygit2 import Reference, Tree, Commit, Blob
+from _pygit2 import GIT_CHECKOUT_SAFE_CREATE, GIT_DIFF_NORMAL, GIT_SORT_NONE
+from _pygit2 import Reference, Tree, Commit, Blob, Object
+from .checkpoint import WalkCheckpoint, WalkUpdate
+from .diffcache import DiffCache, summarize_diff
 
 
 class Repository(_Repository):
+    """Git repository.
+
+    A Repository object must not be used from several threads at a time,
+    open one per thread instead.
+    """
 
     #
     # Mapping interface
@@ -135,19 +144,23 @@ class Repository(_Repository):
     #
     # Diff
     #
+
+    # The options Repository.diff_blobs takes
+    _blob_diff_options = ('flags', 'context_lines', 'interhunk_lines')
+
     def diff(self, a=None, b=None, cached=False, flags=GIT_DIFF_NORMAL,
-             context_lines=3, interhunk_lines=0):
+             context_lines=3, interhunk_lines=0, **options):
         """
         Show changes between the working tree and the index or a tree,
         changes between the index and a tree, changes between two trees, or
-        changes between two blobs.
+        changes between two blobs (as a Patch).
 
         Keyword arguments:
 
         cached
             use staged changes instead of workdir
 
-        flag
+        flags
             a GIT_DIFF_* constant
 
         context_lines
@@ -158,6 +171,21 @@ class Repository(_Repository):
             the maximum number of unchanged lines between hunk
             boundaries before the hunks will be merged into a one
 
+        paths
+            a list of pathspecs, only the matching files are diffed
+
+        max_size
+            blobs larger than this many bytes are treated as binary
+
+        ignore_submodules
+            a GIT_SUBMODULE_IGNORE_* constant
+
+        old_prefix, new_prefix
+            the path prefixes used in the patch headers ('a' and 'b')
+
+        find_similar
+            GIT_DIFF_FIND_* flags, to detect renames and copies
+
         Examples::
 
           # Changes in the working tree not yet staged for the next commit
@@ -175,6 +203,9 @@ class Repository(_Repository):
           >>> diff(t0, t1)
           >>> diff('HEAD', 'HEAD^') # equivalent
 
+          # Changes below a directory only
+          >>> diff('HEAD', 'HEAD^', paths=['src/foo/'])
+
         If you want to diff a tree against an empty tree, use the low level
         API (Tree.diff_to_tree()) directly.
         """
@@ -194,26 +225,136 @@ class Repository(_Repository):
         a = treeish_to_tree(a) or a
         b = treeish_to_tree(b) or b
 
-        opt_keys = ['flags', 'context_lines', 'interhunk_lines']
-        opt_values = [flags, context_lines, interhunk_lines]
+        options.update(flags=flags, context_lines=context_lines,
+                       interhunk_lines=interhunk_lines)
 
         # Case 1: Diff tree to tree
         if isinstance(a, Tree) and isinstance(b, Tree):
-            return a.diff_to_tree(b, **dict(zip(opt_keys, opt_values)))
+            return a.diff_to_tree(b, **options)
 
         # Case 2: Index to workdir
         elif a is None and b is None:
-            return self.index.diff_to_workdir(*opt_values)
+            return self.index.diff_to_workdir(**options)
 
         # Case 3: Diff tree to index or workdir
         elif isinstance(a, Tree) and b is None:
             if cached:
-                return a.diff_to_index(self.index, *opt_values)
+                return a.diff_to_index(self.index, **options)
             else:
-                return a.diff_to_workdir(*opt_values)
+                return a.diff_to_workdir(**options)
 
         # Case 4: Diff blob to blob
         if isinstance(a, Blob) and isinstance(b, Blob):
-            raise NotImplementedError('git_diff_blob_to_blob()')
+            unsupported = sorted(set(options) - set(self._blob_diff_options))
+            if unsupported:
+                raise TypeError("options not supported when diffing blobs: "
+                                + ", ".join(unsupported))
+            return self.diff_blobs([(a, b, None)], True, **options)[0]
 
         raise ValueError("Only blobs and treeish can be diffed")
+
+
+    #
+    # Diff cache
+    #
+    diff_cache = None
+
+    def enable_diff_cache(self, size=256, persistent=False):
+        """
+        Attach a DiffCache to the repository, used by diff_summary, and
+        return it. At most *size* summaries are kept in memory; if
+        *persistent* is true they are also stored below the .git directory,
+        and are thus shared with other processes.
+        """
+        path = None
+        if persistent:
+            path = os.path.join(self.path, 'pygit2', 'diff-cache')
+        self.diff_cache = DiffCache(size, path)
+        return self.diff_cache
+
+
+    def diff_summary(self, a, b, **options):
+        """
+        Return the DiffSummary (deltas and stats) of the changes between the
+        trees *a* and *b*, which may be given as anything Repository.diff
+        takes. The keyword arguments are passed on to Tree.diff_to_tree.
+
+        The summary is looked up in, and stored to, the diff cache if
+        enable_diff_cache has been called.
+        """
+        def to_tree(obj):
+            if isinstance(obj, Reference):
+                obj = self[obj.resolve().target]
+            elif isinstance(obj, Oid):
+                obj = self[obj]
+            elif not isinstance(obj, Object):
+                obj = self.revparse_single(obj)
+
+            if isinstance(obj, Commit):
+                obj = obj.tree
+            if not isinstance(obj, Tree):
+                raise ValueError("Only treeish can be diffed")
+            return obj
+
+        a = to_tree(a)
+        b = to_tree(b)
+
+        cache = self.diff_cache
+        if cache is None:
+            return summarize_diff(a.diff_to_tree(b, **options))
+
+        key = cache.key(a.oid, b.oid, options)
+        summary = cache.get(key)
+        if summary is None:
+            summary = summarize_diff(a.diff_to_tree(b, **options))
+            cache.put(key, summary)
+        return summary
+
+
+    #
+    # Walk checkpoints
+    #
+    def checkpoint(self, pattern='refs/*'):
+        """
+        Return a WalkCheckpoint with the commits the references matching
+        the glob *pattern* point to now. Tags are peeled; references not
+        pointing to a commit are left out.
+        """
+        tips = {}
+        for name in self.listall_references():
+            if not fnmatchcase(name, pattern):
+                continue
+            target = self.lookup_reference(name).get_object()
+            if isinstance(target, Commit):
+                tips[name] = target.hex
+        return WalkCheckpoint(tips)
+
+
+    def walk_since(self, checkpoint, sort_mode=GIT_SORT_NONE,
+                   pattern='refs/*', **filter):
+        """
+        Walk the commits added since *checkpoint* was taken: all the tips of
+        the references matching *pattern* are pushed, and all the tips of
+        the checkpoint are hidden, so only the new commits are walked. If
+        *checkpoint* is None, the whole history is walked.
+
+        Return a WalkUpdate with the walker, the checkpoint to give next
+        time, and the references created, moved and deleted since the old
+        checkpoint. The other arguments are passed on to walk.
+        """
+        if checkpoint is None:
+            checkpoint = WalkCheckpoint()
+
+        new_checkpoint = self.checkpoint(pattern)
+        walker = self.walk(None, sort_mode, **filter)
+        for oid in set(new_checkpoint.tips.values()):
+            walker.push(oid)
+        for oid in set(checkpoint.tips.values()):
+            try:
+                walker.hide(oid)
+            except KeyError:
+                # The commit has been garbage collected since
+                pass
+
+        created, moved, deleted = checkpoint.changes(new_checkpoint)
+        return WalkUpdate(walker, new_checkpoint, created, moved, deleted)
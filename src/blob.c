@@ -37,6 +37,26 @@ extern PyObject *GitError;
 
 extern PyTypeObject BlobType;
 
+/*
+ * The patch reads the blob contents and the buffer in place, so the objects
+ * it was generated from are kept alive for as long as the patch is.
+ */
+static PyObject *
+blob_wrap_patch(git_patch *patch, Blob *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *owner, *patch_obj;
+
+    owner = Py_BuildValue("(OOO)", self, args, kwds ? kwds : Py_None);
+    if (owner == NULL) {
+        git_patch_free(patch);
+        return NULL;
+    }
+
+    patch_obj = wrap_patch(patch, owner);
+    Py_DECREF(owner);
+    return patch_obj;
+}
+
 PyDoc_STRVAR(Blob_diff__doc__,
   "diff([blob, flag, old_as_path, new_as_path] -> Patch\n"
   "\n"
@@ -68,13 +88,15 @@ Blob_diff(Blob *self, PyObject *args, PyObject *kwds)
                                      &old_as_path, &new_as_path))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_patch_from_blobs(&patch, self->blob, old_as_path,
                                py_blob ? py_blob->blob : NULL, new_as_path,
                                &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
-    return wrap_patch(patch);
+    return blob_wrap_patch(patch, self, args, kwds);
 }
 
 
@@ -111,13 +133,15 @@ Blob_diff_to_buffer(Blob *self, PyObject *args, PyObject *kwds)
                                      &old_as_path, &buffer_as_path))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_patch_from_blob_and_buffer(&patch, self->blob, old_as_path,
                                          buffer, buffer_len, buffer_as_path,
                                          &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
-    return wrap_patch(patch);
+    return blob_wrap_patch(patch, self, args, kwds);
 }
 
 static PyMethodDef Blob_methods[] = {
@@ -159,6 +183,58 @@ PyGetSetDef Blob_getseters[] = {
 };
 
 
+/*
+ * The buffer protocol gives read-only access to the blob contents in place,
+ * without copying them into a bytes string first.
+ */
+static int
+Blob_getbuffer(Blob *self, Py_buffer *view, int flags)
+{
+    return PyBuffer_FillInfo(view, (PyObject *) self,
+                             (void *) git_blob_rawcontent(self->blob),
+                             git_blob_rawsize(self->blob), 1, flags);
+}
+
+#if PY_MAJOR_VERSION == 2
+static Py_ssize_t
+Blob_getreadbuffer(Blob *self, Py_ssize_t index, const void **ptr)
+{
+    if (index != 0) {
+        PyErr_SetString(PyExc_SystemError,
+                        "accessing non-existent blob segment");
+        return -1;
+    }
+    *ptr = (void *) git_blob_rawcontent(self->blob);
+    return git_blob_rawsize(self->blob);
+}
+
+static Py_ssize_t
+Blob_getsegcount(Blob *self, Py_ssize_t *lenp)
+{
+    if (lenp)
+        *lenp = git_blob_rawsize(self->blob);
+
+    return 1;
+}
+
+static PyBufferProcs Blob_as_buffer = {
+    (readbufferproc)Blob_getreadbuffer,
+    NULL,                                   /* bf_getwritebuffer */
+    (segcountproc)Blob_getsegcount,
+    (charbufferproc)Blob_getreadbuffer,
+    (getbufferproc)Blob_getbuffer,
+};
+
+#define BLOB_TPFLAGS Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER
+#else
+static PyBufferProcs Blob_as_buffer = {
+    (getbufferproc)Blob_getbuffer,
+};
+
+#define BLOB_TPFLAGS Py_TPFLAGS_DEFAULT
+#endif
+
+
 PyDoc_STRVAR(Blob__doc__, "Blob objects.");
 
 PyTypeObject BlobType = {
@@ -180,8 +256,8 @@ PyTypeObject BlobType = {
     0,                                         /* tp_str            */
     0,                                         /* tp_getattro       */
     0,                                         /* tp_setattro       */
-    0,                                         /* tp_as_buffer      */
-    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    &Blob_as_buffer,                           /* tp_as_buffer      */
+    BLOB_TPFLAGS,                              /* tp_flags          */
     Blob__doc__,                               /* tp_doc            */
     0,                                         /* tp_traverse       */
     0,                                         /* tp_clear          */
@@ -27,11 +27,24 @@
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <pythread.h>
+#include <errno.h>
+#include <string.h>
 #include <structmember.h>
+#include <structseq.h>
 #include "error.h"
 #include "types.h"
 #include "utils.h"
+#include "oid.h"
 #include "diff.h"
+#include "similarity.h"
+
+#ifdef _MSC_VER
+# include <io.h>
+# define write _write
+#else
+# include <unistd.h>
+#endif
 
 extern PyObject *GitError;
 
@@ -39,8 +52,14 @@ extern PyTypeObject TreeType;
 extern PyTypeObject IndexType;
 extern PyTypeObject DiffType;
 extern PyTypeObject HunkType;
+extern PyTypeObject SimilarityCacheType;
 
 PyTypeObject PatchType;
+PyTypeObject DiffStatsType;
+PyTypeObject DiffDeltasType;
+PyTypeObject DiffPatchesType;
+PyTypeObject DiffLineType;
+PyTypeObject DiffPrintIterType;
 
 PyObject*
 wrap_diff(git_diff *diff, Repository *repo)
@@ -52,122 +71,313 @@ wrap_diff(git_diff *diff, Repository *repo)
         Py_INCREF(repo);
         py_diff->repo = repo;
         py_diff->list = diff;
+        py_diff->busy = 0;
+        py_diff->iterators = 0;
     }
 
     return (PyObject*) py_diff;
 }
 
+/*
+ * Turn the Python values parsed into a diff_args into the libgit2 options.
+ * Must be called with the GIL held, before the diff is computed.
+ */
+int
+diff_args_prepare(diff_args *args)
+{
+    if (args->py_paths != NULL && args->py_paths != Py_None) {
+        if (get_strarraygit_from_pylist(&args->opts.pathspec,
+                                        args->py_paths) < 0)
+            return -1;
+    }
+
+    args->opts.ignore_submodules = args->ignore_submodules;
+
+    if (args->py_find_similar != NULL && args->py_find_similar != Py_None) {
+        args->find_opts.flags = PyLong_AsUnsignedLongMask(
+                                    args->py_find_similar);
+        if (PyErr_Occurred()) {
+            git_strarray_free(&args->opts.pathspec);
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+/*
+ * Release the options and wrap the diff built with them, detecting renames
+ * first if find_similar was given. The GIL must be held.
+ */
+PyObject *
+diff_args_finish(diff_args *args, git_diff *diff, int err, Repository *repo)
+{
+    git_strarray_free(&args->opts.pathspec);
+    if (err < 0)
+        return Error_set(err);
+
+    if (args->py_find_similar != NULL && args->py_find_similar != Py_None) {
+        Py_BEGIN_ALLOW_THREADS
+        err = git_diff_find_similar(diff, &args->find_opts);
+        Py_END_ALLOW_THREADS
+        if (err < 0) {
+            git_diff_free(diff);
+            return Error_set(err);
+        }
+    }
+
+    return wrap_diff(diff, repo);
+}
+
 PyObject *
-wrap_patch(git_patch *patch)
+wrap_patch(git_patch *patch, PyObject *owner)
 {
+    const git_diff_delta *delta;
     Patch *py_patch;
 
     if (!patch)
         Py_RETURN_NONE;
 
-    py_patch = PyObject_New(Patch, &PatchType);
-    if (py_patch) {
-        size_t i, j, hunk_amounts, lines_in_hunk, additions, deletions;
-        const git_diff_delta *delta;
-        const git_diff_hunk *hunk;
-        const git_diff_line *line;
-        int err;
-
-        delta = git_patch_get_delta(patch);
-
-        py_patch->old_file_path = delta->old_file.path;
-        py_patch->new_file_path = delta->new_file.path;
-        py_patch->status = git_diff_status_char(delta->status);
-        py_patch->similarity = delta->similarity;
-        py_patch->flags = delta->flags;
-        py_patch->old_oid = git_oid_allocfmt(&delta->old_file.oid);
-        py_patch->new_oid = git_oid_allocfmt(&delta->new_file.oid);
-
-        git_patch_line_stats(NULL, &additions, &deletions, patch);
-        py_patch->additions = additions;
-        py_patch->deletions = deletions;
-
-        hunk_amounts = git_patch_num_hunks(patch);
-        py_patch->hunks = PyList_New(hunk_amounts);
-        for (i = 0; i < hunk_amounts; ++i) {
-            Hunk *py_hunk = NULL;
-
-            err = git_patch_get_hunk(&hunk, &lines_in_hunk, patch, i);
-            if (err < 0)
-                return Error_set(err);
-
-            py_hunk = PyObject_New(Hunk, &HunkType);
-            if (py_hunk != NULL) {
-                py_hunk->old_start = hunk->old_start;
-                py_hunk->old_lines = hunk->old_lines;
-                py_hunk->new_start = hunk->new_start;
-                py_hunk->new_lines = hunk->new_lines;
-
-                py_hunk->lines = PyList_New(lines_in_hunk);
-                for (j = 0; j < lines_in_hunk; ++j) {
-                    PyObject *py_line_origin = NULL, *py_line = NULL;
-
-                    err = git_patch_get_line_in_hunk(&line, patch, i, j);
-                    if (err < 0)
-                        return Error_set(err);
-
-                    py_line_origin = to_unicode_n(&line->origin, 1,
-                        NULL, NULL);
-                    py_line = to_unicode_n(line->content, line->content_len,
-                        NULL, NULL);
-                    PyList_SetItem(py_hunk->lines, j,
-                        Py_BuildValue("OO", py_line_origin, py_line));
-
-                    Py_DECREF(py_line_origin);
-                    Py_DECREF(py_line);
-                }
-
-                PyList_SetItem((PyObject*) py_patch->hunks, i,
-                    (PyObject*) py_hunk);
-            }
-        }
+    py_patch = PyObject_GC_New(Patch, &PatchType);
+    if (py_patch == NULL) {
+        git_patch_free(patch);
+        return NULL;
+    }
+
+    /* The patch may point into memory it does not own (the blobs or the
+     * buffer it was generated from), so keep the owner alive with it. */
+    Py_XINCREF(owner);
+    py_patch->owner = owner;
+    py_patch->patch = patch;
+
+    /* The delta lives in the diff, which find_similar and merge rewrite,
+     * so copy what the getters need now. */
+    delta = git_patch_get_delta(patch);
+    py_patch->old_file_path = NULL;
+    py_patch->new_file_path = NULL;
+    py_patch->hunks = NULL;
+    if (delta->old_file.path != NULL) {
+        py_patch->old_file_path = strdup(delta->old_file.path);
+        if (py_patch->old_file_path == NULL)
+            goto nomem;
+    }
+    if (delta->new_file.path != NULL) {
+        py_patch->new_file_path = strdup(delta->new_file.path);
+        if (py_patch->new_file_path == NULL)
+            goto nomem;
     }
-    git_patch_free(patch);
+    git_oid_cpy(&py_patch->old_oid, &delta->old_file.oid);
+    git_oid_cpy(&py_patch->new_oid, &delta->new_file.oid);
+    py_patch->status = git_diff_status_char(delta->status);
+    py_patch->similarity = delta->similarity;
+    py_patch->flags = delta->flags;
 
+    PyObject_GC_Track(py_patch);
     return (PyObject*) py_patch;
+
+nomem:
+    Py_DECREF(py_patch);
+    return PyErr_NoMemory();
 }
 
 PyObject*
-diff_get_patch_byindex(git_diff *diff, size_t idx)
+diff_get_patch_byindex(Diff *diff, size_t idx)
 {
     git_patch *patch = NULL;
     int err;
 
-    err = git_patch_from_diff(&patch, diff, idx);
+    CHECK_BUSY(diff, NULL);
+
+    diff->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = git_patch_from_diff(&patch, diff->list, idx);
+    Py_END_ALLOW_THREADS
+    diff->busy = 0;
     if (err < 0)
         return Error_set(err);
 
-    return (PyObject*) wrap_patch(patch);
+    return (PyObject*) wrap_patch(patch, (PyObject*) diff);
 }
 
 static void
 Patch_dealloc(Patch *self)
 {
+    PyObject_GC_UnTrack(self);
     Py_CLEAR(self->hunks);
-    free(self->old_oid);
-    free(self->new_oid);
-    /* We do not have to free old_file_path and new_file_path, they will
-     * be freed by git_diff_list_free in Diff_dealloc */
-    PyObject_Del(self);
+    git_patch_free(self->patch);
+    Py_CLEAR(self->owner);
+    free(self->old_file_path);
+    free(self->new_file_path);
+    PyObject_GC_Del(self);
+}
+
+/* The hunks point back to the patch */
+static int
+Patch_traverse(Patch *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->owner);
+    Py_VISIT(self->hunks);
+    return 0;
+}
+
+static int
+Patch_clear(Patch *self)
+{
+    Py_CLEAR(self->hunks);
+    return 0;
+}
+
+static PyObject *
+path_or_none(const char *path)
+{
+    if (path == NULL)
+        Py_RETURN_NONE;
+
+    return to_path(path);
+}
+
+
+PyDoc_STRVAR(Patch_old_file_path__doc__, "Old file path.");
+
+PyObject *
+Patch_old_file_path__get__(Patch *self)
+{
+    return path_or_none(self->old_file_path);
+}
+
+
+PyDoc_STRVAR(Patch_new_file_path__doc__, "New file path.");
+
+PyObject *
+Patch_new_file_path__get__(Patch *self)
+{
+    return path_or_none(self->new_file_path);
+}
+
+
+PyDoc_STRVAR(Patch_old_oid__doc__, "Old oid.");
+
+PyObject *
+Patch_old_oid__get__(Patch *self)
+{
+    return git_oid_to_py_str(&self->old_oid);
+}
+
+
+PyDoc_STRVAR(Patch_new_oid__doc__, "New oid.");
+
+PyObject *
+Patch_new_oid__get__(Patch *self)
+{
+    return git_oid_to_py_str(&self->new_oid);
+}
+
+
+PyDoc_STRVAR(Patch_status__doc__, "Status, a single character.");
+
+PyObject *
+Patch_status__get__(Patch *self)
+{
+    return to_unicode_n(&self->status, 1, NULL, NULL);
+}
+
+
+PyDoc_STRVAR(Patch_similarity__doc__, "Similarity.");
+
+PyObject *
+Patch_similarity__get__(Patch *self)
+{
+    return PyLong_FromLong(self->similarity);
+}
+
+
+PyDoc_STRVAR(Patch_additions__doc__, "Number of added lines.");
+
+PyObject *
+Patch_additions__get__(Patch *self)
+{
+    size_t additions;
+    int err;
+
+    err = git_patch_line_stats(NULL, &additions, NULL, self->patch);
+    if (err < 0)
+        return Error_set(err);
+
+    return PyLong_FromSize_t(additions);
+}
+
+
+PyDoc_STRVAR(Patch_deletions__doc__, "Number of deleted lines.");
+
+PyObject *
+Patch_deletions__get__(Patch *self)
+{
+    size_t deletions;
+    int err;
+
+    err = git_patch_line_stats(NULL, NULL, &deletions, self->patch);
+    if (err < 0)
+        return Error_set(err);
+
+    return PyLong_FromSize_t(deletions);
+}
+
+
+PyDoc_STRVAR(Patch_hunks__doc__,
+  "Tuple of hunks, built on first access. The lines of a hunk are only\n"
+  "read when its lines or raw_lines attribute is first accessed.");
+
+PyObject *
+Patch_hunks__get__(Patch *self)
+{
+    const git_diff_hunk *hunk;
+    size_t i, n, lines_in_hunk;
+    PyObject *py_hunks;
+    Hunk *py_hunk;
+    int err;
+
+    if (self->hunks != NULL) {
+        Py_INCREF(self->hunks);
+        return self->hunks;
+    }
+
+    n = git_patch_num_hunks(self->patch);
+    py_hunks = PyTuple_New(n);
+    if (py_hunks == NULL)
+        return NULL;
+
+    for (i = 0; i < n; i++) {
+        err = git_patch_get_hunk(&hunk, &lines_in_hunk, self->patch, i);
+        if (err < 0) {
+            Py_DECREF(py_hunks);
+            return Error_set(err);
+        }
+
+        py_hunk = PyObject_GC_New(Hunk, &HunkType);
+        if (py_hunk == NULL) {
+            Py_DECREF(py_hunks);
+            return NULL;
+        }
+
+        Py_INCREF(self);
+        py_hunk->patch = self;
+        py_hunk->lines = NULL;
+        py_hunk->raw_lines = NULL;
+        py_hunk->idx = i;
+        py_hunk->n = lines_in_hunk;
+        py_hunk->old_start = hunk->old_start;
+        py_hunk->old_lines = hunk->old_lines;
+        py_hunk->new_start = hunk->new_start;
+        py_hunk->new_lines = hunk->new_lines;
+        PyObject_GC_Track(py_hunk);
+        PyTuple_SET_ITEM(py_hunks, i, (PyObject*)py_hunk);
+    }
+
+    Py_INCREF(py_hunks);
+    self->hunks = py_hunks;
+    return py_hunks;
 }
 
-PyMemberDef Patch_members[] = {
-    MEMBER(Patch, old_file_path, T_STRING, "old file path"),
-    MEMBER(Patch, new_file_path, T_STRING, "new file path"),
-    MEMBER(Patch, old_oid, T_STRING, "old oid"),
-    MEMBER(Patch, new_oid, T_STRING, "new oid"),
-    MEMBER(Patch, status, T_CHAR, "status"),
-    MEMBER(Patch, similarity, T_INT, "similarity"),
-    MEMBER(Patch, hunks, T_OBJECT, "hunks"),
-    MEMBER(Patch, additions, T_INT, "additions"),
-    MEMBER(Patch, deletions, T_INT, "deletions"),
-    {NULL}
-};
 
 PyDoc_STRVAR(Patch_is_binary__doc__, "True if binary data, False if not.");
 
@@ -175,12 +385,21 @@ PyObject *
 Patch_is_binary__get__(Patch *self)
 {
     if (!(self->flags & GIT_DIFF_FLAG_NOT_BINARY) &&
-            (self->flags & GIT_DIFF_FLAG_BINARY))
+        (self->flags & GIT_DIFF_FLAG_BINARY))
         Py_RETURN_TRUE;
     Py_RETURN_FALSE;
 }
 
 PyGetSetDef Patch_getseters[] = {
+    GETTER(Patch, old_file_path),
+    GETTER(Patch, new_file_path),
+    GETTER(Patch, old_oid),
+    GETTER(Patch, new_oid),
+    GETTER(Patch, status),
+    GETTER(Patch, similarity),
+    GETTER(Patch, hunks),
+    GETTER(Patch, additions),
+    GETTER(Patch, deletions),
     GETTER(Patch, is_binary),
     {NULL}
 };
@@ -207,16 +426,16 @@ PyTypeObject PatchType = {
     0,                                         /* tp_getattro       */
     0,                                         /* tp_setattro       */
     0,                                         /* tp_as_buffer      */
-    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,   /* tp_flags          */
     Patch__doc__,                              /* tp_doc            */
-    0,                                         /* tp_traverse       */
-    0,                                         /* tp_clear          */
+    (traverseproc)Patch_traverse,              /* tp_traverse       */
+    (inquiry)Patch_clear,                      /* tp_clear          */
     0,                                         /* tp_richcompare    */
     0,                                         /* tp_weaklistoffset */
     0,                                         /* tp_iter           */
     0,                                         /* tp_iternext       */
     0,                                         /* tp_methods        */
-    Patch_members,                             /* tp_members        */
+    0,                                         /* tp_members        */
     Patch_getseters,                           /* tp_getset         */
     0,                                         /* tp_base           */
     0,                                         /* tp_dict           */
@@ -229,121 +448,164 @@ PyTypeObject PatchType = {
 };
 
 
-PyObject *
-DiffIter_iternext(DiffIter *self)
+PyStructSequence_Field DiffLine_fields[] = {
+    {"origin", "Origin, a single character such as '+' or '-'."},
+    {"old_lineno", "Line number in the old file, or -1 for an addition."},
+    {"new_lineno", "Line number in the new file, or -1 for a deletion."},
+    {"content", "Content of the line, as bytes."},
+    {"content_offset", "Offset of the content in the file, or -1."},
+    {NULL}
+};
+
+PyDoc_STRVAR(DiffLine__doc__, "Line of a hunk, with its raw content.");
+
+PyStructSequence_Desc DiffLine_desc = {
+    "_pygit2.DiffLine",
+    DiffLine__doc__,
+    DiffLine_fields,
+    5,
+};
+
+static PyObject *
+wrap_diff_line(const git_diff_line *line)
 {
-    if (self->i < self->n)
-        return diff_get_patch_byindex(self->diff->list, self->i++);
+    PyObject *py_line, *py_item;
 
-    PyErr_SetNone(PyExc_StopIteration);
+    py_line = PyStructSequence_New(&DiffLineType);
+    if (py_line == NULL)
+        return NULL;
+
+    py_item = to_unicode_n(&line->origin, 1, NULL, NULL);
+    if (py_item == NULL)
+        goto error;
+    PyStructSequence_SET_ITEM(py_line, 0, py_item);
+    PyStructSequence_SET_ITEM(py_line, 1, PyLong_FromLong(line->old_lineno));
+    PyStructSequence_SET_ITEM(py_line, 2, PyLong_FromLong(line->new_lineno));
+    PyStructSequence_SET_ITEM(py_line, 3, PyBytes_FromStringAndSize(
+                                              line->content,
+                                              line->content_len));
+    PyStructSequence_SET_ITEM(py_line, 4,
+                              PyLong_FromLongLong(line->content_offset));
+    if (PyErr_Occurred())
+        goto error;
+
+    return py_line;
+
+error:
+    Py_DECREF(py_line);
     return NULL;
 }
 
-void
-DiffIter_dealloc(DiffIter *self)
+
+static void
+Hunk_dealloc(Hunk *self)
 {
-    Py_CLEAR(self->diff);
-    PyObject_Del(self);
+    PyObject_GC_UnTrack(self);
+    Py_CLEAR(self->lines);
+    Py_CLEAR(self->raw_lines);
+    Py_CLEAR(self->patch);
+    PyObject_GC_Del(self);
 }
 
+static int
+Hunk_traverse(Hunk *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->patch);
+    return 0;
+}
 
-PyDoc_STRVAR(DiffIter__doc__, "Diff iterator object.");
-
-PyTypeObject DiffIterType = {
-    PyVarObject_HEAD_INIT(NULL, 0)
-    "_pygit2.DiffIter",                        /* tp_name           */
-    sizeof(DiffIter),                          /* tp_basicsize      */
-    0,                                         /* tp_itemsize       */
-    (destructor)DiffIter_dealloc,              /* tp_dealloc        */
-    0,                                         /* tp_print          */
-    0,                                         /* tp_getattr        */
-    0,                                         /* tp_setattr        */
-    0,                                         /* tp_compare        */
-    0,                                         /* tp_repr           */
-    0,                                         /* tp_as_number      */
-    0,                                         /* tp_as_sequence    */
-    0,                                         /* tp_as_mapping     */
-    0,                                         /* tp_hash           */
-    0,                                         /* tp_call           */
-    0,                                         /* tp_str            */
-    0,                                         /* tp_getattro       */
-    0,                                         /* tp_setattro       */
-    0,                                         /* tp_as_buffer      */
-    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
-    DiffIter__doc__,                           /* tp_doc            */
-    0,                                         /* tp_traverse       */
-    0,                                         /* tp_clear          */
-    0,                                         /* tp_richcompare    */
-    0,                                         /* tp_weaklistoffset */
-    PyObject_SelfIter,                         /* tp_iter           */
-    (iternextfunc) DiffIter_iternext,          /* tp_iternext       */
+PyMemberDef Hunk_members[] = {
+    MEMBER(Hunk, old_start, T_INT, "Old start."),
+    MEMBER(Hunk, old_lines, T_INT, "Old lines."),
+    MEMBER(Hunk, new_start, T_INT, "New start."),
+    MEMBER(Hunk, new_lines, T_INT, "New lines."),
+    {NULL}
 };
 
-Py_ssize_t
-Diff_len(Diff *self)
+
+static PyObject *
+wrap_line_tuple(const git_diff_line *line)
 {
-    assert(self->list);
-    return (Py_ssize_t)git_diff_num_deltas(self->list);
+    PyObject *py_line_origin, *py_line, *py_result;
+
+    py_line_origin = to_unicode_n(&line->origin, 1, NULL, NULL);
+    py_line = to_unicode_n(line->content, line->content_len, NULL, NULL);
+    if (py_line_origin == NULL || py_line == NULL)
+        py_result = NULL;
+    else
+        py_result = Py_BuildValue("OO", py_line_origin, py_line);
+
+    Py_XDECREF(py_line_origin);
+    Py_XDECREF(py_line);
+    return py_result;
 }
 
-PyDoc_STRVAR(Diff_patch__doc__, "Patch diff string.");
-
-PyObject *
-Diff_patch__get__(Diff *self)
+static PyObject *
+hunk_lines(Hunk *hunk, int raw)
 {
-    git_patch* patch;
-    char **strings = NULL;
-    char *buffer = NULL;
-    int err = GIT_ERROR;
-    size_t i, len, num;
-    PyObject *py_patch = NULL;
+    const git_diff_line *line;
+    PyObject **cache = raw ? &hunk->raw_lines : &hunk->lines;
+    PyObject *py_lines, *py_line;
+    size_t i;
+    int err;
 
-    num = git_diff_num_deltas(self->list);
-    if (num == 0)
-        Py_RETURN_NONE;
-    MALLOC(strings, num * sizeof(char*), cleanup);
+    if (*cache != NULL) {
+        Py_INCREF(*cache);
+        return *cache;
+    }
 
-    for (i = 0, len = 1; i < num ; ++i) {
-        err = git_patch_from_diff(&patch, self->list, i);
-        if (err < 0)
-            goto cleanup;
+    py_lines = PyTuple_New(hunk->n);
+    if (py_lines == NULL)
+        return NULL;
 
-        err = git_patch_to_str(&(strings[i]), patch);
-        if (err < 0)
-            goto cleanup;
+    for (i = 0; i < hunk->n; i++) {
+        err = git_patch_get_line_in_hunk(&line, hunk->patch->patch, hunk->idx,
+                                         i);
+        if (err < 0) {
+            Py_DECREF(py_lines);
+            return Error_set(err);
+        }
 
-        len += strlen(strings[i]);
-        git_patch_free(patch);
+        if (raw)
+            py_line = wrap_diff_line(line);
+        else
+            py_line = wrap_line_tuple(line);
+        if (py_line == NULL) {
+            Py_DECREF(py_lines);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(py_lines, i, py_line);
     }
 
-    CALLOC(buffer, (len + 1), sizeof(char), cleanup);
-    for (i = 0; i < num; ++i) {
-        strcat(buffer, strings[i]);
-        free(strings[i]);
-    }
-    free(strings);
+    Py_INCREF(py_lines);
+    *cache = py_lines;
+    return py_lines;
+}
 
-    py_patch = to_unicode(buffer, NULL, NULL);
-    free(buffer);
 
-cleanup:
-    return (err < 0) ? Error_set(err) : py_patch;
+PyDoc_STRVAR(Hunk_lines__doc__,
+  "Tuple of (origin, content) tuples, built on first access.");
+
+PyObject *
+Hunk_lines__get__(Hunk *self)
+{
+    return hunk_lines(self, 0);
 }
 
 
-static void
-Hunk_dealloc(Hunk *self)
+PyDoc_STRVAR(Hunk_raw_lines__doc__,
+  "Tuple of DiffLine objects, built on first access. The content is left as\n"
+  "bytes and comes with the line numbers in the old and new files.");
+
+PyObject *
+Hunk_raw_lines__get__(Hunk *self)
 {
-    Py_CLEAR(self->lines);
-    PyObject_Del(self);
+    return hunk_lines(self, 1);
 }
 
-PyMemberDef Hunk_members[] = {
-    MEMBER(Hunk, old_start, T_INT, "Old start."),
-    MEMBER(Hunk, old_lines, T_INT, "Old lines."),
-    MEMBER(Hunk, new_start, T_INT, "New start."),
-    MEMBER(Hunk, new_lines, T_INT, "New lines."),
-    MEMBER(Hunk, lines, T_OBJECT, "Lines."),
+PyGetSetDef Hunk_getseters[] = {
+    GETTER(Hunk, lines),
+    GETTER(Hunk, raw_lines),
     {NULL}
 };
 
@@ -370,9 +632,11 @@ PyTypeObject HunkType = {
     0,                                         /* tp_getattro       */
     0,                                         /* tp_setattro       */
     0,                                         /* tp_as_buffer      */
-    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,  /* tp_flags          */
+    Py_TPFLAGS_DEFAULT |
+    Py_TPFLAGS_BASETYPE |
+    Py_TPFLAGS_HAVE_GC,                        /* tp_flags          */
     Hunk__doc__,                               /* tp_doc            */
-    0,                                         /* tp_traverse       */
+    (traverseproc)Hunk_traverse,               /* tp_traverse       */
     0,                                         /* tp_clear          */
     0,                                         /* tp_richcompare    */
     0,                                         /* tp_weaklistoffset */
@@ -380,7 +644,7 @@ PyTypeObject HunkType = {
     0,                                         /* tp_iternext       */
     0,                                         /* tp_methods        */
     Hunk_members,                              /* tp_members        */
-    0,                                         /* tp_getset         */
+    Hunk_getseters,                            /* tp_getset         */
     0,                                         /* tp_base           */
     0,                                         /* tp_dict           */
     0,                                         /* tp_descr_get      */
@@ -392,57 +656,854 @@ PyTypeObject HunkType = {
 };
 
 
-PyDoc_STRVAR(Diff_merge__doc__,
-  "merge(diff)\n"
-  "\n"
-  "Merge one diff into another.");
-
 PyObject *
-Diff_merge(Diff *self, PyObject *args)
+DiffIter_iternext(DiffIter *self)
 {
-    Diff *py_diff;
-    int err;
+    if (self->i < self->n)
+        return diff_get_patch_byindex(self->diff, self->i++);
 
-    if (!PyArg_ParseTuple(args, "O!", &DiffType, &py_diff))
-        return NULL;
+    PyErr_SetNone(PyExc_StopIteration);
+    return NULL;
+}
 
-    if (py_diff->repo->repo != self->repo->repo)
+void
+DiffIter_dealloc(DiffIter *self)
+{
+    Py_CLEAR(self->diff);
+    PyObject_Del(self);
+}
+
+
+PyDoc_STRVAR(DiffIter__doc__, "Diff iterator object.");
+
+PyTypeObject DiffIterType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.DiffIter",                        /* tp_name           */
+    sizeof(DiffIter),                          /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)DiffIter_dealloc,              /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    DiffIter__doc__,                           /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    PyObject_SelfIter,                         /* tp_iter           */
+    (iternextfunc) DiffIter_iternext,          /* tp_iternext       */
+};
+
+PyObject *
+DiffDeltas_iternext(DiffIter *self)
+{
+    const git_diff_delta *delta;
+    PyObject *items[6], *py_delta = NULL;
+    char status;
+    int i;
+
+    CHECK_BUSY(self->diff, NULL);
+
+    delta = git_diff_get_delta(self->diff->list, self->i);
+    if (delta == NULL) {
+        PyErr_SetNone(PyExc_StopIteration);
+        return NULL;
+    }
+    self->i++;
+
+    status = git_diff_status_char(delta->status);
+    items[0] = to_unicode_n(&status, 1, NULL, NULL);
+    items[1] = path_or_none(delta->old_file.path);
+    items[2] = path_or_none(delta->new_file.path);
+    items[3] = git_oid_to_python(&delta->old_file.oid);
+    items[4] = git_oid_to_python(&delta->new_file.oid);
+    items[5] = PyLong_FromLong(delta->similarity);
+
+    for (i = 0; i < 6; i++)
+        if (items[i] == NULL)
+            goto error;
+
+    py_delta = PyTuple_New(6);
+    if (py_delta == NULL)
+        goto error;
+
+    for (i = 0; i < 6; i++)
+        PyTuple_SET_ITEM(py_delta, i, items[i]);
+    return py_delta;
+
+error:
+    for (i = 0; i < 6; i++)
+        Py_XDECREF(items[i]);
+    return NULL;
+}
+
+
+PyDoc_STRVAR(DiffDeltas__doc__, "Diff deltas iterator object.");
+
+PyTypeObject DiffDeltasType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.DiffDeltas",                      /* tp_name           */
+    sizeof(DiffIter),                          /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)DiffIter_dealloc,              /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    DiffDeltas__doc__,                         /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    PyObject_SelfIter,                         /* tp_iter           */
+    (iternextfunc) DiffDeltas_iternext,        /* tp_iternext       */
+};
+
+/*
+ * Diff.iter_patches builds the patches in batches, without holding the GIL
+ * while a batch is computed. The batches are built one after the other in
+ * the calling thread: git_patch_from_diff looks up the diff drivers through
+ * the attribute caches of the repository, which libgit2 does not lock, so
+ * several threads cannot build patches of one diff at the same time.
+ *
+ * The patches of a batch point into the deltas of the diff until they are
+ * handed out, so the diff counts its live iterators and refuses to be
+ * changed meanwhile.
+ */
+
+/* Deltas per batch */
+#define DIFF_PATCHES_BATCH 32
+
+static void
+diff_patches_clear(git_patch **patches, size_t n)
+{
+    size_t i;
+
+    for (i = 0; i < n; i++) {
+        git_patch_free(patches[i]);
+        patches[i] = NULL;
+    }
+}
+
+static int
+diff_patches_fill(DiffPatches *self)
+{
+    Diff *diff = self->diff;
+    size_t i, start, len;
+    int err = 0;
+
+    start = self->scheduled;
+    len = self->n - start;
+    if (len > DIFF_PATCHES_BATCH)
+        len = DIFF_PATCHES_BATCH;
+
+    diff->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < len; i++) {
+        err = git_patch_from_diff(&self->ready[i], diff->list, start + i);
+        if (err < 0)
+            break;
+    }
+    Py_END_ALLOW_THREADS
+    diff->busy = 0;
+
+    if (err < 0) {
+        diff_patches_clear(self->ready, i);
+        self->scheduled = self->n;
+        Error_set(err);
+        return -1;
+    }
+
+    self->scheduled += len;
+    self->ready_len = len;
+    self->pos = 0;
+    return 0;
+}
+
+PyObject *
+DiffPatches_iternext(DiffPatches *self)
+{
+    git_patch *patch;
+
+    CHECK_BUSY(self->diff, NULL);
+
+    if (self->pos == self->ready_len) {
+        if (self->scheduled == self->n) {
+            PyErr_SetNone(PyExc_StopIteration);
+            return NULL;
+        }
+
+        if (diff_patches_fill(self) < 0)
+            return NULL;
+    }
+
+    patch = self->ready[self->pos];
+    self->ready[self->pos++] = NULL;
+    return wrap_patch(patch, (PyObject*)self->diff);
+}
+
+void
+DiffPatches_dealloc(DiffPatches *self)
+{
+    if (self->ready != NULL)
+        diff_patches_clear(self->ready + self->pos,
+                           self->ready_len - self->pos);
+    free(self->ready);
+    self->diff->iterators--;
+    Py_CLEAR(self->diff);
+    PyObject_Del(self);
+}
+
+
+PyDoc_STRVAR(DiffPatches__doc__, "Patches iterator object.");
+
+PyTypeObject DiffPatchesType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.DiffPatches",                     /* tp_name           */
+    sizeof(DiffPatches),                       /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)DiffPatches_dealloc,           /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    DiffPatches__doc__,                        /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    PyObject_SelfIter,                         /* tp_iter           */
+    (iternextfunc) DiffPatches_iternext,       /* tp_iternext       */
+};
+
+Py_ssize_t
+Diff_len(Diff *self)
+{
+    CHECK_BUSY(self, -1);
+
+    assert(self->list);
+    return (Py_ssize_t)git_diff_num_deltas(self->list);
+}
+
+PyDoc_STRVAR(Diff_patch__doc__, "Patch diff string.");
+
+static int
+diff_to_str(char **out, git_diff *diff, size_t num)
+{
+    git_patch* patch;
+    char **strings = NULL;
+    char *buffer = NULL;
+    int err = GIT_ERROR;
+    size_t i = 0, len;
+
+    MALLOC(strings, num * sizeof(char*), cleanup);
+
+    for (i = 0, len = 1; i < num ; ++i) {
+        err = git_patch_from_diff(&patch, diff, i);
+        if (err < 0)
+            goto cleanup;
+
+        err = git_patch_to_str(&(strings[i]), patch);
+        git_patch_free(patch);
+        if (err < 0)
+            goto cleanup;
+
+        len += strlen(strings[i]);
+    }
+
+    CALLOC(buffer, (len + 1), sizeof(char), cleanup);
+    for (i = 0; i < num; ++i)
+        strcat(buffer, strings[i]);
+
+    *out = buffer;
+
+cleanup:
+    if (strings != NULL) {
+        while (i > 0)
+            free(strings[--i]);
+        free(strings);
+    }
+    return err;
+}
+
+PyObject *
+Diff_patch__get__(Diff *self)
+{
+    char *buffer = NULL;
+    int err;
+    size_t num;
+    PyObject *py_patch;
+
+    CHECK_BUSY(self, NULL);
+
+    num = git_diff_num_deltas(self->list);
+    if (num == 0)
+        Py_RETURN_NONE;
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = diff_to_str(&buffer, self->list, num);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+    if (err < 0)
+        return Error_set(err);
+
+    py_patch = to_unicode(buffer, NULL, NULL);
+    free(buffer);
+
+    return py_patch;
+}
+
+
+/*
+ * merge and find_similar replace the deltas of the diff, which the patches
+ * held by a live iter_patches() iterator, or the paused printer of a live
+ * patch_chunks() iterator, still point to.
+ */
+static int
+diff_check_iterators(Diff *self)
+{
+    if (self->iterators == 0)
+        return 0;
+
+    PyErr_SetString(PyExc_RuntimeError,
+                    "diff cannot be changed while an iterator over it is "
+                    "alive");
+    return -1;
+}
+
+PyDoc_STRVAR(Diff_merge__doc__,
+  "merge(diff)\n"
+  "\n"
+  "Merge one diff into another.");
+
+PyObject *
+Diff_merge(Diff *self, PyObject *args)
+{
+    Diff *py_diff;
+    int err;
+
+    CHECK_BUSY(self, NULL);
+    if (diff_check_iterators(self) < 0)
+        return NULL;
+
+    if (!PyArg_ParseTuple(args, "O!", &DiffType, &py_diff))
+        return NULL;
+
+    CHECK_BUSY(py_diff, NULL);
+
+    if (py_diff->repo->repo != self->repo->repo)
         return Error_set(GIT_ERROR);
 
-    err = git_diff_merge(self->list, py_diff->list);
-    if (err < 0)
-        return Error_set(err);
+    self->busy = py_diff->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = git_diff_merge(self->list, py_diff->list);
+    Py_END_ALLOW_THREADS
+    self->busy = py_diff->busy = 0;
+    if (err < 0)
+        return Error_set(err);
+
+    Py_RETURN_NONE;
+}
+
+
+PyDoc_STRVAR(Diff_find_similar__doc__,
+  "find_similar([flags, rename_threshold, copy_threshold,\n"
+  "              rename_from_rewrite_threshold, break_rewrite_threshold,\n"
+  "              rename_limit, cache])\n"
+  "\n"
+  "Find renamed files in diff and updates them in-place in the diff itself.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "flags: GIT_DIFF_FIND_* flags.\n"
+  "\n"
+  "rename_threshold: similarity to consider a file renamed (default 50).\n"
+  "\n"
+  "copy_threshold: similarity to consider a file a copy (default 50).\n"
+  "\n"
+  "rename_from_rewrite_threshold: similarity to split a modification into\n"
+  "   a rename and a modification (default 50).\n"
+  "\n"
+  "break_rewrite_threshold: similarity below which a modification is\n"
+  "   broken into a delete and an add (default 60).\n"
+  "\n"
+  "rename_limit: maximum number of candidates to compare for each file\n"
+  "   (default 200, or the diff.renameLimit setting).\n"
+  "\n"
+  "cache: a :py:class:`~pygit2.SimilarityCache`, to reuse the signatures\n"
+  "   of the blobs across diffs.");
+
+PyObject *
+Diff_find_similar(Diff *self, PyObject *args, PyObject *kwds)
+{
+    int err;
+    git_diff_find_options opts = GIT_DIFF_FIND_OPTIONS_INIT;
+    git_diff_similarity_metric metric;
+    similarity_payload payload;
+    SimilarityCache *cache = NULL;
+    Py_ssize_t rename_limit = 0;
+    char *keywords[] = {"flags", "rename_threshold", "copy_threshold",
+                        "rename_from_rewrite_threshold",
+                        "break_rewrite_threshold", "rename_limit", "cache",
+                        NULL};
+
+    CHECK_BUSY(self, NULL);
+    if (diff_check_iterators(self) < 0)
+        return NULL;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|iHHHHnO!", keywords,
+                                     &opts.flags, &opts.rename_threshold,
+                                     &opts.copy_threshold,
+                                     &opts.rename_from_rewrite_threshold,
+                                     &opts.break_rewrite_threshold,
+                                     &rename_limit,
+                                     &SimilarityCacheType, &cache))
+        return NULL;
+
+    if (rename_limit < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "rename_limit must be non-negative");
+        return NULL;
+    }
+    opts.rename_limit = (size_t)rename_limit;
+
+    if (cache != NULL) {
+        if (similarity_metric_init(&metric, &payload, cache, opts.flags) < 0)
+            return NULL;
+        opts.metric = &metric;
+    }
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = git_diff_find_similar(self->list, &opts);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+    if (cache != NULL)
+        similarity_cache_trim(cache);
+    if (err < 0)
+        return Error_set(err);
+
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(Diff_iter_patches__doc__,
+  "iter_patches() -> iterator\n"
+  "\n"
+  "Return an iterator over the patches of the diff, in delta order, like\n"
+  "iterating the diff itself. The patches are built in batches without\n"
+  "holding the GIL, so other Python threads run meanwhile; the batches are\n"
+  "not built in parallel, as libgit2 does not support generating patches\n"
+  "of one diff from several threads. The diff cannot be merged into or\n"
+  "searched for renames while the iterator is alive.");
+
+PyObject *
+Diff_iter_patches(Diff *self)
+{
+    DiffPatches *iter;
+
+    CHECK_BUSY(self, NULL);
+
+    iter = PyObject_New(DiffPatches, &DiffPatchesType);
+    if (iter == NULL)
+        return NULL;
+
+    Py_INCREF(self);
+    self->iterators++;
+    iter->diff = self;
+    iter->n = git_diff_num_deltas(self->list);
+    iter->ready_len = 0;
+    iter->pos = 0;
+    iter->scheduled = 0;
+    iter->ready = calloc(DIFF_PATCHES_BATCH, sizeof(git_patch*));
+    if (iter->ready == NULL) {
+        Py_DECREF(iter);
+        return PyErr_NoMemory();
+    }
+
+    return (PyObject*)iter;
+}
+
+/*
+ * Printing the patch text with git_diff_print: the lines are gathered into
+ * a buffer of bounded size, and "flush" is called each time it is full,
+ * and once at the end. The GIL is not held while printing.
+ */
+typedef struct diff_print_payload {
+    char *buf;
+    size_t len;
+    size_t size;
+    int (*flush)(struct diff_print_payload *payload);
+    void *data;
+    int fd;
+    int error;
+} diff_print_payload;
+
+/* Default size of the chunks written or handed out */
+#define DIFF_PRINT_CHUNK 65536
+
+static int
+diff_print_put(diff_print_payload *payload, const char *data, size_t len)
+{
+    size_t n;
+
+    while (len > 0) {
+        n = payload->size - payload->len;
+        if (n > len)
+            n = len;
 
-    Py_RETURN_NONE;
+        memcpy(payload->buf + payload->len, data, n);
+        payload->len += n;
+        data += n;
+        len -= n;
+
+        if (payload->len == payload->size && payload->flush(payload) < 0)
+            return GIT_EUSER;
+    }
+
+    return 0;
 }
 
+static int
+diff_print_cb(const git_diff_delta *delta, const git_diff_hunk *hunk,
+              const git_diff_line *line, void *data)
+{
+    diff_print_payload *payload = data;
+    int err;
+
+    if (line->origin == GIT_DIFF_LINE_CONTEXT ||
+        line->origin == GIT_DIFF_LINE_ADDITION ||
+        line->origin == GIT_DIFF_LINE_DELETION) {
+        err = diff_print_put(payload, &line->origin, 1);
+        if (err < 0)
+            return err;
+    }
+
+    return diff_print_put(payload, line->content, line->content_len);
+}
 
-PyDoc_STRVAR(Diff_find_similar__doc__,
-  "find_similar([flags])\n"
+static int
+diff_print(git_diff *diff, diff_print_payload *payload)
+{
+    int err;
+
+    err = git_diff_print(diff, GIT_DIFF_FORMAT_PATCH, diff_print_cb, payload);
+    if (err == 0 && payload->len > 0 && payload->flush(payload) < 0)
+        err = GIT_EUSER;
+
+    return err;
+}
+
+static int
+diff_print_flush_fd(diff_print_payload *payload)
+{
+    const char *buf = payload->buf;
+    size_t len = payload->len;
+    int n;
+
+    while (len > 0) {
+        n = write(payload->fd, buf, len);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            payload->error = errno;
+            return -1;
+        }
+        buf += n;
+        len -= n;
+    }
+
+    payload->len = 0;
+    return 0;
+}
+
+static int
+diff_print_flush_file(diff_print_payload *payload)
+{
+    PyObject *py_chunk, *ret;
+    PyGILState_STATE gil;
+    int err = -1;
+
+    gil = PyGILState_Ensure();
+
+    py_chunk = PyBytes_FromStringAndSize(payload->buf, payload->len);
+    if (py_chunk == NULL)
+        goto out;
+
+    ret = PyObject_CallMethod(payload->data, "write", "(O)", py_chunk);
+    Py_DECREF(py_chunk);
+    if (ret == NULL)
+        goto out;
+
+    Py_DECREF(ret);
+    payload->len = 0;
+    err = 0;
+
+out:
+    PyGILState_Release(gil);
+    return err;
+}
+
+
+PyDoc_STRVAR(Diff_write_patch__doc__,
+  "write_patch(file) -> None\n"
   "\n"
-  "Find renamed files in diff and updates them in-place in the diff itself.");
+  "Write the patch text of the diff to the given file, without building it\n"
+  "in memory.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "file: a file descriptor, or a file-like object opened in binary mode; its\n"
+  "   write method is called with chunks of bytes.");
 
 PyObject *
-Diff_find_similar(Diff *self, PyObject *args)
+Diff_write_patch(Diff *self, PyObject *py_file)
 {
+    diff_print_payload payload;
     int err;
-    git_diff_find_options opts = GIT_DIFF_FIND_OPTIONS_INIT;
 
-    if (!PyArg_ParseTuple(args, "|i", &opts.flags))
-        return NULL;
+    CHECK_BUSY(self, NULL);
+
+    payload.len = 0;
+    payload.size = DIFF_PRINT_CHUNK;
+    payload.data = py_file;
+    payload.error = 0;
+    if (PyLong_Check(py_file)) {
+        payload.fd = (int)PyLong_AsLong(py_file);
+        if (payload.fd == -1 && PyErr_Occurred())
+            return NULL;
+        payload.flush = diff_print_flush_fd;
+    } else {
+        payload.fd = -1;
+        payload.flush = diff_print_flush_file;
+    }
 
-    err = git_diff_find_similar(self->list, &opts);
-    if (err < 0)
+    payload.buf = malloc(payload.size);
+    if (payload.buf == NULL)
+        return PyErr_NoMemory();
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = diff_print(self->list, &payload);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+    free(payload.buf);
+
+    if (payload.error) {
+        errno = payload.error;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    if (err < 0) {
+        if (err == GIT_EUSER && PyErr_Occurred())
+            return NULL;
         return Error_set(err);
+    }
 
     Py_RETURN_NONE;
 }
 
+
+/*
+ * Diff.patch_chunks runs git_diff_print, which cannot be paused, in a
+ * native thread and hands the text over in chunks, see thread_handoff in
+ * utils.c.
+ */
+
+static int
+diff_print_flush_iter(diff_print_payload *payload)
+{
+    DiffPrintIter *self = payload->data;
+
+    self->len = payload->len;
+    if (thread_handoff_put(&self->handoff))
+        return -1;
+
+    payload->len = 0;
+    return 0;
+}
+
+static void
+diff_print_iter_run(void *data)
+{
+    DiffPrintIter *self = data;
+    diff_print_payload payload;
+    int err;
+
+    payload.buf = self->buf;
+    payload.len = 0;
+    payload.size = self->size;
+    payload.flush = diff_print_flush_iter;
+    payload.data = self;
+    payload.fd = -1;
+    payload.error = 0;
+
+    err = diff_print(self->diff->list, &payload);
+    if (self->handoff.stop)
+        err = 0;
+
+    self->len = 0;
+    thread_handoff_done(&self->handoff, err);
+}
+
+PyObject *
+DiffPrintIter_iternext(DiffPrintIter *self)
+{
+    int err;
+
+    if (self->handoff.done)
+        return thread_handoff_error(&self->handoff);
+
+    CHECK_BUSY(self->diff, NULL);
+
+    /* The printer uses the diff until it hands over the next chunk */
+    self->diff->busy = 1;
+    err = thread_handoff_get(&self->handoff, diff_print_iter_run, self);
+    self->diff->busy = 0;
+    if (err < 0)
+        return NULL;
+
+    if (self->len > 0)
+        return PyBytes_FromStringAndSize(self->buf, self->len);
+
+    return thread_handoff_error(&self->handoff);
+}
+
+void
+DiffPrintIter_dealloc(DiffPrintIter *self)
+{
+    /* Tell the printer to stop, and wait for it to let go */
+    if (self->handoff.started && !self->handoff.done) {
+        self->diff->busy = 1;
+        thread_handoff_stop(&self->handoff);
+        self->diff->busy = 0;
+    }
+
+    thread_handoff_free(&self->handoff);
+    free(self->buf);
+    self->diff->iterators--;
+    Py_CLEAR(self->diff);
+    PyObject_Del(self);
+}
+
+
+PyDoc_STRVAR(DiffPrintIter__doc__, "Patch text iterator object.");
+
+PyTypeObject DiffPrintIterType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.DiffPrintIter",                   /* tp_name           */
+    sizeof(DiffPrintIter),                     /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)DiffPrintIter_dealloc,         /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    DiffPrintIter__doc__,                      /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    PyObject_SelfIter,                         /* tp_iter           */
+    (iternextfunc) DiffPrintIter_iternext,     /* tp_iternext       */
+};
+
+
+PyDoc_STRVAR(Diff_patch_chunks__doc__,
+  "patch_chunks([size]) -> iterator\n"
+  "\n"
+  "Return an iterator over the patch text of the diff, as chunks of bytes\n"
+  "of at most the given size (64 KiB by default). Only one chunk is held in\n"
+  "memory at a time. The diff cannot be merged into or searched for renames\n"
+  "while the iterator is alive.");
+
+PyObject *
+Diff_patch_chunks(Diff *self, PyObject *args, PyObject *kwds)
+{
+    DiffPrintIter *iter;
+    Py_ssize_t size = DIFF_PRINT_CHUNK;
+    char *keywords[] = {"size", NULL};
+
+    CHECK_BUSY(self, NULL);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|n", keywords, &size))
+        return NULL;
+
+    if (size < 1) {
+        PyErr_SetString(PyExc_ValueError, "size must be at least 1");
+        return NULL;
+    }
+
+    iter = PyObject_New(DiffPrintIter, &DiffPrintIterType);
+    if (iter == NULL)
+        return NULL;
+
+    Py_INCREF(self);
+    self->iterators++;
+    iter->diff = self;
+    iter->len = 0;
+    iter->size = (size_t)size;
+    iter->buf = malloc(iter->size);
+    if (thread_handoff_init(&iter->handoff) < 0 || iter->buf == NULL) {
+        Py_DECREF(iter);
+        return PyErr_NoMemory();
+    }
+
+    return (PyObject*)iter;
+}
+
 PyObject *
 Diff_iter(Diff *self)
 {
     DiffIter *iter;
 
+    CHECK_BUSY(self, NULL);
+
     iter = PyObject_New(DiffIter, &DiffIterType);
     if (iter != NULL) {
         Py_INCREF(self);
@@ -458,14 +1519,253 @@ Diff_getitem(Diff *self, PyObject *value)
 {
     size_t i;
 
+    CHECK_BUSY(self, NULL);
+
     if (PyLong_Check(value) < 0)
         return NULL;
 
     i = PyLong_AsUnsignedLong(value);
 
-    return diff_get_patch_byindex(self->list, i);
+    return diff_get_patch_byindex(self, i);
+}
+
+
+static int
+diff_stats_file_cb(const git_diff_delta *delta, float progress, void *payload)
+{
+    DiffStats *stats = payload;
+    DiffStatsFile *files, *file;
+
+    if (delta->status == GIT_DELTA_UNMODIFIED)
+        return 0;
+
+    if (stats->n == stats->size) {
+        stats->size = stats->size ? stats->size * 2 : 16;
+        files = realloc(stats->files, stats->size * sizeof(DiffStatsFile));
+        if (files == NULL)
+            goto oom;
+        stats->files = files;
+    }
+
+    file = &stats->files[stats->n];
+    file->path = strdup(delta->new_file.path ? delta->new_file.path
+                                             : delta->old_file.path);
+    if (file->path == NULL)
+        goto oom;
+    file->insertions = 0;
+    file->deletions = 0;
+    stats->n++;
+    return 0;
+
+oom:
+    giterr_set_oom();
+    return GIT_ERROR;
+}
+
+static int
+diff_stats_line_cb(const git_diff_delta *delta, const git_diff_hunk *hunk,
+                   const git_diff_line *line, void *payload)
+{
+    DiffStats *stats = payload;
+    DiffStatsFile *file = &stats->files[stats->n - 1];
+
+    if (line->origin == GIT_DIFF_LINE_ADDITION) {
+        file->insertions++;
+        stats->insertions++;
+    } else if (line->origin == GIT_DIFF_LINE_DELETION) {
+        file->deletions++;
+        stats->deletions++;
+    }
+
+    return 0;
+}
+
+
+PyDoc_STRVAR(Diff_deltas__doc__,
+  "Iterator over the deltas, yielding (status, old_file_path,\n"
+  "new_file_path, old_oid, new_oid, similarity) tuples. Unlike iterating\n"
+  "the diff no patch is generated.");
+
+PyObject *
+Diff_deltas__get__(Diff *self)
+{
+    DiffIter *iter;
+
+    CHECK_BUSY(self, NULL);
+
+    iter = PyObject_New(DiffIter, &DiffDeltasType);
+    if (iter != NULL) {
+        Py_INCREF(self);
+        iter->diff = self;
+        iter->i = 0;
+        iter->n = git_diff_num_deltas(self->list);
+    }
+    return (PyObject*)iter;
+}
+
+
+PyDoc_STRVAR(Diff_stats__doc__,
+  "Number of files changed, insertions and deletions, as a DiffStats\n"
+  "object. Only the counts are computed, no patch is built.");
+
+PyObject *
+Diff_stats__get__(Diff *self)
+{
+    DiffStats *stats;
+    int err;
+
+    CHECK_BUSY(self, NULL);
+
+    stats = PyObject_New(DiffStats, &DiffStatsType);
+    if (stats == NULL)
+        return NULL;
+
+    stats->files = NULL;
+    stats->n = 0;
+    stats->size = 0;
+    stats->insertions = 0;
+    stats->deletions = 0;
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = git_diff_foreach(self->list, diff_stats_file_cb, NULL,
+                           diff_stats_line_cb, stats);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+    if (err < 0) {
+        Py_DECREF(stats);
+        return Error_set(err);
+    }
+
+    return (PyObject*)stats;
+}
+
+
+static void
+DiffStats_dealloc(DiffStats *self)
+{
+    size_t i;
+
+    for (i = 0; i < self->n; i++)
+        free(self->files[i].path);
+    free(self->files);
+    PyObject_Del(self);
+}
+
+
+PyDoc_STRVAR(DiffStats_files_changed__doc__, "Number of files changed.");
+
+PyObject *
+DiffStats_files_changed__get__(DiffStats *self)
+{
+    return PyLong_FromSize_t(self->n);
+}
+
+
+PyDoc_STRVAR(DiffStats_insertions__doc__, "Total number of added lines.");
+
+PyObject *
+DiffStats_insertions__get__(DiffStats *self)
+{
+    return PyLong_FromSize_t(self->insertions);
+}
+
+
+PyDoc_STRVAR(DiffStats_deletions__doc__, "Total number of deleted lines.");
+
+PyObject *
+DiffStats_deletions__get__(DiffStats *self)
+{
+    return PyLong_FromSize_t(self->deletions);
+}
+
+
+PyDoc_STRVAR(DiffStats_files__doc__,
+  "List of (path, insertions, deletions) tuples, one per file changed.");
+
+PyObject *
+DiffStats_files__get__(DiffStats *self)
+{
+    PyObject *py_files, *py_path, *py_file;
+    size_t i;
+
+    py_files = PyList_New(self->n);
+    if (py_files == NULL)
+        return NULL;
+
+    for (i = 0; i < self->n; i++) {
+        py_path = to_path(self->files[i].path);
+        if (py_path == NULL)
+            goto error;
+
+        py_file = Py_BuildValue("(Nnn)", py_path,
+                                (Py_ssize_t)self->files[i].insertions,
+                                (Py_ssize_t)self->files[i].deletions);
+        if (py_file == NULL)
+            goto error;
+
+        PyList_SET_ITEM(py_files, i, py_file);
+    }
+
+    return py_files;
+
+error:
+    Py_DECREF(py_files);
+    return NULL;
 }
 
+PyGetSetDef DiffStats_getseters[] = {
+    GETTER(DiffStats, files_changed),
+    GETTER(DiffStats, insertions),
+    GETTER(DiffStats, deletions),
+    GETTER(DiffStats, files),
+    {NULL}
+};
+
+
+PyDoc_STRVAR(DiffStats__doc__, "Diff statistics.");
+
+PyTypeObject DiffStatsType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.DiffStats",                       /* tp_name           */
+    sizeof(DiffStats),                         /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)DiffStats_dealloc,             /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    DiffStats__doc__,                          /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    0,                                         /* tp_iter           */
+    0,                                         /* tp_iternext       */
+    0,                                         /* tp_methods        */
+    0,                                         /* tp_members        */
+    DiffStats_getseters,                       /* tp_getset         */
+    0,                                         /* tp_base           */
+    0,                                         /* tp_dict           */
+    0,                                         /* tp_descr_get      */
+    0,                                         /* tp_descr_set      */
+    0,                                         /* tp_dictoffset     */
+    0,                                         /* tp_init           */
+    0,                                         /* tp_alloc          */
+    0,                                         /* tp_new            */
+};
+
 
 static void
 Diff_dealloc(Diff *self)
@@ -477,6 +1777,8 @@ Diff_dealloc(Diff *self)
 
 PyGetSetDef Diff_getseters[] = {
     GETTER(Diff, patch),
+    GETTER(Diff, stats),
+    GETTER(Diff, deltas),
     {NULL}
 };
 
@@ -488,12 +1790,20 @@ PyMappingMethods Diff_as_mapping = {
 
 static PyMethodDef Diff_methods[] = {
     METHOD(Diff, merge, METH_VARARGS),
-    METHOD(Diff, find_similar, METH_VARARGS),
+    METHOD(Diff, find_similar, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Diff, iter_patches, METH_NOARGS),
+    METHOD(Diff, write_patch, METH_O),
+    METHOD(Diff, patch_chunks, METH_VARARGS | METH_KEYWORDS),
     {NULL}
 };
 
 
-PyDoc_STRVAR(Diff__doc__, "Diff objects.");
+PyDoc_STRVAR(Diff__doc__,
+  "Diff objects.\n"
+  "\n"
+  "Diff objects must not be shared between threads: while a method runs\n"
+  "without the GIL the object is busy, and using it meanwhile (from another\n"
+  "thread or a callback) raises RuntimeError.");
 
 PyTypeObject DiffType = {
     PyVarObject_HEAD_INIT(NULL, 0)
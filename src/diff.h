@@ -37,11 +37,42 @@
                   PyObject_TypeCheck(_x, _type_x) && \
                   PyObject_TypeCheck(_y, _type_y)
 
+/*
+ * Options shared by every function that builds a Diff. The keywords are
+ * appended to the ones each entry point already takes, e.g.
+ *
+ *   PyArg_ParseTupleAndKeywords(args, kwds, "|IHH" DIFF_ARGS_FORMAT,
+ *                               keywords, ..., DIFF_ARGS_VALUES(d))
+ */
+typedef struct {
+    git_diff_options opts;
+    PyObject *py_paths;
+    int ignore_submodules;
+    PyObject *py_find_similar;
+    git_diff_find_options find_opts;
+} diff_args;
+
+#define DIFF_ARGS_INIT {GIT_DIFF_OPTIONS_INIT, NULL, \
+                        GIT_SUBMODULE_IGNORE_DEFAULT, NULL, \
+                        GIT_DIFF_FIND_OPTIONS_INIT}
+
+#define DIFF_ARGS_FORMAT "OLizzO"
+
+#define DIFF_ARGS_KEYWORDS "paths", "max_size", "ignore_submodules", \
+                           "old_prefix", "new_prefix", "find_similar"
+
+#define DIFF_ARGS_VALUES(d) &(d).py_paths, &(d).opts.max_size, \
+                            &(d).ignore_submodules, &(d).opts.old_prefix, \
+                            &(d).opts.new_prefix, &(d).py_find_similar
+
+int diff_args_prepare(diff_args *args);
+PyObject* diff_args_finish(diff_args *args, git_diff *diff, int err,
+                           Repository *repo);
 
 PyObject* Diff_changes(Diff *self);
 PyObject* Diff_patch(Diff *self);
 
 PyObject* wrap_diff(git_diff *diff, Repository *repo);
-PyObject* wrap_patch(git_patch *patch);
+PyObject* wrap_patch(git_patch *patch, PyObject *owner);
 
 #endif
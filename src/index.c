@@ -27,6 +27,7 @@
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <string.h>
 #include "error.h"
 #include "types.h"
 #include "utils.h"
@@ -34,6 +35,10 @@
 #include "diff.h"
 #include "index.h"
 
+#ifdef _MSC_VER
+# define strcasecmp _stricmp
+#endif
+
 extern PyTypeObject IndexType;
 extern PyTypeObject TreeType;
 extern PyTypeObject DiffType;
@@ -56,6 +61,7 @@ Index_init(Index *self, PyObject *args, PyObject *kwds)
     if (!PyArg_ParseTuple(args, "s", &path))
         return -1;
 
+    self->busy = 0;
     err = git_index_open(&self->index, path);
     if (err < 0) {
         Error_set_str(err, path);
@@ -93,6 +99,8 @@ Index_add(Index *self, PyObject *args)
     const char *path;
     IndexEntry *py_entry;
 
+    CHECK_BUSY(self, NULL);
+
     if (PyArg_ParseTuple(args, "O!", &IndexEntryType, &py_entry)) {
         err = git_index_add(self->index, &py_entry->entry);
         if (err < 0)
@@ -105,7 +113,11 @@ Index_add(Index *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s", &path))
         return NULL;
 
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_index_add_bypath(self->index, path);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
     if (err < 0)
         return Error_set_str(err, path);
 
@@ -113,31 +125,410 @@ Index_add(Index *self, PyObject *args)
 }
 
 
-PyDoc_STRVAR(Index_add_all__doc__,
-  "add_all([file names|glob pattern])\n"
+/*
+ * Index.add_entries: git_index_add keeps the entries sorted, inserting each
+ * one in place. Adding them already sorted, they all go at the end, or
+ * close to it, so the entries are parsed first and sorted once.
+ */
+typedef struct {
+    git_index_entry entry;
+    size_t pos;
+} index_add_item;
+
+static int
+index_add_item_cmp(const void *a, const void *b)
+{
+    const index_add_item *item_a = a, *item_b = b;
+    int cmp;
+
+    cmp = strcmp(item_a->entry.path, item_b->entry.path);
+    if (cmp != 0)
+        return cmp;
+
+    /* Keep the order of the input, so the last one wins */
+    return (item_a->pos > item_b->pos) - (item_a->pos < item_b->pos);
+}
+
+static int
+index_add_item_casecmp(const void *a, const void *b)
+{
+    const index_add_item *item_a = a, *item_b = b;
+    int cmp;
+
+    cmp = strcasecmp(item_a->entry.path, item_b->entry.path);
+    if (cmp != 0)
+        return cmp;
+
+    return index_add_item_cmp(a, b);
+}
+
+static int
+index_add_item_parse(index_add_item *item, PyObject *py_item)
+{
+    PyObject *py_path, *py_oid;
+    unsigned int mode;
+
+    if (PyObject_TypeCheck(py_item, &IndexEntryType)) {
+        memcpy(&item->entry, &((IndexEntry*)py_item)->entry,
+               sizeof(git_index_entry));
+        item->entry.path = strdup(item->entry.path);
+        if (item->entry.path == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        return 0;
+    }
+
+    if (!PyArg_ParseTuple(py_item, "OOI", &py_path, &py_oid, &mode))
+        return -1;
+
+    memset(&item->entry, 0, sizeof(git_index_entry));
+    if (py_oid_to_git_oid(py_oid, &item->entry.oid) == 0)
+        return -1;
+
+    item->entry.mode = mode;
+    item->entry.path = py_path_to_c_str(py_path);
+    if (item->entry.path == NULL)
+        return -1;
+
+    return 0;
+}
+
+
+PyDoc_STRVAR(Index_add_entries__doc__,
+  "add_entries(entries)\n"
   "\n"
-  "Add or update index entries matching files in the working directory.");
+  "Add or update many entries at once, without reading the working\n"
+  "directory. The entries are IndexEntry objects or (path, oid, mode)\n"
+  "tuples; the objects they point to should exist already. They are sorted\n"
+  "and inserted without holding the GIL.");
 
 PyObject *
-Index_add_all(Index *self, PyObject *pylist)
+Index_add_entries(Index *self, PyObject *py_entries)
 {
+    index_add_item *items = NULL;
+    PyObject *py_seq;
+    size_t i, n, parsed = 0;
+    int err = 0;
+
+    CHECK_BUSY(self, NULL);
+
+    py_seq = PySequence_Fast(py_entries, "expected an iterable of entries");
+    if (py_seq == NULL)
+        return NULL;
+
+    n = PySequence_Fast_GET_SIZE(py_seq);
+    if (n > 0) {
+        items = malloc(n * sizeof(index_add_item));
+        if (items == NULL) {
+            PyErr_NoMemory();
+            goto cleanup;
+        }
+    }
+
+    for (parsed = 0; parsed < n; parsed++) {
+        items[parsed].pos = parsed;
+        if (index_add_item_parse(&items[parsed],
+                                 PySequence_Fast_GET_ITEM(py_seq, parsed)) < 0)
+            goto cleanup;
+    }
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    qsort(items, n, sizeof(index_add_item),
+          (git_index_caps(self->index) & GIT_INDEXCAP_IGNORE_CASE)
+          ? index_add_item_casecmp : index_add_item_cmp);
+
+    for (i = 0; i < n; i++) {
+        err = git_index_add(self->index, &items[i].entry);
+        if (err < 0)
+            break;
+    }
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+
+    if (err < 0)
+        Error_set_str(err, items[i].entry.path);
+
+cleanup:
+    for (i = 0; i < parsed; i++)
+        free(items[i].entry.path);
+    free(items);
+    Py_DECREF(py_seq);
+
+    if (PyErr_Occurred())
+        return NULL;
+
+    Py_RETURN_NONE;
+}
+
+
+/*
+ * add_all, update_all and remove_all: the matched paths are collected
+ * without the GIL and handed to the Python callback in batches.
+ */
+typedef struct {
+    PyObject *callback;
+    char **paths;
+    size_t n;
+    size_t size;
+} index_matched_payload;
+
+static int
+index_pathspec_from_python(git_strarray *pathspec, PyObject *py_pathspec)
+{
+    PyObject *py_list;
     int err;
+
+    if (py_pathspec == NULL || py_pathspec == Py_None) {
+        pathspec->strings = NULL;
+        pathspec->count = 0;
+        return 0;
+    }
+
+    if (PyList_Check(py_pathspec))
+        return get_strarraygit_from_pylist(pathspec, py_pathspec);
+
+    if (PyBytes_Check(py_pathspec) || PyUnicode_Check(py_pathspec))
+        py_list = Py_BuildValue("[O]", py_pathspec);
+    else
+        py_list = PySequence_List(py_pathspec);
+    if (py_list == NULL)
+        return -1;
+
+    err = get_strarraygit_from_pylist(pathspec, py_list);
+    Py_DECREF(py_list);
+    return err;
+}
+
+/* Must be called with the GIL held */
+static int
+index_matched_flush(index_matched_payload *payload)
+{
+    PyObject *py_paths, *py_path, *ret;
+    size_t i;
+    int err = -1;
+
+    py_paths = PyList_New(payload->n);
+    if (py_paths == NULL)
+        goto out;
+
+    for (i = 0; i < payload->n; i++) {
+        py_path = to_path(payload->paths[i]);
+        if (py_path == NULL)
+            goto out;
+        PyList_SET_ITEM(py_paths, i, py_path);
+    }
+
+    ret = PyObject_CallFunctionObjArgs(payload->callback, py_paths, NULL);
+    if (ret == NULL)
+        goto out;
+
+    Py_DECREF(ret);
+    err = 0;
+
+out:
+    Py_XDECREF(py_paths);
+    for (i = 0; i < payload->n; i++)
+        free(payload->paths[i]);
+    payload->n = 0;
+    return err;
+}
+
+static int
+index_matched_cb(const char *path, const char *matched_pathspec, void *data)
+{
+    index_matched_payload *payload = data;
+    PyGILState_STATE gil;
+    int err;
+
+    payload->paths[payload->n] = strdup(path);
+    if (payload->paths[payload->n] == NULL) {
+        gil = PyGILState_Ensure();
+        PyErr_NoMemory();
+        PyGILState_Release(gil);
+        return GIT_EUSER;
+    }
+
+    if (++payload->n < payload->size)
+        return 0;
+
+    gil = PyGILState_Ensure();
+    err = index_matched_flush(payload);
+    PyGILState_Release(gil);
+
+    return err < 0 ? GIT_EUSER : 0;
+}
+
+#define INDEX_ALL_ADD    0
+#define INDEX_ALL_UPDATE 1
+#define INDEX_ALL_REMOVE 2
+
+static PyObject *
+index_all(Index *self, int action, PyObject *py_pathspec, unsigned int flags,
+          PyObject *py_callback, Py_ssize_t batch_size)
+{
+    index_matched_payload payload = {NULL, NULL, 0, 0};
+    git_index_matched_path_cb callback = NULL;
     git_strarray pathspec;
+    size_t i;
+    int err;
+
+    CHECK_BUSY(self, NULL);
+
+    if (py_callback == Py_None)
+        py_callback = NULL;
+
+    if (py_callback != NULL) {
+        if (!PyCallable_Check(py_callback)) {
+            PyErr_SetString(PyExc_TypeError, "callback is not callable");
+            return NULL;
+        }
+        if (batch_size <= 0) {
+            PyErr_SetString(PyExc_ValueError, "batch_size must be positive");
+            return NULL;
+        }
 
-    if (get_strarraygit_from_pylist(&pathspec, pylist) < 0)
+        payload.paths = malloc(batch_size * sizeof(char *));
+        if (payload.paths == NULL)
+            return PyErr_NoMemory();
+        payload.callback = py_callback;
+        payload.size = batch_size;
+        callback = index_matched_cb;
+    }
+
+    if (index_pathspec_from_python(&pathspec, py_pathspec) < 0) {
+        free(payload.paths);
         return NULL;
+    }
 
-    err = git_index_add_all(self->index, &pathspec, 0, NULL, NULL);
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    switch (action) {
+        case INDEX_ALL_ADD:
+            err = git_index_add_all(self->index, &pathspec, flags, callback,
+                                    &payload);
+            break;
+        case INDEX_ALL_UPDATE:
+            err = git_index_update_all(self->index, &pathspec, callback,
+                                       &payload);
+            break;
+        default:
+            err = git_index_remove_all(self->index, &pathspec, callback,
+                                       &payload);
+            break;
+    }
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
     git_strarray_free(&pathspec);
 
     if (err < 0) {
-        Error_set(err);
-        return NULL;
+        for (i = 0; i < payload.n; i++)
+            free(payload.paths[i]);
+        free(payload.paths);
+        if (err == GIT_EUSER && PyErr_Occurred())
+            return NULL;
+        return Error_set(err);
     }
 
+    /* The last, partial, batch */
+    if (payload.n > 0)
+        err = index_matched_flush(&payload);
+    free(payload.paths);
+    if (err < 0)
+        return NULL;
+
     Py_RETURN_NONE;
 }
 
+
+PyDoc_STRVAR(Index_add_all__doc__,
+  "add_all(pathspecs=None, flags=GIT_INDEX_ADD_DEFAULT, callback=None,\n"
+  "        batch_size=256)\n"
+  "\n"
+  "Add or update index entries matching files in the working directory.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "pathspecs\n"
+  "    A pattern or a list of patterns (file names or globs) to match. If\n"
+  "    not given all files are matched.\n"
+  "\n"
+  "flags\n"
+  "    A combination of GIT_INDEX_ADD_* flags: GIT_INDEX_ADD_FORCE adds\n"
+  "    ignored files too, GIT_INDEX_ADD_DISABLE_PATHSPEC_MATCH matches the\n"
+  "    pathspecs as plain paths, GIT_INDEX_ADD_CHECK_PATHSPEC raises an\n"
+  "    error when an exact path is ignored.\n"
+  "\n"
+  "callback\n"
+  "    Called with lists of up to batch_size matched paths, as they are\n"
+  "    processed. If it raises an exception the operation stops.\n"
+  "\n"
+  "The GIL is released while the working directory is scanned, except to\n"
+  "call the callback.");
+
+PyObject *
+Index_add_all(Index *self, PyObject *args, PyObject *kwds)
+{
+    char *keywords[] = {"pathspecs", "flags", "callback", "batch_size", NULL};
+    PyObject *py_pathspec = NULL, *py_callback = NULL;
+    unsigned int flags = GIT_INDEX_ADD_DEFAULT;
+    Py_ssize_t batch_size = 256;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OIOn", keywords,
+                                     &py_pathspec, &flags, &py_callback,
+                                     &batch_size))
+        return NULL;
+
+    return index_all(self, INDEX_ALL_ADD, py_pathspec, flags, py_callback,
+                     batch_size);
+}
+
+
+PyDoc_STRVAR(Index_update_all__doc__,
+  "update_all(pathspecs=None, callback=None, batch_size=256)\n"
+  "\n"
+  "Update the index entries matching the pathspecs to the files in the\n"
+  "working directory, removing the entries whose file has been deleted. No\n"
+  "new files are added. The arguments are the same as for add_all.");
+
+PyObject *
+Index_update_all(Index *self, PyObject *args, PyObject *kwds)
+{
+    char *keywords[] = {"pathspecs", "callback", "batch_size", NULL};
+    PyObject *py_pathspec = NULL, *py_callback = NULL;
+    Py_ssize_t batch_size = 256;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OOn", keywords,
+                                     &py_pathspec, &py_callback, &batch_size))
+        return NULL;
+
+    return index_all(self, INDEX_ALL_UPDATE, py_pathspec, 0, py_callback,
+                     batch_size);
+}
+
+
+PyDoc_STRVAR(Index_remove_all__doc__,
+  "remove_all(pathspecs, callback=None, batch_size=256)\n"
+  "\n"
+  "Remove the index entries matching the pathspecs. The arguments are the\n"
+  "same as for add_all.");
+
+PyObject *
+Index_remove_all(Index *self, PyObject *args, PyObject *kwds)
+{
+    char *keywords[] = {"pathspecs", "callback", "batch_size", NULL};
+    PyObject *py_pathspec, *py_callback = NULL;
+    Py_ssize_t batch_size = 256;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|On", keywords,
+                                     &py_pathspec, &py_callback, &batch_size))
+        return NULL;
+
+    return index_all(self, INDEX_ALL_REMOVE, py_pathspec, 0, py_callback,
+                     batch_size);
+}
+
 PyDoc_STRVAR(Index_clear__doc__,
   "clear()\n"
   "\n"
@@ -146,52 +537,71 @@ PyDoc_STRVAR(Index_clear__doc__,
 PyObject *
 Index_clear(Index *self)
 {
+    CHECK_BUSY(self, NULL);
+
     git_index_clear(self->index);
     Py_RETURN_NONE;
 }
 
 
 PyDoc_STRVAR(Index_diff_to_workdir__doc__,
-  "diff_to_workdir([flag, context_lines, interhunk_lines]) -> Diff\n"
+  "diff_to_workdir([flags, context_lines, interhunk_lines, paths, max_size,\n"
+  "                 ignore_submodules, old_prefix, new_prefix,\n"
+  "                 find_similar]) -> Diff\n"
   "\n"
   "Return a :py:class:`~pygit2.Diff` object with the differences between the\n"
   "index and the working copy.\n"
   "\n"
   "Arguments:\n"
   "\n"
-  "flag: a GIT_DIFF_* constant.\n"
+  "flags: a GIT_DIFF_* constant.\n"
   "\n"
   "context_lines: the number of unchanged lines that define the boundary\n"
   "   of a hunk (and to display before and after)\n"
   "\n"
   "interhunk_lines: the maximum number of unchanged lines between hunk\n"
-  "   boundaries before the hunks will be merged into a one.\n");
+  "   boundaries before the hunks will be merged into a one.\n"
+  "\n"
+  "The other arguments are those of :py:meth:`Tree.diff_to_tree`.\n");
 
 PyObject *
-Index_diff_to_workdir(Index *self, PyObject *args)
+Index_diff_to_workdir(Index *self, PyObject *args, PyObject *kwds)
 {
-    git_diff_options opts = GIT_DIFF_OPTIONS_INIT;
+    diff_args d = DIFF_ARGS_INIT;
     git_diff *diff;
     int err;
+    char *keywords[] = {"flags", "context_lines", "interhunk_lines",
+                        DIFF_ARGS_KEYWORDS, NULL};
+
+    CHECK_BUSY(self, NULL);
 
-    if (!PyArg_ParseTuple(args, "|IHH", &opts.flags, &opts.context_lines,
-                                        &opts.interhunk_lines))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|IHH" DIFF_ARGS_FORMAT,
+                                     keywords, &d.opts.flags,
+                                     &d.opts.context_lines,
+                                     &d.opts.interhunk_lines,
+                                     DIFF_ARGS_VALUES(d)))
         return NULL;
 
+    if (diff_args_prepare(&d) < 0)
+        return NULL;
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_diff_index_to_workdir(
             &diff,
             self->repo->repo,
             self->index,
-            &opts);
-
-    if (err < 0)
-        return Error_set(err);
+            &d.opts);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
 
-    return wrap_diff(diff, self->repo);
+    return diff_args_finish(&d, diff, err, self->repo);
 }
 
 PyDoc_STRVAR(Index_diff_to_tree__doc__,
-  "diff_to_tree(tree [, flag, context_lines, interhunk_lines]) -> Diff\n"
+  "diff_to_tree(tree [, flags, context_lines, interhunk_lines, paths,\n"
+  "             max_size, ignore_submodules, old_prefix, new_prefix,\n"
+  "             find_similar]) -> Diff\n"
   "\n"
   "Return a :py:class:`~pygit2.Diff` object with the differences between the\n"
   "index and the given tree.\n"
@@ -200,35 +610,49 @@ PyDoc_STRVAR(Index_diff_to_tree__doc__,
   "\n"
   "tree: the tree to diff.\n"
   "\n"
-  "flag: a GIT_DIFF_* constant.\n"
+  "flags: a GIT_DIFF_* constant.\n"
   "\n"
   "context_lines: the number of unchanged lines that define the boundary\n"
   "   of a hunk (and to display before and after)\n"
   "\n"
   "interhunk_lines: the maximum number of unchanged lines between hunk\n"
-  "   boundaries before the hunks will be merged into a one.\n");
+  "   boundaries before the hunks will be merged into a one.\n"
+  "\n"
+  "The other arguments are those of :py:meth:`Tree.diff_to_tree`.\n");
 
 PyObject *
-Index_diff_to_tree(Index *self, PyObject *args)
+Index_diff_to_tree(Index *self, PyObject *args, PyObject *kwds)
 {
     Repository *py_repo;
-    git_diff_options opts = GIT_DIFF_OPTIONS_INIT;
+    diff_args d = DIFF_ARGS_INIT;
     git_diff *diff;
     int err;
+    char *keywords[] = {"tree", "flags", "context_lines", "interhunk_lines",
+                        DIFF_ARGS_KEYWORDS, NULL};
 
     Tree *py_tree = NULL;
 
-    if (!PyArg_ParseTuple(args, "O!|IHH", &TreeType, &py_tree, &opts.flags,
-                          &opts.context_lines, &opts.interhunk_lines))
+    CHECK_BUSY(self, NULL);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!|IHH" DIFF_ARGS_FORMAT,
+                                     keywords, &TreeType, &py_tree,
+                                     &d.opts.flags, &d.opts.context_lines,
+                                     &d.opts.interhunk_lines,
+                                     DIFF_ARGS_VALUES(d)))
+        return NULL;
+
+    if (diff_args_prepare(&d) < 0)
         return NULL;
 
     py_repo = py_tree->repo;
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_diff_tree_to_index(&diff, py_repo->repo, py_tree->tree,
-                                 self->index, &opts);
-    if (err < 0)
-        return Error_set(err);
+                                 self->index, &d.opts);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
 
-    return wrap_diff(diff, py_repo);
+    return diff_args_finish(&d, diff, err, py_repo);
 }
 
 
@@ -245,6 +669,8 @@ Index__find(Index *self, PyObject *py_path)
     size_t idx;
     int err;
 
+    CHECK_BUSY(self, NULL);
+
     path = PyBytes_AsString(py_path);
     if (!path)
         return NULL;
@@ -272,10 +698,16 @@ Index_read(Index *self, PyObject *args)
 {
     int err, force = 1;
 
+    CHECK_BUSY(self, NULL);
+
     if (!PyArg_ParseTuple(args, "|i", &force))
         return NULL;
 
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_index_read(self->index, force);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
     if (err < GIT_OK)
         return Error_set(err);
 
@@ -294,7 +726,13 @@ Index_write(Index *self)
 {
     int err;
 
+    CHECK_BUSY(self, NULL);
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_index_write(self->index);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
     if (err < GIT_OK)
         return Error_set(err);
 
@@ -307,6 +745,8 @@ Index_contains(Index *self, PyObject *value)
     char *path;
     int err;
 
+    CHECK_BUSY(self, -1);
+
     path = py_path_to_c_str(value);
     if (!path)
         return -1;
@@ -329,6 +769,8 @@ Index_iter(Index *self)
 {
     IndexIter *iter;
 
+    CHECK_BUSY(self, NULL);
+
     iter = PyObject_New(IndexIter, &IndexIterType);
     if (iter) {
         Py_INCREF(self);
@@ -341,6 +783,8 @@ Index_iter(Index *self)
 Py_ssize_t
 Index_len(Index *self)
 {
+    CHECK_BUSY(self, -1);
+
     return (Py_ssize_t)git_index_entrycount(self->index);
 }
 
@@ -370,6 +814,8 @@ Index_getitem(Index *self, PyObject *value)
     char *path;
     const git_index_entry *index_entry;
 
+    CHECK_BUSY(self, NULL);
+
     /* Case 1: integer */
     if (PyLong_Check(value)) {
         idx = PyLong_AsLong(value);
@@ -398,6 +844,95 @@ Index_getitem(Index *self, PyObject *value)
 }
 
 
+PyDoc_STRVAR(Index_export__doc__,
+  "export() -> dict\n"
+  "\n"
+  "Return the whole index as columns, without creating an IndexEntry per\n"
+  "entry. The dictionary has these keys:\n"
+  "\n"
+  "paths: list of the paths.\n"
+  "\n"
+  "oids: bytes, the 20 bytes raw oids one after the other.\n"
+  "\n"
+  "mode, size, mtime, flags: array('I') of the file modes, file sizes,\n"
+  "   modification times (seconds) and entry flags.\n"
+  "\n"
+  "Item i of every column belongs to entry i.");
+
+PyObject *
+Index_export(Index *self)
+{
+    const git_index_entry *entry;
+    PyObject *py_result = NULL, *py_paths = NULL, *py_oids = NULL;
+    PyObject *py_column, *py_path;
+    unsigned int *columns = NULL, *mode, *size, *mtime, *flags;
+    char *oids;
+    const char *names[] = {"mode", "size", "mtime", "flags"};
+    size_t i, n;
+
+    CHECK_BUSY(self, NULL);
+
+    n = git_index_entrycount(self->index);
+
+    py_paths = PyList_New(n);
+    py_oids = PyBytes_FromStringAndSize(NULL, n * GIT_OID_RAWSZ);
+    columns = malloc((4 * n + 1) * sizeof(unsigned int));
+    if (py_paths == NULL || py_oids == NULL)
+        goto error;
+    if (columns == NULL) {
+        PyErr_NoMemory();
+        goto error;
+    }
+
+    oids = PyBytes_AS_STRING(py_oids);
+    mode = columns;
+    size = mode + n;
+    mtime = size + n;
+    flags = mtime + n;
+    for (i = 0; i < n; i++) {
+        entry = git_index_get_byindex(self->index, i);
+
+        py_path = to_path(entry->path);
+        if (py_path == NULL)
+            goto error;
+        PyList_SET_ITEM(py_paths, i, py_path);
+
+        memcpy(oids + i * GIT_OID_RAWSZ, entry->oid.id, GIT_OID_RAWSZ);
+        mode[i] = entry->mode;
+        size[i] = (unsigned int)entry->file_size;
+        mtime[i] = (unsigned int)entry->mtime.seconds;
+        flags[i] = entry->flags;
+    }
+
+    py_result = Py_BuildValue("{s:O,s:O}", "paths", py_paths, "oids", py_oids);
+    if (py_result == NULL)
+        goto error;
+
+    for (i = 0; i < 4; i++) {
+        py_column = get_pyarray_from_buffer("I", columns + i * n,
+                                            n * sizeof(unsigned int));
+        if (py_column == NULL)
+            goto error;
+
+        if (PyDict_SetItemString(py_result, names[i], py_column) < 0) {
+            Py_DECREF(py_column);
+            goto error;
+        }
+        Py_DECREF(py_column);
+    }
+
+    goto cleanup;
+
+error:
+    Py_CLEAR(py_result);
+cleanup:
+    Py_XDECREF(py_paths);
+    Py_XDECREF(py_oids);
+    free(columns);
+    return py_result;
+}
+
+
 PyDoc_STRVAR(Index_remove__doc__,
   "remove(path)\n"
   "\n"
@@ -409,6 +944,8 @@ Index_remove(Index *self, PyObject *args)
     int err;
     const char *path;
 
+    CHECK_BUSY(self, NULL);
+
     if (!PyArg_ParseTuple(args, "s", &path))
         return NULL;
 
@@ -435,6 +972,8 @@ Index_read_tree(Index *self, PyObject *value)
     int err;
     size_t len;
 
+    CHECK_BUSY(self, NULL);
+
     len = py_oid_to_git_oid(value, &oid);
     if (len == 0)
         return NULL;
@@ -443,7 +982,11 @@ Index_read_tree(Index *self, PyObject *value)
     if (err < 0)
         return Error_set(err);
 
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_index_read_tree(self->index, tree);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
     git_tree_free(tree);
     if (err < 0)
         return Error_set(err);
@@ -465,13 +1008,19 @@ Index_write_tree(Index *self, PyObject *args)
     Repository *repo = NULL;
     int err;
 
+    CHECK_BUSY(self, NULL);
+
     if (!PyArg_ParseTuple(args, "|O!", &RepositoryType, &repo))
         return NULL;
 
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     if (repo)
         err = git_index_write_tree_to(&oid, self->index, repo->repo);
     else
         err = git_index_write_tree(&oid, self->index);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
 
     if (err < 0)
         return Error_set(err);
@@ -481,11 +1030,15 @@ Index_write_tree(Index *self, PyObject *args)
 
 PyMethodDef Index_methods[] = {
     METHOD(Index, add, METH_VARARGS),
-    METHOD(Index, add_all, METH_O),
+    METHOD(Index, add_all, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Index, add_entries, METH_O),
     METHOD(Index, remove, METH_VARARGS),
+    METHOD(Index, remove_all, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Index, update_all, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Index, export, METH_NOARGS),
     METHOD(Index, clear, METH_NOARGS),
-    METHOD(Index, diff_to_workdir, METH_VARARGS),
-    METHOD(Index, diff_to_tree, METH_VARARGS),
+    METHOD(Index, diff_to_workdir, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Index, diff_to_tree, METH_VARARGS | METH_KEYWORDS),
     METHOD(Index, _find, METH_O),
     METHOD(Index, read, METH_VARARGS),
     METHOD(Index, write, METH_NOARGS),
@@ -511,7 +1064,12 @@ PyMappingMethods Index_as_mapping = {
     NULL,                            /* mp_ass_subscript */
 };
 
-PyDoc_STRVAR(Index__doc__, "Index file.");
+PyDoc_STRVAR(Index__doc__,
+  "Index file.\n"
+  "\n"
+  "Index objects must not be shared between threads: while a method runs\n"
+  "without the GIL the object is busy, and using it meanwhile (from another\n"
+  "thread or a callback) raises RuntimeError.");
 
 PyTypeObject IndexType = {
     PyVarObject_HEAD_INIT(NULL, 0)
@@ -569,6 +1127,8 @@ IndexIter_iternext(IndexIter *self)
 {
     const git_index_entry *index_entry;
 
+    CHECK_BUSY(self->owner, NULL);
+
     index_entry = git_index_get_byindex(self->owner->index, self->i);
     if (!index_entry)
         return NULL;
@@ -0,0 +1,220 @@
+/*
+ * Copyright 2010-2014 The pygit2 contributors
+ *
+ * This file is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License, version 2,
+ * as published by the Free Software Foundation.
+ *
+ * In addition to the permissions in the GNU General Public License,
+ * the authors give you unlimited permission to link the compiled
+ * version of this file into combinations with other programs,
+ * and to distribute those combinations without any restriction
+ * coming from the use of this file.  (The General Public License
+ * restrictions do apply in other respects; for example, they cover
+ * modification of the file, and distribution when not linked into
+ * a combined executable.)
+ *
+ * This file is distributed in the hope that it will be useful, but
+ * WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; see the file COPYING.  If not, write to
+ * the Free Software Foundation, 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include "error.h"
+#include "types.h"
+#include "utils.h"
+#include "oid.h"
+#include "odb.h"
+
+extern PyTypeObject OdbIterType;
+
+/* Number of oids handed over at a time when not batching */
+#define ODB_ITER_CHUNK 1024
+
+/*
+ * git_odb_foreach cannot be paused, so it runs in a native thread and
+ * hands the oids over in chunks, see thread_handoff in utils.c.
+ */
+
+static int
+odb_iter_cb(const git_oid *oid, void *payload)
+{
+    OdbIter *self = payload;
+    size_t size;
+    git_otype type;
+    int err;
+
+    if (self->type != GIT_OBJ_ANY) {
+        err = git_odb_read_header(&size, &type, self->odb, oid);
+        if (err < 0) {
+            self->handoff.err = err;
+            return err;
+        }
+        if (type != self->type)
+            return 0;
+    }
+
+    git_oid_cpy(&self->oids[self->len++], oid);
+    if (self->len < self->size)
+        return 0;
+
+    return thread_handoff_put(&self->handoff) ? GIT_EUSER : 0;
+}
+
+static void
+odb_iter_run(void *payload)
+{
+    OdbIter *self = payload;
+    int err;
+
+    err = git_odb_foreach(self->odb, odb_iter_cb, self);
+    if (self->handoff.err < 0 || self->handoff.stop)
+        err = self->handoff.err;
+
+    thread_handoff_done(&self->handoff, err);
+}
+
+static int
+odb_iter_fill(OdbIter *self)
+{
+    self->len = 0;
+    self->pos = 0;
+    if (self->handoff.done)
+        return 0;
+
+    return thread_handoff_get(&self->handoff, odb_iter_run, self);
+}
+
+PyObject *
+OdbIter_iternext(OdbIter *self)
+{
+    PyObject *py_chunk;
+
+    if (self->pos == self->len) {
+        if (odb_iter_fill(self) < 0)
+            return NULL;
+
+        if (self->len == 0)
+            return thread_handoff_error(&self->handoff);
+    }
+
+    if (self->batch == 0)
+        return git_oid_to_python(&self->oids[self->pos++]);
+
+    py_chunk = PyBytes_FromStringAndSize((const char*)&self->oids[self->pos],
+                                         (self->len - self->pos) * GIT_OID_RAWSZ);
+    self->pos = self->len;
+    return py_chunk;
+}
+
+
+PyDoc_STRVAR(OdbIter_close__doc__,
+  "close()\n"
+  "\n"
+  "Stop the walk over the object database. The ids not yet yielded are\n"
+  "dropped, and the iterator is exhausted from now on.");
+
+PyObject *
+OdbIter_close(OdbIter *self)
+{
+    thread_handoff_stop(&self->handoff);
+    self->handoff.done = 1;
+    self->handoff.err = 0;
+    self->len = 0;
+    self->pos = 0;
+
+    Py_RETURN_NONE;
+}
+
+void
+OdbIter_dealloc(OdbIter *self)
+{
+    thread_handoff_stop(&self->handoff);
+    thread_handoff_free(&self->handoff);
+    free(self->oids);
+    git_odb_free(self->odb);
+    Py_CLEAR(self->repo);
+    PyObject_Del(self);
+}
+
+
+PyMethodDef OdbIter_methods[] = {
+    METHOD(OdbIter, close, METH_NOARGS),
+    {NULL}
+};
+
+
+PyDoc_STRVAR(OdbIter__doc__, "Object database iterator object.");
+
+PyTypeObject OdbIterType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.OdbIter",                         /* tp_name           */
+    sizeof(OdbIter),                           /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)OdbIter_dealloc,               /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    OdbIter__doc__,                            /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    PyObject_SelfIter,                         /* tp_iter           */
+    (iternextfunc) OdbIter_iternext,           /* tp_iternext       */
+    OdbIter_methods,                           /* tp_methods        */
+};
+
+
+PyObject *
+wrap_odb_iter(Repository *repo, git_otype type, size_t batch)
+{
+    OdbIter *iter;
+    git_odb *odb;
+    int err;
+
+    err = git_repository_odb(&odb, repo->repo);
+    if (err < 0)
+        return Error_set(err);
+
+    iter = PyObject_New(OdbIter, &OdbIterType);
+    if (iter == NULL) {
+        git_odb_free(odb);
+        return NULL;
+    }
+
+    Py_INCREF(repo);
+    iter->repo = repo;
+    iter->odb = odb;
+    iter->type = type;
+    iter->batch = batch;
+    iter->size = batch ? batch : ODB_ITER_CHUNK;
+    iter->len = 0;
+    iter->pos = 0;
+    iter->oids = malloc(iter->size * sizeof(git_oid));
+    if (thread_handoff_init(&iter->handoff) < 0 || iter->oids == NULL) {
+        Py_DECREF(iter);
+        return PyErr_NoMemory();
+    }
+
+    return (PyObject*) iter;
+}
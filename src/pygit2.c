@@ -27,6 +27,7 @@
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <structseq.h>
 
 /* Pypy does not provide this header */
 #ifndef PYPY_VERSION
@@ -54,12 +55,20 @@ extern PyTypeObject ObjectType;
 extern PyTypeObject CommitType;
 extern PyTypeObject DiffType;
 extern PyTypeObject DiffIterType;
+extern PyTypeObject DiffDeltasType;
+extern PyTypeObject DiffPatchesType;
+extern PyTypeObject DiffPrintIterType;
+extern PyTypeObject DiffLineType;
+extern PyStructSequence_Desc DiffLine_desc;
 extern PyTypeObject PatchType;
 extern PyTypeObject HunkType;
+extern PyTypeObject DiffStatsType;
+extern PyTypeObject SimilarityCacheType;
 extern PyTypeObject TreeType;
 extern PyTypeObject TreeBuilderType;
 extern PyTypeObject TreeEntryType;
 extern PyTypeObject TreeIterType;
+extern PyTypeObject TreeWalkIterType;
 extern PyTypeObject BlobType;
 extern PyTypeObject TagType;
 extern PyTypeObject IndexType;
@@ -78,6 +87,7 @@ extern PyTypeObject RefspecType;
 extern PyTypeObject TransferProgressType;
 extern PyTypeObject NoteType;
 extern PyTypeObject NoteIterType;
+extern PyTypeObject OdbIterType;
 extern PyTypeObject BlameType;
 extern PyTypeObject BlameIterType;
 extern PyTypeObject BlameHunkType;
@@ -108,7 +118,9 @@ init_repository(PyObject *self, PyObject *args) {
     if (!PyArg_ParseTuple(args, "sI", &path, &bare))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_repository_init(&repo, path, bare);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set_str(err, path);
 
@@ -170,7 +182,9 @@ clone_repository(PyObject *self, PyObject *args) {
 	    opts.remote_callbacks.payload = credentials;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_clone(&repo, url, path, &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -196,8 +210,10 @@ discover_repository(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s|Is", &path, &across_fs, &ceiling_dirs))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_repository_discover(repo_path, sizeof(repo_path),
             path, across_fs, ceiling_dirs);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set_str(err, path);
 
@@ -219,7 +235,9 @@ hashfile(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s", &path))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_odb_hashfile(&oid, path, GIT_OBJ_BLOB);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -242,7 +260,9 @@ hash(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s#", &data, &size))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_odb_hash(&oid, data, size, GIT_OBJ_BLOB);
+    Py_END_ALLOW_THREADS
     if (err < 0) {
         return Error_set(err);
     }
@@ -288,6 +308,7 @@ moduleinit(PyObject* m)
 
     /* Repository */
     INIT_TYPE(RepositoryType, NULL, PyType_GenericNew)
+    INIT_TYPE(OdbIterType, NULL, NULL)
     ADD_TYPE(m, Repository)
 
     /* Oid */
@@ -307,6 +328,7 @@ moduleinit(PyObject* m)
     INIT_TYPE(TreeType, &ObjectType, NULL)
     INIT_TYPE(TreeEntryType, NULL, NULL)
     INIT_TYPE(TreeIterType, NULL, NULL)
+    INIT_TYPE(TreeWalkIterType, NULL, NULL)
     INIT_TYPE(TreeBuilderType, NULL, NULL)
     INIT_TYPE(BlobType, &ObjectType, NULL)
     INIT_TYPE(TagType, &ObjectType, NULL)
@@ -330,6 +352,11 @@ moduleinit(PyObject* m)
     ADD_CONSTANT_INT(m, GIT_FILEMODE_BLOB_EXECUTABLE)
     ADD_CONSTANT_INT(m, GIT_FILEMODE_LINK)
     ADD_CONSTANT_INT(m, GIT_FILEMODE_COMMIT)
+    /* Flags for Index.add_all */
+    ADD_CONSTANT_INT(m, GIT_INDEX_ADD_DEFAULT)
+    ADD_CONSTANT_INT(m, GIT_INDEX_ADD_FORCE)
+    ADD_CONSTANT_INT(m, GIT_INDEX_ADD_DISABLE_PATHSPEC_MATCH)
+    ADD_CONSTANT_INT(m, GIT_INDEX_ADD_CHECK_PATHSPEC)
 
     /*
      * Log
@@ -407,11 +434,20 @@ moduleinit(PyObject* m)
      */
     INIT_TYPE(DiffType, NULL, NULL)
     INIT_TYPE(DiffIterType, NULL, NULL)
+    INIT_TYPE(DiffDeltasType, NULL, NULL)
+    INIT_TYPE(DiffPatchesType, NULL, NULL)
+    INIT_TYPE(DiffPrintIterType, NULL, NULL)
     INIT_TYPE(PatchType, NULL, NULL)
     INIT_TYPE(HunkType, NULL, NULL)
+    INIT_TYPE(DiffStatsType, NULL, NULL)
+    INIT_TYPE(SimilarityCacheType, NULL, PyType_GenericNew)
     ADD_TYPE(m, Diff)
     ADD_TYPE(m, Patch)
     ADD_TYPE(m, Hunk)
+    ADD_TYPE(m, DiffStats)
+    ADD_TYPE(m, SimilarityCache)
+    PyStructSequence_InitType(&DiffLineType, &DiffLine_desc);
+    ADD_TYPE(m, DiffLine)
     ADD_CONSTANT_INT(m, GIT_DIFF_NORMAL)
     ADD_CONSTANT_INT(m, GIT_DIFF_REVERSE)
     ADD_CONSTANT_INT(m, GIT_DIFF_FORCE_TEXT)
@@ -444,6 +480,17 @@ moduleinit(PyObject* m)
     ADD_CONSTANT_INT(m, GIT_DIFF_FIND_COPIES_FROM_UNMODIFIED)
     /* --break-rewrites=/M */
     ADD_CONSTANT_INT(m, GIT_DIFF_FIND_AND_BREAK_REWRITES)
+    ADD_CONSTANT_INT(m, GIT_DIFF_FIND_FOR_UNTRACKED)
+    ADD_CONSTANT_INT(m, GIT_DIFF_FIND_ALL)
+    ADD_CONSTANT_INT(m, GIT_DIFF_FIND_IGNORE_WHITESPACE)
+    ADD_CONSTANT_INT(m, GIT_DIFF_FIND_DONT_IGNORE_WHITESPACE)
+    ADD_CONSTANT_INT(m, GIT_DIFF_FIND_EXACT_MATCH_ONLY)
+    /* Submodule handling in diffs */
+    ADD_CONSTANT_INT(m, GIT_SUBMODULE_IGNORE_DEFAULT)
+    ADD_CONSTANT_INT(m, GIT_SUBMODULE_IGNORE_NONE)
+    ADD_CONSTANT_INT(m, GIT_SUBMODULE_IGNORE_UNTRACKED)
+    ADD_CONSTANT_INT(m, GIT_SUBMODULE_IGNORE_DIRTY)
+    ADD_CONSTANT_INT(m, GIT_SUBMODULE_IGNORE_ALL)
 
     /* Config */
     ADD_CONSTANT_INT(m, GIT_CONFIG_LEVEL_LOCAL);
@@ -489,6 +536,12 @@ moduleinit(PyObject* m)
     /* Global initialization of libgit2 */
     git_threads_init();
 
+    /* Long running libgit2 calls release the GIL, and the callbacks they
+     * invoke take it back with PyGILState_Ensure */
+#if PY_VERSION_HEX < 0x03070000
+    PyEval_InitThreads();
+#endif
+
     return m;
 }
 
@@ -130,18 +130,29 @@ PyTypeObject TransferProgressType = {
     0,                                         /* tp_new            */
 };
 
+/*
+ * The network callbacks below are invoked by libgit2 from within
+ * Remote.fetch and Remote.push, which run with the GIL released, so each
+ * of them must take the GIL back before touching any Python object.
+ */
 static int
 progress_cb(const char *str, int len, void *data)
 {
     Remote *remote = (Remote *) data;
     PyObject *arglist, *ret;
+    PyGILState_STATE gil;
+    int err = -1;
 
-    if (remote->progress == NULL)
-        return 0;
+    gil = PyGILState_Ensure();
+
+    if (remote->progress == NULL) {
+        err = 0;
+        goto out;
+    }
 
     if (!PyCallable_Check(remote->progress)) {
         PyErr_SetString(PyExc_TypeError, "progress callback is not callable");
-        return -1;
+        goto out;
     }
 
     arglist = Py_BuildValue("(s#)", str, len);
@@ -149,11 +160,14 @@ progress_cb(const char *str, int len, void *data)
     Py_DECREF(arglist);
 
     if (!ret)
-        return -1;
+        goto out;
 
     Py_DECREF(ret);
+    err = 0;
 
-    return 0;
+out:
+    PyGILState_Release(gil);
+    return err;
 }
 
 static int
@@ -169,27 +183,36 @@ transfer_progress_cb(const git_transfer_progress *stats, void *data)
 {
     Remote *remote = (Remote *) data;
     PyObject *py_stats, *ret;
+    PyGILState_STATE gil;
+    int err = -1;
 
-    if (remote->transfer_progress == NULL)
-        return 0;
+    gil = PyGILState_Ensure();
+
+    if (remote->transfer_progress == NULL) {
+        err = 0;
+        goto out;
+    }
 
     if (!PyCallable_Check(remote->transfer_progress)) {
         PyErr_SetString(PyExc_TypeError, "transfer progress callback is not callable");
-        return -1;
+        goto out;
     }
 
     py_stats = wrap_transfer_progress(stats);
     if (!py_stats)
-        return -1;
+        goto out;
 
     ret = PyObject_CallFunctionObjArgs(remote->transfer_progress, py_stats, NULL);
     Py_DECREF(py_stats);
     if (!ret)
-        return -1;
+        goto out;
 
     Py_DECREF(ret);
+    err = 0;
 
-    return 0;
+out:
+    PyGILState_Release(gil);
+    return err;
 }
 
 static int
@@ -198,13 +221,19 @@ update_tips_cb(const char *refname, const git_oid *a, const git_oid *b, void *da
     Remote *remote = (Remote *) data;
     PyObject *ret;
     PyObject *old, *new;
+    PyGILState_STATE gil;
+    int err = -1;
 
-    if (remote->update_tips == NULL)
-        return 0;
+    gil = PyGILState_Ensure();
+
+    if (remote->update_tips == NULL) {
+        err = 0;
+        goto out;
+    }
 
     if (!PyCallable_Check(remote->update_tips)) {
         PyErr_SetString(PyExc_TypeError, "update tips callback is not callable");
-        return -1;
+        goto out;
     }
 
     old = git_oid_to_python(a);
@@ -216,11 +245,14 @@ update_tips_cb(const char *refname, const git_oid *a, const git_oid *b, void *da
     Py_DECREF(new);
 
     if (!ret)
-        return -1;
+        goto out;
 
     Py_DECREF(ret);
+    err = 0;
 
-    return 0;
+out:
+    PyGILState_Release(gil);
+    return err;
 }
 
 static void
@@ -467,7 +499,9 @@ Remote_fetch(Remote *self, PyObject *args)
     int err;
 
     PyErr_Clear();
+    Py_BEGIN_ALLOW_THREADS
     err = git_remote_fetch(self->remote);
+    Py_END_ALLOW_THREADS
     /*
      * XXX: We should be checking for GIT_EUSER, but on v0.20, this does not
      * make it all the way to us for update_tips
@@ -539,7 +573,9 @@ Remote_push(Remote *self, PyObject *args)
     if (err < 0)
         goto error;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_push_finish(push);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         goto error;
 
@@ -558,7 +594,9 @@ Remote_push(Remote *self, PyObject *args)
         return NULL;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_push_update_tips(push);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         goto error;
 
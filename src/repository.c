@@ -40,6 +40,9 @@
 #include "blame.h"
 #include "mergeresult.h"
 #include "signature.h"
+#include "odb.h"
+#include "walker.h"
+#include "diff.h"
 #include <git2/odb_backend.h>
 
 extern PyObject *GitError;
@@ -50,6 +53,7 @@ extern PyTypeObject SignatureType;
 extern PyTypeObject ObjectType;
 extern PyTypeObject OidType;
 extern PyTypeObject CommitType;
+extern PyTypeObject BlobType;
 extern PyTypeObject TreeType;
 extern PyTypeObject TreeBuilderType;
 extern PyTypeObject ConfigType;
@@ -86,7 +90,9 @@ Repository_init(Repository *self, PyObject *args, PyObject *kwds)
     if (!PyArg_ParseTuple(args, "s", &path))
         return -1;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_repository_open(&self->repo, path);
+    Py_END_ALLOW_THREADS
     if (err < 0) {
         Error_set_str(err, path);
         return -1;
@@ -122,40 +128,59 @@ Repository_clear(Repository *self)
     return 0;
 }
 
-static int
-Repository_build_as_iter(const git_oid *oid, void *accum)
+PyObject *
+Repository_as_iter(Repository *self)
 {
-    int err;
-    PyObject *py_oid = git_oid_to_python(oid);
-
-    err = PyList_Append((PyObject*)accum, py_oid);
-    Py_DECREF(py_oid);
-    return err;
+    return wrap_odb_iter(self, GIT_OBJ_ANY, 0);
 }
 
+
+PyDoc_STRVAR(Repository_iter_oids__doc__,
+  "iter_oids(type=GIT_OBJ_ANY, batch_size=None) -> iterator\n"
+  "\n"
+  "Iterate over the ids of the objects in the object database. The ids are\n"
+  "streamed, they are not collected in memory first.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "type\n"
+  "    Only yield the objects of this type (one of the GIT_OBJ_* constants).\n"
+  "\n"
+  "batch_size\n"
+  "    If given, yield bytes strings with up to batch_size raw ids (20 bytes\n"
+  "    each) instead of Oid objects.\n"
+  "\n"
+  "The iterator has a close() method, to stop the walk before the end.");
+
 PyObject *
-Repository_as_iter(Repository *self)
+Repository_iter_oids(Repository *self, PyObject *args, PyObject *kwds)
 {
-    git_odb *odb;
-    int err;
-    PyObject *accum = PyList_New(0);
-    PyObject *ret;
+    int type = GIT_OBJ_ANY;
+    PyObject *py_batch = Py_None;
+    Py_ssize_t batch = 0;
+    char *keywords[] = {"type", "batch_size", NULL};
 
-    err = git_repository_odb(&odb, self->repo);
-    if (err < 0)
-        return Error_set(err);
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|iO", keywords,
+                                     &type, &py_batch))
+        return NULL;
 
-    err = git_odb_foreach(odb, Repository_build_as_iter, (void*)accum);
-    git_odb_free(odb);
-    if (err == GIT_EUSER)
+    if (type != GIT_OBJ_ANY && int_to_loose_object_type(type) == GIT_OBJ_BAD) {
+        PyErr_SetString(PyExc_ValueError, "invalid object type");
         return NULL;
-    if (err < 0)
-        return Error_set(err);
+    }
 
-    ret = PyObject_GetIter(accum);
-    Py_DECREF(accum);
+    if (py_batch != Py_None) {
+        batch = PyNumber_AsSsize_t(py_batch, PyExc_OverflowError);
+        if (batch == -1 && PyErr_Occurred())
+            return NULL;
 
-    return ret;
+        if (batch < 1) {
+            PyErr_SetString(PyExc_ValueError, "batch_size must be positive");
+            return NULL;
+        }
+    }
+
+    return wrap_odb_iter(self, (git_otype)type, (size_t)batch);
 }
 
 
@@ -274,7 +299,9 @@ Repository_git_object_lookup_prefix(Repository *self, PyObject *key)
     if (len == 0)
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_object_lookup_prefix(&obj, self->repo, &oid, len, GIT_OBJ_ANY);
+    Py_END_ALLOW_THREADS
     if (err == 0)
         return wrap_object(obj, self);
 
@@ -333,7 +360,9 @@ Repository_revparse_single(Repository *self, PyObject *py_spec)
         return NULL;
 
     /* 2- Lookup */
+    Py_BEGIN_ALLOW_THREADS
     err = git_revparse_single(&c_obj, self->repo, c_spec);
+    Py_END_ALLOW_THREADS
 
     if (err < 0) {
         PyObject *err_obj = Error_set_str(err, c_spec);
@@ -358,7 +387,9 @@ Repository_read_raw(git_repository *repo, const git_oid *oid, size_t len)
         return NULL;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_odb_read_prefix(&obj, odb, oid, (unsigned int)len);
+    Py_END_ALLOW_THREADS
     git_odb_free(odb);
     if (err < 0) {
         Error_set_oid(err, oid, len);
@@ -405,6 +436,382 @@ Repository_read(Repository *self, PyObject *py_hex)
 }
 
 
+PyDoc_STRVAR(Repository_read_header__doc__,
+  "read_header(oid) -> type, size\n"
+  "\n"
+  "Read the type and size of an object, without reading its contents.");
+
+PyObject *
+Repository_read_header(Repository *self, PyObject *py_hex)
+{
+    git_oid oid;
+    git_odb *odb;
+    git_otype type;
+    size_t size;
+    int err;
+
+    err = py_oid_to_git_oid_expand(self->repo, py_hex, &oid);
+    if (err < 0)
+        return NULL;
+
+    err = git_repository_odb(&odb, self->repo);
+    if (err < 0)
+        return Error_set(err);
+
+    Py_BEGIN_ALLOW_THREADS
+    err = git_odb_read_header(&size, &type, odb, &oid);
+    Py_END_ALLOW_THREADS
+    git_odb_free(odb);
+    if (err < 0)
+        return Error_set_oid(err, &oid, GIT_OID_HEXSZ);
+
+    return Py_BuildValue("(in)", (int)type, (Py_ssize_t)size);
+}
+
+
+PyDoc_STRVAR(Repository_read_headers__doc__,
+  "read_headers(oids) -> [(type, size), ...]\n"
+  "\n"
+  "Read the type and size of many objects at once, without reading their\n"
+  "contents. The argument is either an iterable of oids, or a bytes string\n"
+  "of packed 20 bytes raw ids (like those returned by iter_oids with a\n"
+  "batch_size, or by a walker in 'raw' mode).");
+
+PyObject *
+Repository_read_headers(Repository *self, PyObject *py_oids)
+{
+    git_oid *oids = NULL;
+    git_otype *types = NULL;
+    size_t *sizes = NULL;
+    size_t i = 0, n;
+    git_odb *odb = NULL;
+    PyObject *py_seq = NULL, *py_result = NULL, *py_item;
+    char *raw;
+    Py_ssize_t raw_len;
+    int err = 0;
+
+    if (PyBytes_Check(py_oids)) {
+        if (PyBytes_AsStringAndSize(py_oids, &raw, &raw_len))
+            return NULL;
+        if (raw_len % GIT_OID_RAWSZ) {
+            PyErr_SetString(PyExc_ValueError,
+                            "length is not a multiple of 20 bytes");
+            return NULL;
+        }
+        n = raw_len / GIT_OID_RAWSZ;
+    } else {
+        py_seq = PySequence_Fast(py_oids, "expected an iterable of oids");
+        if (py_seq == NULL)
+            return NULL;
+        n = PySequence_Fast_GET_SIZE(py_seq);
+    }
+
+    if (n == 0) {
+        Py_XDECREF(py_seq);
+        return PyList_New(0);
+    }
+
+    oids = malloc(n * sizeof(git_oid));
+    types = malloc(n * sizeof(git_otype));
+    sizes = malloc(n * sizeof(size_t));
+    if (oids == NULL || types == NULL || sizes == NULL) {
+        PyErr_NoMemory();
+        goto cleanup;
+    }
+
+    for (i = 0; i < n; i++) {
+        if (py_seq == NULL) {
+            git_oid_fromraw(&oids[i],
+                            (const unsigned char*)raw + i * GIT_OID_RAWSZ);
+            continue;
+        }
+        err = py_oid_to_git_oid_expand(self->repo,
+                                       PySequence_Fast_GET_ITEM(py_seq, i),
+                                       &oids[i]);
+        if (err < 0)
+            goto cleanup;
+    }
+
+    err = git_repository_odb(&odb, self->repo);
+    if (err < 0) {
+        Error_set(err);
+        goto cleanup;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < n; i++) {
+        err = git_odb_read_header(&sizes[i], &types[i], odb, &oids[i]);
+        if (err < 0)
+            break;
+    }
+    Py_END_ALLOW_THREADS
+    if (err < 0) {
+        Error_set_oid(err, &oids[i], GIT_OID_HEXSZ);
+        goto cleanup;
+    }
+
+    py_result = PyList_New(n);
+    if (py_result == NULL)
+        goto cleanup;
+
+    for (i = 0; i < n; i++) {
+        py_item = Py_BuildValue("(in)", (int)types[i], (Py_ssize_t)sizes[i]);
+        if (py_item == NULL) {
+            Py_CLEAR(py_result);
+            goto cleanup;
+        }
+        PyList_SET_ITEM(py_result, i, py_item);
+    }
+
+cleanup:
+    git_odb_free(odb);
+    free(oids);
+    free(types);
+    free(sizes);
+    Py_XDECREF(py_seq);
+    return py_result;
+}
+
+
+/*
+ * Repository.diff_blobs: the blobs are looked up and diffed in a single
+ * loop without the GIL, only the results are turned into Python objects.
+ */
+typedef struct {
+    git_oid old_id;
+    git_oid new_id;
+    int has_old;
+    int has_new;
+    const char *path;
+    PyObject *py_path;
+    git_blob *old_blob;
+    git_blob *new_blob;
+    git_patch *patch;
+    size_t additions;
+    size_t deletions;
+} diff_blobs_item;
+
+static int
+diff_blobs_oid(Repository *repo, PyObject *py_obj, git_oid *oid, int *has)
+{
+    *has = 0;
+    if (py_obj == Py_None)
+        return 0;
+
+    if (PyObject_TypeCheck(py_obj, &BlobType)) {
+        git_oid_cpy(oid, git_object_id(((Object*)py_obj)->obj));
+    } else if (py_oid_to_git_oid_expand(repo->repo, py_obj, oid) < 0) {
+        return -1;
+    }
+
+    *has = 1;
+    return 0;
+}
+
+static int
+diff_blobs_line_cb(const git_diff_delta *delta, const git_diff_hunk *hunk,
+                   const git_diff_line *line, void *payload)
+{
+    diff_blobs_item *item = payload;
+
+    if (line->origin == GIT_DIFF_LINE_ADDITION)
+        item->additions++;
+    else if (line->origin == GIT_DIFF_LINE_DELETION)
+        item->deletions++;
+
+    return 0;
+}
+
+static int
+diff_blobs_run(git_repository *repo, diff_blobs_item *item,
+               const git_diff_options *opts, int patches)
+{
+    int err;
+
+    if (item->has_old) {
+        err = git_blob_lookup(&item->old_blob, repo, &item->old_id);
+        if (err < 0)
+            return err;
+    }
+
+    if (item->has_new) {
+        err = git_blob_lookup(&item->new_blob, repo, &item->new_id);
+        if (err < 0)
+            return err;
+    }
+
+    if (patches)
+        return git_patch_from_blobs(&item->patch,
+                                    item->old_blob, item->path,
+                                    item->new_blob, item->path, opts);
+
+    err = git_diff_blobs(item->old_blob, item->path,
+                         item->new_blob, item->path, opts,
+                         NULL, NULL, diff_blobs_line_cb, item);
+
+    /* Only the counts are kept */
+    git_blob_free(item->old_blob);
+    git_blob_free(item->new_blob);
+    item->old_blob = NULL;
+    item->new_blob = NULL;
+    return err;
+}
+
+static PyObject *
+diff_blobs_wrap_patch(Repository *repo, diff_blobs_item *item)
+{
+    PyObject *py_old, *py_new, *py_path, *py_owner, *py_patch;
+    git_patch *patch = item->patch;
+
+    /* The patch reads the blobs and the path in place, it keeps them
+     * alive */
+    py_old = item->old_blob ? wrap_object((git_object*)item->old_blob, repo)
+                            : (Py_INCREF(Py_None), Py_None);
+    item->old_blob = NULL;
+    py_new = item->new_blob ? wrap_object((git_object*)item->new_blob, repo)
+                            : (Py_INCREF(Py_None), Py_None);
+    item->new_blob = NULL;
+    item->patch = NULL;
+
+    if (py_old == NULL || py_new == NULL) {
+        Py_XDECREF(py_old);
+        Py_XDECREF(py_new);
+        git_patch_free(patch);
+        return NULL;
+    }
+
+    py_path = item->py_path ? item->py_path : Py_None;
+    Py_INCREF(py_path);
+    py_owner = Py_BuildValue("(NNN)", py_old, py_new, py_path);
+    if (py_owner == NULL) {
+        git_patch_free(patch);
+        return NULL;
+    }
+
+    py_patch = wrap_patch(patch, py_owner);
+    Py_DECREF(py_owner);
+    return py_patch;
+}
+
+
+PyDoc_STRVAR(Repository_diff_blobs__doc__,
+  "diff_blobs(pairs[, patches, flags, context_lines, interhunk_lines])\n"
+  "  -> list\n"
+  "\n"
+  "Diff many pairs of blobs at once, without holding the GIL.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "pairs: an iterable of (old, new, path) tuples, where old and new are\n"
+  "   blobs, oids or None, and path is the path both blobs are treated as\n"
+  "   (it selects the diff driver), or None.\n"
+  "\n"
+  "patches: when false (the default) the result is a list of\n"
+  "   (additions, deletions) tuples, and no text diff is kept; when true it\n"
+  "   is a list of :py:class:`~pygit2.Patch` objects, whose hunks and lines\n"
+  "   are built on demand.\n"
+  "\n"
+  "flags, context_lines, interhunk_lines: as for\n"
+  "   :py:meth:`Tree.diff_to_tree`.");
+
+PyObject *
+Repository_diff_blobs(Repository *self, PyObject *args, PyObject *kwds)
+{
+    git_diff_options opts = GIT_DIFF_OPTIONS_INIT;
+    diff_blobs_item *items = NULL, *item;
+    PyObject *py_pairs, *py_seq = NULL, *py_result = NULL, *py_item;
+    PyObject *py_old, *py_new, *py_path;
+    size_t i = 0, n = 0;
+    int patches = 0, err = 0;
+    char *keywords[] = {"pairs", "patches", "flags", "context_lines",
+                        "interhunk_lines", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|iIHH", keywords,
+                                     &py_pairs, &patches, &opts.flags,
+                                     &opts.context_lines,
+                                     &opts.interhunk_lines))
+        return NULL;
+
+    py_seq = PySequence_Fast(py_pairs, "expected an iterable of pairs");
+    if (py_seq == NULL)
+        return NULL;
+
+    n = PySequence_Fast_GET_SIZE(py_seq);
+    if (n == 0) {
+        Py_DECREF(py_seq);
+        return PyList_New(0);
+    }
+
+    items = calloc(n, sizeof(diff_blobs_item));
+    if (items == NULL) {
+        PyErr_NoMemory();
+        goto cleanup;
+    }
+
+    for (i = 0; i < n; i++) {
+        item = &items[i];
+        py_path = Py_None;
+        if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(py_seq, i),
+                              "OO|O", &py_old, &py_new, &py_path))
+            goto cleanup;
+
+        if (diff_blobs_oid(self, py_old, &item->old_id, &item->has_old) < 0 ||
+            diff_blobs_oid(self, py_new, &item->new_id, &item->has_new) < 0)
+            goto cleanup;
+
+        if (py_path != Py_None) {
+            item->path = py_str_borrow_c_str(&item->py_path, py_path,
+                                             Py_FileSystemDefaultEncoding);
+            if (item->path == NULL)
+                goto cleanup;
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < n; i++) {
+        err = diff_blobs_run(self->repo, &items[i], &opts, patches);
+        if (err < 0)
+            break;
+    }
+    Py_END_ALLOW_THREADS
+    if (err < 0) {
+        Error_set(err);
+        goto cleanup;
+    }
+
+    py_result = PyList_New(n);
+    if (py_result == NULL)
+        goto cleanup;
+
+    for (i = 0; i < n; i++) {
+        item = &items[i];
+        if (patches)
+            py_item = diff_blobs_wrap_patch(self, item);
+        else
+            py_item = Py_BuildValue("(nn)", (Py_ssize_t)item->additions,
+                                    (Py_ssize_t)item->deletions);
+        if (py_item == NULL) {
+            Py_CLEAR(py_result);
+            goto cleanup;
+        }
+        PyList_SET_ITEM(py_result, i, py_item);
+    }
+
+cleanup:
+    if (items != NULL) {
+        for (i = 0; i < n; i++) {
+            git_patch_free(items[i].patch);
+            git_blob_free(items[i].old_blob);
+            git_blob_free(items[i].new_blob);
+            Py_XDECREF(items[i].py_path);
+        }
+        free(items);
+    }
+    Py_XDECREF(py_seq);
+    return py_result;
+}
+
+
 PyDoc_STRVAR(Repository_write__doc__,
     "write(type, data) -> Oid\n"
     "\n"
@@ -440,14 +847,12 @@ Repository_write(Repository *self, PyObject *args)
     if (err < 0)
         return Error_set(err);
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_odb_stream_write(stream, buffer, buflen);
-    if (err) {
-        git_odb_stream_free(stream);
-        return Error_set(err);
-    }
-
-    err = git_odb_stream_finalize_write(&oid, stream);
+    if (err == 0)
+        err = git_odb_stream_finalize_write(&oid, stream);
     git_odb_stream_free(stream);
+    Py_END_ALLOW_THREADS
     if (err)
         return Error_set(err);
 
@@ -480,6 +885,7 @@ Repository_index__get__(Repository *self, void *closure)
         Py_INCREF(self);
         py_index->repo = self;
         py_index->index = index;
+        py_index->busy = 0;
         PyObject_GC_Track(py_index);
         self->index = (PyObject*)py_index;
     }
@@ -580,7 +986,9 @@ Repository_merge_base(Repository *self, PyObject *args)
     if (err < 0)
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_merge_base(&oid, self->repo, &oid1, &oid2);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -618,9 +1026,11 @@ Repository_merge(Repository *self, PyObject *py_oid)
     if (err < 0)
         return Error_set(err);
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_merge(&merge_result, self->repo,
                     (const git_merge_head **)&oid_merge_head, 1,
                     &default_opts);
+    Py_END_ALLOW_THREADS
     git_merge_head_free(oid_merge_head);
     if (err < 0)
         return Error_set(err);
@@ -630,7 +1040,7 @@ Repository_merge(Repository *self, PyObject *py_oid)
 }
 
 PyDoc_STRVAR(Repository_walk__doc__,
-  "walk(oid[, sort_mode]) -> iterator\n"
+  "walk(oid[, sort_mode, **filter]) -> iterator\n"
   "\n"
   "Generator that traverses the history starting from the given commit.\n"
   "The following types of sorting could be used to control traversing\n"
@@ -645,6 +1055,11 @@ PyDoc_STRVAR(Repository_walk__doc__,
   "* GIT_SORT_REVERSE. Iterate through the repository contents in reverse\n"
   "  order; this sorting mode can be combined with any of the above.\n"
   "\n"
+  "The other keyword arguments (since, until, max_count, authors,\n"
+  "committers and message) set a filter, see Walker.set_filter; paths and\n"
+  "follow_renames limit the walk to the commits changing some files, see\n"
+  "Walker.set_paths.\n"
+  "\n"
   "Example:\n"
   "\n"
   "  >>> from pygit2 import Repository\n"
@@ -657,16 +1072,30 @@ PyDoc_STRVAR(Repository_walk__doc__,
   "  >>>\n");
 
 PyObject *
-Repository_walk(Repository *self, PyObject *args)
+Repository_walk(Repository *self, PyObject *args, PyObject *kwds)
 {
+    char *keywords[] = {"oid", "sort_mode", "since", "until", "max_count",
+                        "authors", "committers", "message", "paths",
+                        "follow_renames", NULL};
     PyObject *value;
+    PyObject *py_since = NULL, *py_until = NULL, *py_max_count = NULL;
+    PyObject *py_authors = NULL, *py_committers = NULL, *py_message = NULL;
+    PyObject *py_paths = NULL, *py_follow = Py_False;
     unsigned int sort = GIT_SORT_NONE;
-    int err;
+    int err, follow;
     git_oid oid;
     git_revwalk *walk;
     Walker *py_walker;
 
-    if (!PyArg_ParseTuple(args, "O|I", &value, &sort))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|IOOOOOOOO", keywords,
+                                     &value, &sort, &py_since, &py_until,
+                                     &py_max_count, &py_authors,
+                                     &py_committers, &py_message, &py_paths,
+                                     &py_follow))
+        return NULL;
+
+    follow = PyObject_IsTrue(py_follow);
+    if (follow == -1)
         return NULL;
 
     err = git_revwalk_new(&walk, self->repo);
@@ -700,6 +1129,23 @@ Repository_walk(Repository *self, PyObject *args)
     Py_INCREF(self);
     py_walker->repo = self;
     py_walker->walk = walk;
+    py_walker->mode = WALKER_COMMIT;
+    py_walker->busy = 0;
+    py_walker->sort = sort;
+    walker_filter_init(&py_walker->filter);
+    py_walker->paths = NULL;
+    py_walker->n_paths = 0;
+    py_walker->follow_renames = 0;
+    py_walker->followed = NULL;
+
+    /* Filter */
+    if (walker_set_filter(py_walker, py_since, py_until, py_max_count,
+                          py_authors, py_committers, py_message) < 0 ||
+        walker_set_paths(py_walker, py_paths, follow) < 0) {
+        Py_DECREF(py_walker);
+        return NULL;
+    }
+
     return (PyObject*)py_walker;
 }
 
@@ -721,7 +1167,9 @@ Repository_create_blob(Repository *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s#", &raw, &size))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_blob_create_frombuffer(&oid, self->repo, (const void*)raw, size);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -746,7 +1194,9 @@ Repository_create_blob_fromworkdir(Repository *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s", &path))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_blob_create_fromworkdir(&oid, self->repo, path);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -769,7 +1219,114 @@ Repository_create_blob_fromdisk(Repository *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "s", &path))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_blob_create_fromdisk(&oid, self->repo, path);
+    Py_END_ALLOW_THREADS
+    if (err < 0)
+        return Error_set(err);
+
+    return git_oid_to_python(&oid);
+}
+
+
+/*
+ * The blob is fed to libgit2 one chunk at a time from either a file object
+ * (through its read method) or an iterator of buffers. libgit2 calls back
+ * without the GIL, so it is only held while getting the next chunk.
+ */
+typedef struct {
+    PyObject *py_file;
+    PyObject *py_iter;
+    Py_buffer view;
+    int has_view;
+    Py_ssize_t offset;
+} blob_chunks;
+
+static int
+blob_chunks_next(blob_chunks *chunks, size_t max_length)
+{
+    PyObject *py_chunk;
+    int err;
+
+    if (chunks->has_view) {
+        PyBuffer_Release(&chunks->view);
+        chunks->has_view = 0;
+    }
+
+    if (chunks->py_file != NULL)
+        py_chunk = PyObject_CallMethod(chunks->py_file, "read", "n",
+                                       (Py_ssize_t)max_length);
+    else
+        py_chunk = PyIter_Next(chunks->py_iter);
+
+    /* The end, or an error */
+    if (py_chunk == NULL)
+        return PyErr_Occurred() ? -1 : 0;
+
+    err = PyObject_GetBuffer(py_chunk, &chunks->view, PyBUF_SIMPLE);
+    Py_DECREF(py_chunk);
+    if (err < 0)
+        return -1;
+
+    chunks->has_view = 1;
+    chunks->offset = 0;
+    return 1;
+}
+
+static int
+blob_chunks_cb(char *content, size_t max_length, void *payload)
+{
+    blob_chunks *chunks = payload;
+    PyGILState_STATE gil;
+    size_t len;
+    int err;
+
+    gil = PyGILState_Ensure();
+
+    while (!chunks->has_view || chunks->offset == chunks->view.len) {
+        err = blob_chunks_next(chunks, max_length);
+        if (err <= 0)
+            goto out;
+
+        /* An empty read means end of file */
+        if (chunks->py_file != NULL && chunks->view.len == 0) {
+            err = 0;
+            goto out;
+        }
+    }
+
+    len = chunks->view.len - chunks->offset;
+    if (len > max_length)
+        len = max_length;
+    memcpy(content, (char*)chunks->view.buf + chunks->offset, len);
+    chunks->offset += len;
+    err = (int)len;
+
+out:
+    PyGILState_Release(gil);
+    return err;
+}
+
+static PyObject *
+create_blob_fromchunks(Repository *self, blob_chunks *chunks,
+                       const char *hintpath)
+{
+    git_oid oid;
+    int err;
+
+    chunks->has_view = 0;
+    chunks->offset = 0;
+
+    Py_BEGIN_ALLOW_THREADS
+    err = git_blob_create_fromchunks(&oid, self->repo, hintpath,
+                                     blob_chunks_cb, chunks);
+    Py_END_ALLOW_THREADS
+
+    if (chunks->has_view)
+        PyBuffer_Release(&chunks->view);
+
+    if (PyErr_Occurred())
+        return NULL;
     if (err < 0)
         return Error_set(err);
 
@@ -777,6 +1334,60 @@ Repository_create_blob_fromdisk(Repository *self, PyObject *args)
 }
 
 
+PyDoc_STRVAR(Repository_create_blob_fromiobase__doc__,
+    "create_blob_fromiobase(fileobj[, hintpath]) -> Oid\n"
+    "\n"
+    "Create a new blob from a binary file object, reading it in chunks so\n"
+    "the whole content is never held in memory. If hintpath is given, the\n"
+    "filters (e.g. end of line conversion) for that path are applied.");
+
+PyObject *
+Repository_create_blob_fromiobase(Repository *self, PyObject *args)
+{
+    blob_chunks chunks;
+    const char *hintpath = NULL;
+
+    chunks.py_iter = NULL;
+    if (!PyArg_ParseTuple(args, "O|z", &chunks.py_file, &hintpath))
+        return NULL;
+
+    if (!PyObject_HasAttrString(chunks.py_file, "read")) {
+        PyErr_SetString(PyExc_TypeError, "expected a file object");
+        return NULL;
+    }
+
+    return create_blob_fromchunks(self, &chunks, hintpath);
+}
+
+
+PyDoc_STRVAR(Repository_create_blob_fromiter__doc__,
+    "create_blob_fromiter(chunks[, hintpath]) -> Oid\n"
+    "\n"
+    "Create a new blob from an iterable of bytes-like chunks, which are\n"
+    "consumed as the blob is written. If hintpath is given, the filters\n"
+    "(e.g. end of line conversion) for that path are applied.");
+
+PyObject *
+Repository_create_blob_fromiter(Repository *self, PyObject *args)
+{
+    blob_chunks chunks;
+    const char *hintpath = NULL;
+    PyObject *py_chunks, *py_oid;
+
+    chunks.py_file = NULL;
+    if (!PyArg_ParseTuple(args, "O|z", &py_chunks, &hintpath))
+        return NULL;
+
+    chunks.py_iter = PyObject_GetIter(py_chunks);
+    if (chunks.py_iter == NULL)
+        return NULL;
+
+    py_oid = create_blob_fromchunks(self, &chunks, hintpath);
+    Py_DECREF(chunks.py_iter);
+    return py_oid;
+}
+
+
 PyDoc_STRVAR(Repository_create_commit__doc__,
   "create_commit(reference, author, committer, message, tree, parents[, encoding]) -> Oid\n"
   "\n"
@@ -841,10 +1452,12 @@ Repository_create_commit(Repository *self, PyObject *args)
         }
     }
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_commit_create(&oid, self->repo, update_ref,
                             py_author->signature, py_committer->signature,
                             encoding, message, tree, parent_count,
                             (const git_commit**)parents);
+    Py_END_ALLOW_THREADS
     if (err < 0) {
         Error_set(err);
         goto out;
@@ -951,7 +1564,9 @@ Repository_listall_references(Repository *self, PyObject *args)
     int err;
 
     /* Get the C result */
+    Py_BEGIN_ALLOW_THREADS
     err = git_reference_list(&c_result, self->repo);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -1156,7 +1771,9 @@ Repository_status(Repository *self)
     if (dict == NULL)
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_status_list_new(&list, self->repo, NULL);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -1211,7 +1828,9 @@ Repository_status_file(Repository *self, PyObject *value)
     if (!path)
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_status_file(&status, self->repo, path);
+    Py_END_ALLOW_THREADS
     if (err < 0) {
         PyObject *err_obj =  Error_set_str(err, path);
         free(path);
@@ -1368,7 +1987,9 @@ Repository_checkout_head(Repository *self, PyObject *args)
         return NULL;
 
     opts.checkout_strategy = strategy;
+    Py_BEGIN_ALLOW_THREADS
     err = git_checkout_head(self->repo, &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -1392,7 +2013,9 @@ Repository_checkout_index(Repository *self, PyObject *args)
         return NULL;
 
     opts.checkout_strategy = strategy;
+    Py_BEGIN_ALLOW_THREADS
     err = git_checkout_index(self->repo, NULL, &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -1417,7 +2040,9 @@ Repository_checkout_tree(Repository *self, PyObject *args)
         return NULL;
 
     opts.checkout_strategy = strategy;
+    Py_BEGIN_ALLOW_THREADS
     err = git_checkout_tree(self->repo, py_object->obj, &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -1570,7 +2195,9 @@ Repository_blame(Repository *self, PyObject *args, PyObject *kwds)
             return NULL;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_blame_file(&blame, self->repo, path, &opts);
+    Py_END_ALLOW_THREADS
     if (err < 0)
         return Error_set(err);
 
@@ -1605,9 +2232,11 @@ Repository_reset(Repository *self, PyObject* args)
     if (len == 0)
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     err = git_object_lookup_prefix(&target, self->repo, &oid, len,
                                    GIT_OBJ_ANY);
     err = err < 0 ? err : git_reset(self->repo, target, reset_type);
+    Py_END_ALLOW_THREADS
     git_object_free(target);
     if (err < 0)
         return Error_set_oid(err, &oid, len);
@@ -1618,13 +2247,19 @@ PyMethodDef Repository_methods[] = {
     METHOD(Repository, create_blob, METH_VARARGS),
     METHOD(Repository, create_blob_fromworkdir, METH_VARARGS),
     METHOD(Repository, create_blob_fromdisk, METH_VARARGS),
+    METHOD(Repository, create_blob_fromiobase, METH_VARARGS),
+    METHOD(Repository, create_blob_fromiter, METH_VARARGS),
     METHOD(Repository, create_commit, METH_VARARGS),
     METHOD(Repository, create_tag, METH_VARARGS),
     METHOD(Repository, TreeBuilder, METH_VARARGS),
-    METHOD(Repository, walk, METH_VARARGS),
+    METHOD(Repository, walk, METH_VARARGS | METH_KEYWORDS),
     METHOD(Repository, merge_base, METH_VARARGS),
     METHOD(Repository, merge, METH_O),
     METHOD(Repository, read, METH_O),
+    METHOD(Repository, diff_blobs, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Repository, read_header, METH_O),
+    METHOD(Repository, read_headers, METH_O),
+    METHOD(Repository, iter_oids, METH_VARARGS | METH_KEYWORDS),
     METHOD(Repository, write, METH_VARARGS),
     METHOD(Repository, create_reference_direct, METH_VARARGS),
     METHOD(Repository, create_reference_symbolic, METH_VARARGS),
@@ -1668,7 +2303,12 @@ PyGetSetDef Repository_getseters[] = {
 PyDoc_STRVAR(Repository__doc__,
   "Repository(path) -> Repository\n"
   "\n"
-  "Git repository.");
+  "Git repository.\n"
+  "\n"
+  "Some methods release the GIL while libgit2 works on the repository, and\n"
+  "the repository handle is not thread safe, so a Repository object must\n"
+  "not be used from several threads at a time. Open one Repository per\n"
+  "thread instead.");
 
 PyTypeObject RepositoryType = {
     PyVarObject_HEAD_INIT(NULL, 0)
@@ -0,0 +1,537 @@
+/*
+ * Copyright 2010-2014 The pygit2 contributors
+ *
+ * This file is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License, version 2,
+ * as published by the Free Software Foundation.
+ *
+ * In addition to the permissions in the GNU General Public License,
+ * the authors give you unlimited permission to link the compiled
+ * version of this file into combinations with other programs,
+ * and to distribute those combinations without any restriction
+ * coming from the use of this file.  (The General Public License
+ * restrictions do apply in other respects; for example, they cover
+ * modification of the file, and distribution when not linked into
+ * a combined executable.)
+ *
+ * This file is distributed in the hope that it will be useful, but
+ * WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; see the file COPYING.  If not, write to
+ * the Free Software Foundation, 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301, USA.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <pythread.h>
+#include <string.h>
+#include "error.h"
+#include "types.h"
+#include "utils.h"
+#include "similarity.h"
+
+/*
+ * The signatures libgit2 computes to find renames and copies only depend
+ * on the contents of the blob, and on how whitespace is handled, so they
+ * can be kept from one diff to the next. The cache is a hash table keyed
+ * by (oid, option), with the entries also in a least recently used list.
+ *
+ * During git_diff_find_similar libgit2 holds on to the signatures it got
+ * until it calls free_signature, so the entries are reference counted and
+ * only those which are not in use are evicted.
+ */
+
+struct SimilarityEntry {
+    git_oid oid;
+    git_hashsig_option_t opts;
+    git_hashsig *sig;
+    size_t refs;
+    int cached;
+    SimilarityEntry *next;
+    SimilarityEntry *newer;
+    SimilarityEntry *older;
+};
+
+static size_t
+similarity_hash(SimilarityCache *cache, const git_oid *oid,
+                git_hashsig_option_t opts)
+{
+    size_t h;
+
+    memcpy(&h, oid->id, sizeof(h));
+    return (h ^ opts) & (cache->nbuckets - 1);
+}
+
+static void
+similarity_unlink(SimilarityCache *cache, SimilarityEntry *entry)
+{
+    if (entry->newer != NULL)
+        entry->newer->older = entry->older;
+    else
+        cache->newest = entry->older;
+
+    if (entry->older != NULL)
+        entry->older->newer = entry->newer;
+    else
+        cache->oldest = entry->newer;
+
+    entry->newer = NULL;
+    entry->older = NULL;
+}
+
+static void
+similarity_link(SimilarityCache *cache, SimilarityEntry *entry)
+{
+    entry->older = cache->newest;
+    entry->newer = NULL;
+    if (cache->newest != NULL)
+        cache->newest->newer = entry;
+    cache->newest = entry;
+    if (cache->oldest == NULL)
+        cache->oldest = entry;
+}
+
+static void
+similarity_remove(SimilarityCache *cache, SimilarityEntry *entry)
+{
+    SimilarityEntry **p;
+
+    p = &cache->buckets[similarity_hash(cache, &entry->oid, entry->opts)];
+    while (*p != entry)
+        p = &(*p)->next;
+    *p = entry->next;
+
+    similarity_unlink(cache, entry);
+    cache->count--;
+    git_hashsig_free(entry->sig);
+    free(entry);
+}
+
+/* Drop the oldest entries not in use until the cache fits. Lock held. */
+static void
+similarity_evict(SimilarityCache *cache, size_t size)
+{
+    SimilarityEntry *entry, *newer;
+
+    for (entry = cache->oldest; entry != NULL && cache->count > size;
+         entry = newer) {
+        newer = entry->newer;
+        if (entry->refs == 0)
+            similarity_remove(cache, entry);
+    }
+}
+
+void
+similarity_cache_trim(SimilarityCache *cache)
+{
+    PyThread_acquire_lock(cache->lock, WAIT_LOCK);
+    similarity_evict(cache, cache->size);
+    PyThread_release_lock(cache->lock);
+}
+
+static SimilarityEntry *
+similarity_lookup(SimilarityCache *cache, const git_oid *oid,
+                  git_hashsig_option_t opts)
+{
+    SimilarityEntry *entry;
+
+    entry = cache->buckets[similarity_hash(cache, oid, opts)];
+    for (; entry != NULL; entry = entry->next) {
+        if (entry->opts == opts && git_oid_cmp(&entry->oid, oid) == 0)
+            return entry;
+    }
+
+    return NULL;
+}
+
+/*
+ * Return the entry for the given signature. If another thread computed
+ * the same one meanwhile, the new signature is dropped and the cached one
+ * is used instead.
+ */
+static SimilarityEntry *
+similarity_insert(SimilarityCache *cache, SimilarityEntry *entry)
+{
+    SimilarityEntry *found;
+    size_t h;
+
+    PyThread_acquire_lock(cache->lock, WAIT_LOCK);
+    found = similarity_lookup(cache, &entry->oid, entry->opts);
+    if (found != NULL) {
+        similarity_unlink(cache, found);
+        similarity_link(cache, found);
+        found->refs++;
+        PyThread_release_lock(cache->lock);
+        git_hashsig_free(entry->sig);
+        free(entry);
+        return found;
+    }
+
+    h = similarity_hash(cache, &entry->oid, entry->opts);
+    entry->next = cache->buckets[h];
+    cache->buckets[h] = entry;
+    entry->cached = 1;
+    entry->refs = 1;
+    similarity_link(cache, entry);
+    cache->count++;
+    similarity_evict(cache, cache->size);
+    PyThread_release_lock(cache->lock);
+
+    return entry;
+}
+
+static int
+similarity_signature(void **out, const git_diff_file *file, const char *buf,
+                     size_t buflen, const char *path, void *data)
+{
+    similarity_payload *payload = data;
+    SimilarityCache *cache = payload->cache;
+    SimilarityEntry *entry;
+    int err, cacheable;
+
+    *out = NULL;
+    cacheable = (file->flags & GIT_DIFF_FLAG_VALID_OID) &&
+                !git_oid_iszero(&file->oid);
+
+    if (cacheable) {
+        PyThread_acquire_lock(cache->lock, WAIT_LOCK);
+        entry = similarity_lookup(cache, &file->oid, payload->opts);
+        if (entry != NULL) {
+            similarity_unlink(cache, entry);
+            similarity_link(cache, entry);
+            entry->refs++;
+            cache->hits++;
+        } else {
+            cache->misses++;
+        }
+        PyThread_release_lock(cache->lock);
+
+        if (entry != NULL) {
+            *out = entry;
+            return 0;
+        }
+    }
+
+    entry = calloc(1, sizeof(SimilarityEntry));
+    if (entry == NULL) {
+        giterr_set_oom();
+        return GIT_ERROR;
+    }
+
+    git_oid_cpy(&entry->oid, &file->oid);
+    entry->opts = payload->opts;
+    if (path != NULL)
+        err = git_hashsig_create_fromfile(&entry->sig, path, payload->opts);
+    else
+        err = git_hashsig_create(&entry->sig, buf, buflen, payload->opts);
+
+    /* Too small to compute a signature, as libgit2 itself does */
+    if (err == GIT_EBUFS) {
+        giterr_clear();
+        entry->sig = NULL;
+        err = 0;
+    }
+
+    if (err < 0) {
+        free(entry);
+        return err;
+    }
+
+    *out = cacheable ? similarity_insert(cache, entry) : entry;
+    return 0;
+}
+
+static int
+similarity_file_signature(void **out, const git_diff_file *file,
+                          const char *fullpath, void *payload)
+{
+    return similarity_signature(out, file, NULL, 0, fullpath, payload);
+}
+
+static int
+similarity_buffer_signature(void **out, const git_diff_file *file,
+                            const char *buf, size_t buflen, void *payload)
+{
+    return similarity_signature(out, file, buf, buflen, NULL, payload);
+}
+
+static void
+similarity_free_signature(void *sig, void *data)
+{
+    similarity_payload *payload = data;
+    SimilarityEntry *entry = sig;
+
+    if (entry == NULL)
+        return;
+
+    if (!entry->cached) {
+        git_hashsig_free(entry->sig);
+        free(entry);
+        return;
+    }
+
+    PyThread_acquire_lock(payload->cache->lock, WAIT_LOCK);
+    entry->refs--;
+    PyThread_release_lock(payload->cache->lock);
+}
+
+static int
+similarity_similarity(int *score, void *siga, void *sigb, void *payload)
+{
+    SimilarityEntry *a = siga, *b = sigb;
+
+    if (a->sig == NULL || b->sig == NULL) {
+        *score = 0;
+        return 0;
+    }
+
+    *score = git_hashsig_compare(a->sig, b->sig);
+    return (*score < 0) ? *score : 0;
+}
+
+/*
+ * The buckets and the lock are only allocated by __init__, which a
+ * subclass or a bare __new__ may skip.
+ */
+static int
+similarity_cache_check(SimilarityCache *cache)
+{
+    if (cache->buckets != NULL && cache->lock != NULL)
+        return 0;
+
+    PyErr_SetString(PyExc_RuntimeError, "cache not initialized");
+    return -1;
+}
+
+/*
+ * Fill a metric which behaves like the default one of libgit2, but goes
+ * through the cache. The whitespace handling follows the flags the same
+ * way git_diff_find_similar does.
+ */
+int
+similarity_metric_init(git_diff_similarity_metric *metric,
+                       similarity_payload *payload, SimilarityCache *cache,
+                       uint32_t flags)
+{
+    if (similarity_cache_check(cache) < 0)
+        return -1;
+
+    payload->cache = cache;
+    if (flags & GIT_DIFF_FIND_IGNORE_WHITESPACE)
+        payload->opts = GIT_HASHSIG_IGNORE_WHITESPACE;
+    else if (flags & GIT_DIFF_FIND_DONT_IGNORE_WHITESPACE)
+        payload->opts = GIT_HASHSIG_NORMAL;
+    else
+        payload->opts = GIT_HASHSIG_SMART_WHITESPACE;
+
+    metric->file_signature = similarity_file_signature;
+    metric->buffer_signature = similarity_buffer_signature;
+    metric->free_signature = similarity_free_signature;
+    metric->similarity = similarity_similarity;
+    metric->payload = payload;
+    return 0;
+}
+
+
+int
+SimilarityCache_init(SimilarityCache *self, PyObject *args, PyObject *kwds)
+{
+    Py_ssize_t size = 4096;
+    char *keywords[] = {"size", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|n", keywords, &size))
+        return -1;
+
+    if (size < 1) {
+        PyErr_SetString(PyExc_ValueError, "size must be at least 1");
+        return -1;
+    }
+
+    if (self->buckets != NULL) {
+        PyErr_SetString(PyExc_RuntimeError, "cache already initialized");
+        return -1;
+    }
+
+    /* A power of two, at least as many buckets as entries */
+    self->nbuckets = 64;
+    while (self->nbuckets < (size_t)size)
+        self->nbuckets *= 2;
+
+    self->buckets = calloc(self->nbuckets, sizeof(SimilarityEntry*));
+    self->lock = PyThread_allocate_lock();
+    if (self->buckets == NULL || self->lock == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    self->size = (size_t)size;
+    return 0;
+}
+
+void
+SimilarityCache_dealloc(SimilarityCache *self)
+{
+    if (self->buckets != NULL)
+        similarity_evict(self, 0);
+    free(self->buckets);
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+Py_ssize_t
+SimilarityCache_len(SimilarityCache *self)
+{
+    size_t count;
+
+    if (self->lock == NULL)
+        return 0;
+
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    count = self->count;
+    PyThread_release_lock(self->lock);
+
+    return (Py_ssize_t)count;
+}
+
+
+PyDoc_STRVAR(SimilarityCache_clear__doc__,
+  "clear()\n"
+  "\n"
+  "Drop all the signatures, and reset the counters.");
+
+PyObject *
+SimilarityCache_clear(SimilarityCache *self)
+{
+    if (similarity_cache_check(self) < 0)
+        return NULL;
+
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    similarity_evict(self, 0);
+    self->hits = 0;
+    self->misses = 0;
+    PyThread_release_lock(self->lock);
+
+    Py_RETURN_NONE;
+}
+
+
+PyDoc_STRVAR(SimilarityCache_hits__doc__,
+  "Number of signatures found in the cache.");
+
+PyObject *
+SimilarityCache_hits__get__(SimilarityCache *self)
+{
+    size_t hits;
+
+    if (self->lock == NULL)
+        return PyLong_FromSize_t(0);
+
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    hits = self->hits;
+    PyThread_release_lock(self->lock);
+
+    return PyLong_FromSize_t(hits);
+}
+
+
+PyDoc_STRVAR(SimilarityCache_misses__doc__,
+  "Number of signatures which had to be computed.");
+
+PyObject *
+SimilarityCache_misses__get__(SimilarityCache *self)
+{
+    size_t misses;
+
+    if (self->lock == NULL)
+        return PyLong_FromSize_t(0);
+
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    misses = self->misses;
+    PyThread_release_lock(self->lock);
+
+    return PyLong_FromSize_t(misses);
+}
+
+
+PyDoc_STRVAR(SimilarityCache_size__doc__,
+  "Maximum number of signatures kept when not in use.");
+
+PyObject *
+SimilarityCache_size__get__(SimilarityCache *self)
+{
+    return PyLong_FromSize_t(self->size);
+}
+
+PyMethodDef SimilarityCache_methods[] = {
+    METHOD(SimilarityCache, clear, METH_NOARGS),
+    {NULL}
+};
+
+PyGetSetDef SimilarityCache_getseters[] = {
+    GETTER(SimilarityCache, hits),
+    GETTER(SimilarityCache, misses),
+    GETTER(SimilarityCache, size),
+    {NULL}
+};
+
+PySequenceMethods SimilarityCache_as_sequence = {
+    (lenfunc)SimilarityCache_len,    /* sq_length */
+};
+
+
+PyDoc_STRVAR(SimilarityCache__doc__,
+  "SimilarityCache([size])\n"
+  "\n"
+  "Cache of the signatures used to find renames and copies, to be passed\n"
+  "to :py:meth:`Diff.find_similar`. Blobs are identified by their oid, so\n"
+  "one cache can be shared by all the diffs of a process.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "size: the maximum number of signatures kept, 4096 by default.");
+
+PyTypeObject SimilarityCacheType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.SimilarityCache",                 /* tp_name           */
+    sizeof(SimilarityCache),                   /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)SimilarityCache_dealloc,       /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    &SimilarityCache_as_sequence,              /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    SimilarityCache__doc__,                    /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    0,                                         /* tp_iter           */
+    0,                                         /* tp_iternext       */
+    SimilarityCache_methods,                   /* tp_methods        */
+    0,                                         /* tp_members        */
+    SimilarityCache_getseters,                 /* tp_getset         */
+    0,                                         /* tp_base           */
+    0,                                         /* tp_dict           */
+    0,                                         /* tp_descr_get      */
+    0,                                         /* tp_descr_set      */
+    0,                                         /* tp_dictoffset     */
+    (initproc)SimilarityCache_init,            /* tp_init           */
+    0,                                         /* tp_alloc          */
+    0,                                         /* tp_new            */
+};
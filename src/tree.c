@@ -39,6 +39,7 @@ extern PyTypeObject TreeType;
 extern PyTypeObject TreeEntryType;
 extern PyTypeObject DiffType;
 extern PyTypeObject TreeIterType;
+extern PyTypeObject TreeWalkIterType;
 extern PyTypeObject IndexType;
 
 void
@@ -338,43 +339,67 @@ Tree_getitem(Tree *self, PyObject *value)
 
 
 PyDoc_STRVAR(Tree_diff_to_workdir__doc__,
-  "diff_to_workdir([flags, context_lines, interhunk_lines]) -> Diff\n"
+  "diff_to_workdir([flags, context_lines, interhunk_lines, paths, max_size,\n"
+  "                 ignore_submodules, old_prefix, new_prefix,\n"
+  "                 find_similar]) -> Diff\n"
   "\n"
   "Show the changes between the :py:class:`~pygit2.Tree` and the workdir.\n"
   "\n"
   "Arguments:\n"
   "\n"
-  "flag: a GIT_DIFF_* constant.\n"
+  "flags: a GIT_DIFF_* constant.\n"
   "\n"
   "context_lines: the number of unchanged lines that define the boundary\n"
   "   of a hunk (and to display before and after)\n"
   "\n"
   "interhunk_lines: the maximum number of unchanged lines between hunk\n"
-  "   boundaries before the hunks will be merged into a one.\n");
+  "   boundaries before the hunks will be merged into a one.\n"
+  "\n"
+  "paths: a list of pathspecs limiting the diff to the matching files.\n"
+  "\n"
+  "max_size: blobs larger than this many bytes are treated as binary.\n"
+  "\n"
+  "ignore_submodules: a GIT_SUBMODULE_IGNORE_* constant.\n"
+  "\n"
+  "old_prefix, new_prefix: the path prefixes used in the patch headers,\n"
+  "   'a' and 'b' by default.\n"
+  "\n"
+  "find_similar: GIT_DIFF_FIND_* flags; when given, renames and copies are\n"
+  "   detected as with :py:meth:`Diff.find_similar`.\n");
 
 PyObject *
-Tree_diff_to_workdir(Tree *self, PyObject *args)
+Tree_diff_to_workdir(Tree *self, PyObject *args, PyObject *kwds)
 {
-    git_diff_options opts = GIT_DIFF_OPTIONS_INIT;
+    diff_args d = DIFF_ARGS_INIT;
     git_diff *diff;
     Repository *py_repo;
     int err;
+    char *keywords[] = {"flags", "context_lines", "interhunk_lines",
+                        DIFF_ARGS_KEYWORDS, NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|IHH" DIFF_ARGS_FORMAT,
+                                     keywords, &d.opts.flags,
+                                     &d.opts.context_lines,
+                                     &d.opts.interhunk_lines,
+                                     DIFF_ARGS_VALUES(d)))
+        return NULL;
 
-    if (!PyArg_ParseTuple(args, "|IHH", &opts.flags, &opts.context_lines,
-                                        &opts.interhunk_lines))
+    if (diff_args_prepare(&d) < 0)
         return NULL;
 
     py_repo = self->repo;
-    err = git_diff_tree_to_workdir(&diff, py_repo->repo, self->tree, &opts);
-    if (err < 0)
-        return Error_set(err);
+    Py_BEGIN_ALLOW_THREADS
+    err = git_diff_tree_to_workdir(&diff, py_repo->repo, self->tree, &d.opts);
+    Py_END_ALLOW_THREADS
 
-    return wrap_diff(diff, py_repo);
+    return diff_args_finish(&d, diff, err, py_repo);
 }
 
 
 PyDoc_STRVAR(Tree_diff_to_index__doc__,
-  "diff_to_index(index, [flags, context_lines, interhunk_lines]) -> Diff\n"
+  "diff_to_index(index, [flags, context_lines, interhunk_lines, paths,\n"
+  "              max_size, ignore_submodules, old_prefix, new_prefix,\n"
+  "              find_similar]) -> Diff\n"
   "\n"
   "Show the changes between the index and a given :py:class:`~pygit2.Tree`.\n"
   "\n"
@@ -382,41 +407,66 @@ PyDoc_STRVAR(Tree_diff_to_index__doc__,
   "\n"
   "tree: the :py:class:`~pygit2.Tree` to diff.\n"
   "\n"
-  "flag: a GIT_DIFF_* constant.\n"
+  "flags: a GIT_DIFF_* constant.\n"
   "\n"
   "context_lines: the number of unchanged lines that define the boundary\n"
   "   of a hunk (and to display before and after)\n"
   "\n"
   "interhunk_lines: the maximum number of unchanged lines between hunk\n"
-  "   boundaries before the hunks will be merged into a one.\n");
+  "   boundaries before the hunks will be merged into a one.\n"
+  "\n"
+  "paths: a list of pathspecs limiting the diff to the matching files.\n"
+  "\n"
+  "max_size: blobs larger than this many bytes are treated as binary.\n"
+  "\n"
+  "ignore_submodules: a GIT_SUBMODULE_IGNORE_* constant.\n"
+  "\n"
+  "old_prefix, new_prefix: the path prefixes used in the patch headers,\n"
+  "   'a' and 'b' by default.\n"
+  "\n"
+  "find_similar: GIT_DIFF_FIND_* flags; when given, renames and copies are\n"
+  "   detected as with :py:meth:`Diff.find_similar`.\n");
 
 PyObject *
 Tree_diff_to_index(Tree *self, PyObject *args, PyObject *kwds)
 {
-    git_diff_options opts = GIT_DIFF_OPTIONS_INIT;
+    diff_args d = DIFF_ARGS_INIT;
     git_diff *diff;
     Repository *py_repo;
     int err;
+    char *keywords[] = {"index", "flags", "context_lines", "interhunk_lines",
+                        DIFF_ARGS_KEYWORDS, NULL};
 
     Index *py_idx = NULL;
 
-    if (!PyArg_ParseTuple(args, "O!|IHH", &IndexType, &py_idx, &opts.flags,
-                                        &opts.context_lines,
-                                        &opts.interhunk_lines))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O!|IHH" DIFF_ARGS_FORMAT,
+                                     keywords, &IndexType, &py_idx,
+                                     &d.opts.flags, &d.opts.context_lines,
+                                     &d.opts.interhunk_lines,
+                                     DIFF_ARGS_VALUES(d)))
+        return NULL;
+
+    CHECK_BUSY(py_idx, NULL);
+
+    if (diff_args_prepare(&d) < 0)
         return NULL;
 
     py_repo = self->repo;
+    py_idx->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
     err = git_diff_tree_to_index(&diff, py_repo->repo, self->tree,
-                                 py_idx->index, &opts);
-    if (err < 0)
-        return Error_set(err);
+                                 py_idx->index, &d.opts);
+    Py_END_ALLOW_THREADS
+    py_idx->busy = 0;
 
-    return wrap_diff(diff, py_repo);
+    return diff_args_finish(&d, diff, err, py_repo);
 }
 
 
 PyDoc_STRVAR(Tree_diff_to_tree__doc__,
-  "diff_to_tree([tree, flags, context_lines, interhunk_lines, swap]) -> Diff\n"
+  "diff_to_tree([tree, flags, context_lines, interhunk_lines, swap, paths,\n"
+  "              max_size, ignore_submodules, old_prefix, new_prefix,\n"
+  "              find_similar]) -> Diff\n"
   "\n"
   "Show the changes between two trees\n"
   "\n"
@@ -425,7 +475,7 @@ PyDoc_STRVAR(Tree_diff_to_tree__doc__,
   "tree: the :py:class:`~pygit2.Tree` to diff. If no tree is given the empty\n"
   "   tree will be used instead.\n"
   "\n"
-  "flag: a GIT_DIFF_* constant.\n"
+  "flags: a GIT_DIFF_* constant.\n"
   "\n"
   "context_lines: the number of unchanged lines that define the boundary\n"
   "   of a hunk (and to display before and after)\n"
@@ -433,25 +483,41 @@ PyDoc_STRVAR(Tree_diff_to_tree__doc__,
   "interhunk_lines: the maximum number of unchanged lines between hunk\n"
   "   boundaries before the hunks will be merged into a one.\n"
   "\n"
-  "swap: instead of diffing a to b. Diff b to a.\n");
+  "swap: instead of diffing a to b. Diff b to a.\n"
+  "\n"
+  "paths: a list of pathspecs limiting the diff to the matching files.\n"
+  "\n"
+  "max_size: blobs larger than this many bytes are treated as binary.\n"
+  "\n"
+  "ignore_submodules: a GIT_SUBMODULE_IGNORE_* constant.\n"
+  "\n"
+  "old_prefix, new_prefix: the path prefixes used in the patch headers,\n"
+  "   'a' and 'b' by default.\n"
+  "\n"
+  "find_similar: GIT_DIFF_FIND_* flags; when given, renames and copies are\n"
+  "   detected as with :py:meth:`Diff.find_similar`.\n");
 
 PyObject *
 Tree_diff_to_tree(Tree *self, PyObject *args, PyObject *kwds)
 {
-    git_diff_options opts = GIT_DIFF_OPTIONS_INIT;
+    diff_args d = DIFF_ARGS_INIT;
     git_diff *diff;
     git_tree *from, *to, *tmp;
     Repository *py_repo;
     int err, swap = 0;
     char *keywords[] = {"obj", "flags", "context_lines", "interhunk_lines",
-                        "swap", NULL};
+                        "swap", DIFF_ARGS_KEYWORDS, NULL};
 
     Tree *py_tree = NULL;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O!IHHi", keywords,
-                                     &TreeType, &py_tree, &opts.flags,
-                                     &opts.context_lines,
-                                     &opts.interhunk_lines, &swap))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O!IHHi" DIFF_ARGS_FORMAT,
+                                     keywords, &TreeType, &py_tree,
+                                     &d.opts.flags, &d.opts.context_lines,
+                                     &d.opts.interhunk_lines, &swap,
+                                     DIFF_ARGS_VALUES(d)))
+        return NULL;
+
+    if (diff_args_prepare(&d) < 0)
         return NULL;
 
     py_repo = self->repo;
@@ -463,11 +529,251 @@ Tree_diff_to_tree(Tree *self, PyObject *args, PyObject *kwds)
         to = tmp;
     }
 
-    err = git_diff_tree_to_tree(&diff, py_repo->repo, from, to, &opts);
-    if (err < 0)
+    Py_BEGIN_ALLOW_THREADS
+    err = git_diff_tree_to_tree(&diff, py_repo->repo, from, to, &d.opts);
+    Py_END_ALLOW_THREADS
+
+    return diff_args_finish(&d, diff, err, py_repo);
+}
+
+
+/*
+ * Tree.walk collects the entries without the GIL and without building any
+ * Python object; they are wrapped one at a time as the iterator advances.
+ */
+typedef struct {
+    TreeWalkItem *items;
+    size_t n;
+    size_t size;
+    unsigned int types;
+    const char *base;
+} tree_walk_payload;
+
+static int
+tree_walk_add(tree_walk_payload *walk, const char *root,
+              const git_tree_entry *entry)
+{
+    TreeWalkItem *items, *item;
+    const char *name;
+
+    if (!(walk->types & (1 << git_tree_entry_type(entry))))
+        return 0;
+
+    if (walk->n == walk->size) {
+        walk->size = walk->size ? walk->size * 2 : 64;
+        items = realloc(walk->items, walk->size * sizeof(TreeWalkItem));
+        if (items == NULL)
+            goto oom;
+        walk->items = items;
+    }
+
+    name = git_tree_entry_name(entry);
+    item = &walk->items[walk->n];
+    item->path = malloc(strlen(walk->base) + strlen(root) + strlen(name) + 1);
+    if (item->path == NULL)
+        goto oom;
+    strcpy(item->path, walk->base);
+    strcat(item->path, root);
+    strcat(item->path, name);
+
+    item->entry = git_tree_entry_dup(entry);
+    if (item->entry == NULL) {
+        free(item->path);
+        goto oom;
+    }
+
+    walk->n++;
+    return 0;
+
+oom:
+    giterr_set_oom();
+    return GIT_ERROR;
+}
+
+static int
+tree_walk_cb(const char *root, const git_tree_entry *entry, void *payload)
+{
+    return tree_walk_add((tree_walk_payload*)payload, root, entry);
+}
+
+static void
+tree_walk_free_items(TreeWalkItem *items, size_t i, size_t n)
+{
+    for (; i < n; i++) {
+        free(items[i].path);
+        git_tree_entry_free(items[i].entry);
+    }
+    free(items);
+}
+
+static int
+tree_walk_types(PyObject *py_types, unsigned int *types)
+{
+    PyObject *py_iter, *py_item;
+    long type;
+
+    *types = 0;
+    if (py_types == NULL || py_types == Py_None) {
+        *types = ~0U;
+        return 0;
+    }
+
+    if (PyLong_Check(py_types)) {
+        type = PyLong_AsLong(py_types);
+        if (type == -1 && PyErr_Occurred())
+            return -1;
+        goto check;
+    }
+
+    py_iter = PyObject_GetIter(py_types);
+    if (py_iter == NULL)
+        return -1;
+
+    while ((py_item = PyIter_Next(py_iter)) != NULL) {
+        type = PyLong_AsLong(py_item);
+        Py_DECREF(py_item);
+        if (type == -1 && PyErr_Occurred())
+            break;
+        if (type < GIT_OBJ_COMMIT || type > GIT_OBJ_TAG) {
+            PyErr_SetString(PyExc_ValueError, "invalid object type");
+            break;
+        }
+        *types |= 1 << type;
+    }
+    Py_DECREF(py_iter);
+    return PyErr_Occurred() ? -1 : 0;
+
+check:
+    if (type < GIT_OBJ_COMMIT || type > GIT_OBJ_TAG) {
+        PyErr_SetString(PyExc_ValueError, "invalid object type");
+        return -1;
+    }
+    *types = 1 << type;
+    return 0;
+}
+
+
+PyDoc_STRVAR(Tree_walk__doc__,
+  "walk(mode='pre', types=None, prefix=None, compact=False) -> iterator\n"
+  "\n"
+  "Walk the tree recursively, yielding (path, TreeEntry) pairs for the\n"
+  "entries of the tree and all its subtrees.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "mode: 'pre' to yield a subtree before its contents (the default), or\n"
+  "   'post' to yield it after.\n"
+  "\n"
+  "types: a GIT_OBJ_* constant, or a sequence of them, to only yield the\n"
+  "   entries of those types (GIT_OBJ_COMMIT is used for submodules).\n"
+  "\n"
+  "prefix: only walk the entries under this path, relative to the top of\n"
+  "   the tree.\n"
+  "\n"
+  "compact: yield (path, oid, filemode) tuples instead.\n");
+
+PyObject *
+Tree_walk(Tree *self, PyObject *args, PyObject *kwds)
+{
+    tree_walk_payload walk = {NULL, 0, 0, 0, ""};
+    git_treewalk_mode walk_mode = GIT_TREEWALK_PRE;
+    git_tree_entry *entry = NULL;
+    git_tree *tree = self->tree, *subtree = NULL;
+    TreeWalkIter *iter;
+    PyObject *py_types = NULL, *py_prefix = NULL;
+    char *mode = NULL, *prefix = NULL, *base = NULL;
+    size_t start, len;
+    int compact = 0, err = 0;
+    char *keywords[] = {"mode", "types", "prefix", "compact", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|zOOi", keywords, &mode,
+                                     &py_types, &py_prefix, &compact))
+        return NULL;
+
+    if (mode != NULL && strcmp(mode, "post") == 0)
+        walk_mode = GIT_TREEWALK_POST;
+    else if (mode != NULL && strcmp(mode, "pre") != 0) {
+        PyErr_SetString(PyExc_ValueError, "mode must be 'pre' or 'post'");
+        return NULL;
+    }
+
+    if (tree_walk_types(py_types, &walk.types) < 0)
+        return NULL;
+
+    if (py_prefix != NULL && py_prefix != Py_None) {
+        prefix = py_path_to_c_str(py_prefix);
+        if (prefix == NULL)
+            return NULL;
+
+        /* As with Walker paths, the prefix is relative to the top of the
+         * tree, so leading and trailing slashes are dropped */
+        start = strspn(prefix, "/");
+        len = strlen(prefix) - start;
+        memmove(prefix, prefix + start, len + 1);
+        while (len > 0 && prefix[len - 1] == '/')
+            prefix[--len] = '\0';
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    if (prefix != NULL && prefix[0] != '\0') {
+        /* Start from the subtree instead of filtering the whole walk */
+        err = git_tree_entry_bypath(&entry, tree, prefix);
+        if (err == GIT_ENOTFOUND) {
+            /* Only a missing prefix makes an empty walk, lookup errors
+             * further down are reported */
+            err = 0;
+            tree = NULL;
+        } else if (err == 0) {
+            base = malloc(strlen(prefix) + 2);
+            if (base == NULL) {
+                giterr_set_oom();
+                err = GIT_ERROR;
+            }
+        }
+
+        if (base != NULL && git_tree_entry_type(entry) == GIT_OBJ_TREE) {
+            strcpy(base, prefix);
+            strcat(base, "/");
+            walk.base = base;
+            err = git_tree_lookup(&subtree, self->repo->repo,
+                                  git_tree_entry_id(entry));
+            tree = subtree;
+        } else if (base != NULL) {
+            /* The prefix is not a directory, so it is the only match */
+            strcpy(base, prefix);
+            len = strrchr(base, '/') ? strrchr(base, '/') - base + 1 : 0;
+            base[len] = '\0';
+            walk.base = base;
+            err = tree_walk_add(&walk, "", entry);
+            tree = NULL;
+        }
+    }
+
+    if (err == 0 && tree != NULL)
+        err = git_tree_walk(tree, walk_mode, tree_walk_cb, &walk);
+    Py_END_ALLOW_THREADS
+
+    git_tree_free(subtree);
+    free(base);
+    free(prefix);
+    git_tree_entry_free(entry);
+
+    if (err < 0) {
+        tree_walk_free_items(walk.items, 0, walk.n);
         return Error_set(err);
+    }
+
+    iter = PyObject_New(TreeWalkIter, &TreeWalkIterType);
+    if (iter == NULL) {
+        tree_walk_free_items(walk.items, 0, walk.n);
+        return NULL;
+    }
 
-    return wrap_diff(diff, py_repo);
+    iter->items = walk.items;
+    iter->n = walk.n;
+    iter->i = 0;
+    iter->compact = compact;
+    return (PyObject*)iter;
 }
 
 
@@ -490,8 +796,9 @@ PyMappingMethods Tree_as_mapping = {
 
 PyMethodDef Tree_methods[] = {
     METHOD(Tree, diff_to_tree, METH_VARARGS | METH_KEYWORDS),
-    METHOD(Tree, diff_to_workdir, METH_VARARGS),
+    METHOD(Tree, diff_to_workdir, METH_VARARGS | METH_KEYWORDS),
     METHOD(Tree, diff_to_index, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Tree, walk, METH_VARARGS | METH_KEYWORDS),
     {NULL}
 };
 
@@ -598,3 +905,80 @@ PyTypeObject TreeIterType = {
     PyObject_SelfIter,                         /* tp_iter           */
     (iternextfunc)TreeIter_iternext,           /* tp_iternext       */
 };
+
+
+void
+TreeWalkIter_dealloc(TreeWalkIter *self)
+{
+    tree_walk_free_items(self->items, self->i, self->n);
+    PyObject_Del(self);
+}
+
+PyObject *
+TreeWalkIter_iternext(TreeWalkIter *self)
+{
+    git_tree_entry *entry;
+    PyObject *py_path, *py_entry, *py_result;
+
+    if (self->i == self->n)
+        return NULL;
+
+    entry = self->items[self->i].entry;
+    py_path = to_path(self->items[self->i].path);
+    free(self->items[self->i].path);
+    self->i++;
+    if (py_path == NULL) {
+        git_tree_entry_free(entry);
+        return NULL;
+    }
+
+    if (self->compact) {
+        py_result = Py_BuildValue("(NNi)", py_path,
+                                  git_oid_to_python(git_tree_entry_id(entry)),
+                                  (int)git_tree_entry_filemode(entry));
+        git_tree_entry_free(entry);
+        return py_result;
+    }
+
+    py_entry = (PyObject*)wrap_tree_entry(entry);
+    if (py_entry == NULL) {
+        git_tree_entry_free(entry);
+        Py_DECREF(py_path);
+        return NULL;
+    }
+
+    return Py_BuildValue("(NN)", py_path, py_entry);
+}
+
+
+PyDoc_STRVAR(TreeWalkIter__doc__, "Recursive tree iterator.");
+
+PyTypeObject TreeWalkIterType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_pygit2.TreeWalkIter",                    /* tp_name           */
+    sizeof(TreeWalkIter),                      /* tp_basicsize      */
+    0,                                         /* tp_itemsize       */
+    (destructor)TreeWalkIter_dealloc,          /* tp_dealloc        */
+    0,                                         /* tp_print          */
+    0,                                         /* tp_getattr        */
+    0,                                         /* tp_setattr        */
+    0,                                         /* tp_compare        */
+    0,                                         /* tp_repr           */
+    0,                                         /* tp_as_number      */
+    0,                                         /* tp_as_sequence    */
+    0,                                         /* tp_as_mapping     */
+    0,                                         /* tp_hash           */
+    0,                                         /* tp_call           */
+    0,                                         /* tp_str            */
+    0,                                         /* tp_getattro       */
+    0,                                         /* tp_setattro       */
+    0,                                         /* tp_as_buffer      */
+    Py_TPFLAGS_DEFAULT,                        /* tp_flags          */
+    TreeWalkIter__doc__,                       /* tp_doc            */
+    0,                                         /* tp_traverse       */
+    0,                                         /* tp_clear          */
+    0,                                         /* tp_richcompare    */
+    0,                                         /* tp_weaklistoffset */
+    PyObject_SelfIter,                         /* tp_iter           */
+    (iternextfunc)TreeWalkIter_iternext,       /* tp_iternext       */
+};
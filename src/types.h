@@ -99,8 +99,42 @@ typedef struct {
 } NoteIter;
 
 
+/* Native producer thread handing chunks over to Python, see utils.c */
+typedef struct {
+    PyThread_type_lock produced;
+    PyThread_type_lock consumed;
+    int started;
+    int done;
+    int stop;
+    int err;
+    int err_klass;
+    char *err_msg;
+} thread_handoff;
+
+
+/* git_odb_foreach */
+typedef struct {
+    PyObject_HEAD
+    Repository *repo;
+    git_odb *odb;
+    git_otype type;
+    size_t batch;
+    git_oid *oids;
+    size_t size;
+    size_t len;
+    size_t pos;
+    thread_handoff handoff;
+} OdbIter;
+
+
 /* git _diff */
-SIMPLE_TYPE(Diff, git_diff, list)
+typedef struct {
+    PyObject_HEAD
+    Repository *repo;
+    git_diff *list;
+    int busy;
+    int iterators;
+} Diff;
 
 typedef struct {
     PyObject_HEAD
@@ -109,23 +143,79 @@ typedef struct {
     size_t n;
 } DiffIter;
 
+/* Diff.iter_patches, see diff.c */
+typedef struct {
+    PyObject_HEAD
+    Diff *diff;
+    size_t n;
+    git_patch **ready;
+    size_t ready_len;
+    size_t pos;
+    size_t scheduled;
+} DiffPatches;
+
+/* Diff.patch_chunks, see diff.c */
+typedef struct {
+    PyObject_HEAD
+    Diff *diff;
+    char *buf;
+    size_t len;
+    size_t size;
+    thread_handoff handoff;
+} DiffPrintIter;
+
+/* Similarity signatures, see similarity.c */
+typedef struct SimilarityEntry SimilarityEntry;
+
 typedef struct {
     PyObject_HEAD
-    PyObject* hunks;
-    const char * old_file_path;
-    const char * new_file_path;
-    char* old_oid;
-    char* new_oid;
+    SimilarityEntry **buckets;
+    size_t nbuckets;
+    size_t count;
+    size_t size;
+    SimilarityEntry *newest;
+    SimilarityEntry *oldest;
+    size_t hits;
+    size_t misses;
+    PyThread_type_lock lock;
+} SimilarityCache;
+
+typedef struct {
+    char *path;
+    size_t insertions;
+    size_t deletions;
+} DiffStatsFile;
+
+typedef struct {
+    PyObject_HEAD
+    DiffStatsFile *files;
+    size_t n;
+    size_t size;
+    size_t insertions;
+    size_t deletions;
+} DiffStats;
+
+typedef struct {
+    PyObject_HEAD
+    git_patch *patch;
+    PyObject *owner;
+    char *old_file_path;
+    char *new_file_path;
+    git_oid old_oid;
+    git_oid new_oid;
     char status;
     unsigned similarity;
-    unsigned additions;
-    unsigned deletions;
     unsigned flags;
+    PyObject *hunks;
 } Patch;
 
 typedef struct {
     PyObject_HEAD
-    PyObject* lines;
+    Patch *patch;
+    PyObject *lines;
+    PyObject *raw_lines;
+    size_t idx;
+    size_t n;
     int old_start;
     int old_lines;
     int new_start;
@@ -147,9 +237,27 @@ typedef struct {
     int i;
 } TreeIter;
 
+typedef struct {
+    char *path;
+    git_tree_entry *entry;
+} TreeWalkItem;
+
+typedef struct {
+    PyObject_HEAD
+    TreeWalkItem *items;
+    size_t n;
+    size_t i;
+    int compact;
+} TreeWalkIter;
+
 
 /* git_index */
-SIMPLE_TYPE(Index, git_index, index)
+typedef struct {
+    PyObject_HEAD
+    Repository *repo;
+    git_index *index;
+    int busy;
+} Index;
 
 typedef struct {
     PyObject_HEAD
@@ -164,7 +272,34 @@ typedef struct {
 
 
 /* git_reference, git_reflog */
-SIMPLE_TYPE(Walker, git_revwalk, walk)
+typedef struct {
+    int flags;
+    git_time_t since;
+    git_time_t until;
+    Py_ssize_t max_count;
+    Py_ssize_t count;
+    int old;
+    int done;
+    char **authors;
+    size_t n_authors;
+    char **committers;
+    size_t n_committers;
+    char *message;
+} WalkerFilter;
+
+typedef struct {
+    PyObject_HEAD
+    Repository *repo;
+    git_revwalk *walk;
+    int mode;
+    int busy;
+    unsigned int sort;
+    WalkerFilter filter;
+    char **paths;
+    size_t n_paths;
+    int follow_renames;
+    char *followed;
+} Walker;
 
 SIMPLE_TYPE(Reference, git_reference, reference)
 
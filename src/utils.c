@@ -27,6 +27,8 @@
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <pythread.h>
+#include <string.h>
 #include "error.h"
 #include "utils.h"
 
@@ -104,6 +106,45 @@ get_pylist_from_git_strarray(git_strarray *strarray)
     return new_list;
 }
 
+/**
+ * Builds an array.array of the given type code from a C array, whose items
+ * must have the size of that type code.
+ */
+PyObject *
+get_pyarray_from_buffer(const char *typecode, const void *data, size_t size)
+{
+    PyObject *module, *array, *bytes, *ret;
+
+    module = PyImport_ImportModule("array");
+    if (module == NULL)
+        return NULL;
+
+    array = PyObject_CallMethod(module, "array", "s", typecode);
+    Py_DECREF(module);
+    if (array == NULL)
+        return NULL;
+
+    bytes = PyBytes_FromStringAndSize(data, size);
+    if (bytes == NULL)
+        goto error;
+
+#if PY_MAJOR_VERSION == 2
+    ret = PyObject_CallMethod(array, "fromstring", "O", bytes);
+#else
+    ret = PyObject_CallMethod(array, "frombytes", "O", bytes);
+#endif
+    Py_DECREF(bytes);
+    if (ret == NULL)
+        goto error;
+
+    Py_DECREF(ret);
+    return array;
+
+error:
+    Py_DECREF(array);
+    return NULL;
+}
+
 /**
  * Converts the Python list to struct git_strarray
  * returns -1 if conversion failed
@@ -216,18 +257,31 @@ cleanup:
     return err;
 }
 
+/**
+ * Calls the Python 'credentials' callable and converts its result to a
+ * git_cred. This is meant to be used from libgit2 callbacks, which run with
+ * the GIL released, so the GIL is taken here for the duration of the call.
+ */
 int
 callable_to_credentials(git_cred **out, const char *url, const char *username_from_url, unsigned int allowed_types, PyObject *credentials)
 {
-    int err;
+    int err = -1;
     PyObject *py_cred = NULL, *arglist = NULL;
+    PyGILState_STATE gil;
 
-    if (credentials == NULL || credentials == Py_None)
+    if (credentials == NULL)
         return 0;
 
+    gil = PyGILState_Ensure();
+
+    if (credentials == Py_None) {
+        err = 0;
+        goto out;
+    }
+
     if (!PyCallable_Check(credentials)) {
         PyErr_SetString(PyExc_TypeError, "credentials callback is not callable");
-        return -1;
+        goto out;
     }
 
     arglist = Py_BuildValue("(szI)", url, username_from_url, allowed_types);
@@ -235,10 +289,147 @@ callable_to_credentials(git_cred **out, const char *url, const char *username_fr
     Py_DECREF(arglist);
 
     if (!py_cred)
-        return -1;
+        goto out;
 
     err = py_cred_to_git_cred(out, py_cred, allowed_types);
     Py_DECREF(py_cred);
 
+out:
+    PyGILState_Release(gil);
     return err;
 }
+
+
+/*
+ * Some libgit2 walks (git_odb_foreach, git_diff_print) cannot be paused, so
+ * they run in a native thread which never touches Python, and hand their
+ * results over in chunks.  The two locks are used as binary semaphores: the
+ * producer releases "produced" once a chunk is ready (or the walk is over),
+ * then waits on "consumed" before it starts filling the chunk again.
+ */
+
+int
+thread_handoff_init(thread_handoff *handoff)
+{
+    handoff->started = 0;
+    handoff->done = 0;
+    handoff->stop = 0;
+    handoff->err = 0;
+    handoff->err_klass = 0;
+    handoff->err_msg = NULL;
+    handoff->produced = PyThread_allocate_lock();
+    handoff->consumed = PyThread_allocate_lock();
+    if (handoff->produced == NULL || handoff->consumed == NULL)
+        return -1;
+
+    /* Both start taken, a release is what signals the other side */
+    PyThread_acquire_lock(handoff->produced, WAIT_LOCK);
+    PyThread_acquire_lock(handoff->consumed, WAIT_LOCK);
+    return 0;
+}
+
+void
+thread_handoff_free(thread_handoff *handoff)
+{
+    if (handoff->produced != NULL)
+        PyThread_free_lock(handoff->produced);
+    if (handoff->consumed != NULL)
+        PyThread_free_lock(handoff->consumed);
+    free(handoff->err_msg);
+}
+
+/**
+ * Producer side: hand the current chunk over and wait until it has been
+ * consumed.  Returns non-zero if the producer should stop.
+ */
+int
+thread_handoff_put(thread_handoff *handoff)
+{
+    PyThread_release_lock(handoff->produced);
+    PyThread_acquire_lock(handoff->consumed, WAIT_LOCK);
+
+    return handoff->stop;
+}
+
+/**
+ * Producer side: the walk is over, this must be the last thing the
+ * producer thread does.
+ */
+void
+thread_handoff_done(thread_handoff *handoff, int err)
+{
+    const git_error *error;
+
+    /* Errors are thread local in libgit2, keep a copy for the consumer */
+    if (err < 0) {
+        error = giterr_last();
+        if (error != NULL) {
+            handoff->err_klass = error->klass;
+            handoff->err_msg = strdup(error->message);
+        }
+    }
+
+    handoff->err = err;
+    handoff->done = 1;
+    PyThread_release_lock(handoff->produced);
+}
+
+/**
+ * Consumer side: start the producer, or let it go on, then wait without
+ * the GIL for the next chunk.
+ */
+int
+thread_handoff_get(thread_handoff *handoff, void (*run)(void *), void *data)
+{
+    if (handoff->started) {
+        PyThread_release_lock(handoff->consumed);
+    } else {
+        if (PyThread_start_new_thread(run, data) == -1) {
+            PyErr_SetString(PyExc_RuntimeError, "can't start new thread");
+            return -1;
+        }
+        handoff->started = 1;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(handoff->produced, WAIT_LOCK);
+    Py_END_ALLOW_THREADS
+
+    return 0;
+}
+
+/**
+ * Consumer side: tell the producer to stop, and wait for it to let go.
+ */
+void
+thread_handoff_stop(thread_handoff *handoff)
+{
+    if (!handoff->started || handoff->done)
+        return;
+
+    handoff->stop = 1;
+    PyThread_release_lock(handoff->consumed);
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(handoff->produced, WAIT_LOCK);
+    Py_END_ALLOW_THREADS
+}
+
+/**
+ * Consumer side, once the producer is done: raise its error if it failed,
+ * StopIteration otherwise.  Always returns NULL.
+ */
+PyObject *
+thread_handoff_error(thread_handoff *handoff)
+{
+    int err = handoff->err;
+
+    if (err < 0) {
+        handoff->err = 0;
+        if (handoff->err_msg != NULL)
+            giterr_set_str(handoff->err_klass, handoff->err_msg);
+        return Error_set(err);
+    }
+
+    PyErr_SetNone(PyExc_StopIteration);
+    return NULL;
+}
@@ -116,12 +116,39 @@ const char *py_str_borrow_c_str(PyObject **tvaue, PyObject *value, const char *e
 
 PyObject * get_pylist_from_git_strarray(git_strarray *strarray);
 int get_strarraygit_from_pylist(git_strarray *array, PyObject *pylist);
+PyObject * get_pyarray_from_buffer(const char *typecode, const void *data,
+                                   size_t size);
+
+int thread_handoff_init(thread_handoff *handoff);
+void thread_handoff_free(thread_handoff *handoff);
+int thread_handoff_put(thread_handoff *handoff);
+void thread_handoff_done(thread_handoff *handoff, int err);
+int thread_handoff_get(thread_handoff *handoff, void (*run)(void *),
+                       void *data);
+void thread_handoff_stop(thread_handoff *handoff);
+PyObject * thread_handoff_error(thread_handoff *handoff);
 
 int callable_to_credentials(git_cred **out, const char *url, const char *username_from_url, unsigned int allowed_types, PyObject *credentials);
 
 #define py_path_to_c_str(py_path) \
         py_str_to_c_str(py_path, Py_FileSystemDefaultEncoding)
 
+/*
+ * Index, Diff and Walker objects use their libgit2 handle without the GIL
+ * in some methods. The handles are not thread safe, so the object is marked
+ * busy meanwhile and any other use of it, from another thread or from a
+ * callback, raises RuntimeError instead of racing inside libgit2.
+ */
+#define CHECK_BUSY(obj, retval)\
+  do {\
+      if ((obj)->busy) {\
+          PyErr_Format(PyExc_RuntimeError,\
+                       "%s object is in use by another thread or callback",\
+                       Py_TYPE(obj)->tp_name);\
+          return retval;\
+      }\
+  } while (0)
+
 /* Helpers to make shorter PyMethodDef and PyGetSetDef blocks */
 #define METHOD(type, name, args)\
   {#name, (PyCFunction) type ## _ ## name, args, type ## _ ## name ## __doc__}
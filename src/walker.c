@@ -27,6 +27,7 @@
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <string.h>
 #include "error.h"
 #include "utils.h"
 #include "oid.h"
@@ -35,11 +36,576 @@
 
 extern PyTypeObject CommitType;
 
+/*
+ * Like git log, a walk sorted by time stops once this many commits in a
+ * row are older than 'since', so a bit of clock skew does not end it early.
+ */
+#define WALKER_SINCE_SLOP 5
+
+void
+walker_filter_init(WalkerFilter *filter)
+{
+    memset(filter, 0, sizeof(WalkerFilter));
+    filter->max_count = -1;
+}
+
+static void
+walker_filter_free_strings(char **strings, size_t n)
+{
+    size_t i;
+
+    if (strings == NULL)
+        return;
+
+    for (i = 0; i < n; i++)
+        free(strings[i]);
+    free(strings);
+}
+
+void
+walker_filter_free(WalkerFilter *filter)
+{
+    walker_filter_free_strings(filter->authors, filter->n_authors);
+    walker_filter_free_strings(filter->committers, filter->n_committers);
+    free(filter->message);
+    walker_filter_init(filter);
+}
+
+static int
+walker_strcmp(const void *a, const void *b)
+{
+    return strcmp(*(char * const *)a, *(char * const *)b);
+}
+
+/*
+ * Convert a string, or an iterable of strings, to a sorted array of C
+ * strings, to be searched with bsearch.
+ */
+static int
+walker_filter_strings(char ***out, size_t *n, PyObject *py_strings)
+{
+    PyObject *py_seq, *py_item;
+    char **strings;
+    Py_ssize_t i, size;
+
+    if (py_strings == NULL || py_strings == Py_None)
+        return 0;
+
+    if (PyBytes_Check(py_strings) || PyUnicode_Check(py_strings))
+        py_seq = Py_BuildValue("(O)", py_strings);
+    else
+        py_seq = PySequence_Fast(py_strings, "expected a set of emails");
+    if (py_seq == NULL)
+        return -1;
+
+    size = PySequence_Fast_GET_SIZE(py_seq);
+    strings = calloc(size ? size : 1, sizeof(char *));
+    if (strings == NULL) {
+        Py_DECREF(py_seq);
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    for (i = 0; i < size; i++) {
+        py_item = PySequence_Fast_GET_ITEM(py_seq, i);
+        strings[i] = py_str_to_c_str(py_item, NULL);
+        if (strings[i] == NULL) {
+            walker_filter_free_strings(strings, i);
+            Py_DECREF(py_seq);
+            return -1;
+        }
+    }
+    Py_DECREF(py_seq);
+
+    qsort(strings, size, sizeof(char *), walker_strcmp);
+    *out = strings;
+    *n = size;
+    return 0;
+}
+
+static int
+walker_filter_time(git_time_t *out, int *flags, int flag, PyObject *py_time)
+{
+    PY_LONG_LONG time;
+
+    if (py_time == NULL || py_time == Py_None)
+        return 0;
+
+    time = PyLong_AsLongLong(py_time);
+    if (time == -1 && PyErr_Occurred())
+        return -1;
+
+    *out = time;
+    *flags |= flag;
+    return 0;
+}
+
+int
+walker_set_filter(Walker *self, PyObject *py_since, PyObject *py_until,
+                  PyObject *py_max_count, PyObject *py_authors,
+                  PyObject *py_committers, PyObject *py_message)
+{
+    WalkerFilter filter;
+
+    walker_filter_init(&filter);
+
+    if (walker_filter_time(&filter.since, &filter.flags, WALKER_SINCE,
+                           py_since) < 0)
+        goto error;
+    if (walker_filter_time(&filter.until, &filter.flags, WALKER_UNTIL,
+                           py_until) < 0)
+        goto error;
+
+    if (py_max_count != NULL && py_max_count != Py_None) {
+        filter.max_count = PyLong_AsSsize_t(py_max_count);
+        if (filter.max_count == -1 && PyErr_Occurred())
+            goto error;
+        if (filter.max_count < 0) {
+            PyErr_SetString(PyExc_ValueError, "max_count must be non-negative");
+            goto error;
+        }
+    }
+
+    if (walker_filter_strings(&filter.authors, &filter.n_authors,
+                              py_authors) < 0)
+        goto error;
+    if (walker_filter_strings(&filter.committers, &filter.n_committers,
+                              py_committers) < 0)
+        goto error;
+
+    if (py_message != NULL && py_message != Py_None) {
+        filter.message = py_str_to_c_str(py_message, NULL);
+        if (filter.message == NULL)
+            goto error;
+    }
+
+    walker_filter_free(&self->filter);
+    self->filter = filter;
+    return 0;
+
+error:
+    walker_filter_free(&filter);
+    return -1;
+}
+
+static int
+walker_filter_needs_commit(WalkerFilter *filter)
+{
+    return (filter->flags & (WALKER_SINCE | WALKER_UNTIL)) ||
+           filter->authors != NULL || filter->committers != NULL ||
+           filter->message != NULL;
+}
+
+static int
+walker_has_email(char **emails, size_t n, const git_signature *signature)
+{
+    const char *email = signature->email;
+
+    return bsearch(&email, emails, n, sizeof(char *), walker_strcmp) != NULL;
+}
+
+static int
+walker_filter_match(Walker *self, const git_commit *commit)
+{
+    WalkerFilter *filter = &self->filter;
+    git_time_t time;
+    const char *message;
+
+    time = git_commit_time(commit);
+    if ((filter->flags & WALKER_UNTIL) && time > filter->until)
+        return 0;
+
+    if (filter->flags & WALKER_SINCE) {
+        if (time < filter->since) {
+            /* Only a walk sorted by time alone yields newest first */
+            if ((self->sort & (GIT_SORT_TOPOLOGICAL | GIT_SORT_TIME |
+                               GIT_SORT_REVERSE)) == GIT_SORT_TIME &&
+                ++filter->old >= WALKER_SINCE_SLOP)
+                filter->done = 1;
+            return 0;
+        }
+        filter->old = 0;
+    }
+
+    if (filter->authors != NULL &&
+        !walker_has_email(filter->authors, filter->n_authors,
+                          git_commit_author(commit)))
+        return 0;
+
+    if (filter->committers != NULL &&
+        !walker_has_email(filter->committers, filter->n_committers,
+                          git_commit_committer(commit)))
+        return 0;
+
+    if (filter->message != NULL) {
+        message = git_commit_message(commit);
+        if (message == NULL || strstr(message, filter->message) == NULL)
+            return 0;
+    }
+
+    return 1;
+}
+
+/*
+ * Whether the entry at 'path' differs between the trees 'a' and 'b' (either
+ * may be NULL). The path is followed one directory at a time, and the walk
+ * down stops as soon as both sides have the same subtree oid.
+ */
+static int
+walker_path_changed(git_repository *repo, const git_oid *a, const git_oid *b,
+                    const char *path, char *name)
+{
+    const git_oid *oids[2] = {a, b};
+    git_oid next[2];
+    unsigned int modes[2] = {0, 0};
+    const git_tree_entry *entry;
+    git_tree *tree;
+    size_t len;
+    int i, err;
+
+    while (1) {
+        if (oids[0] == NULL && oids[1] == NULL)
+            return 0;
+        if (oids[0] != NULL && oids[1] != NULL &&
+            git_oid_equal(oids[0], oids[1]) && modes[0] == modes[1])
+            return 0;
+        if (*path == '\0')
+            return 1;
+
+        /* The next path component */
+        len = strcspn(path, "/");
+        memcpy(name, path, len);
+        name[len] = '\0';
+        path += len;
+        while (*path == '/')
+            path++;
+
+        for (i = 0; i < 2; i++) {
+            if (oids[i] == NULL)
+                continue;
+
+            err = git_tree_lookup(&tree, repo, oids[i]);
+            if (err < 0)
+                return err;
+
+            entry = git_tree_entry_byname(tree, name);
+            if (entry != NULL &&
+                (*path == '\0' || git_tree_entry_type(entry) == GIT_OBJ_TREE)) {
+                git_oid_cpy(&next[i], git_tree_entry_id(entry));
+                modes[i] = git_tree_entry_filemode(entry);
+                oids[i] = &next[i];
+            } else {
+                oids[i] = NULL;
+            }
+            git_tree_free(tree);
+        }
+    }
+}
+
+static const char *
+walker_path(Walker *self, size_t i)
+{
+    return (i == 0 && self->followed != NULL) ? self->followed : self->paths[i];
+}
+
+static int
+walker_paths_changed(Walker *self, const git_oid *a, const git_oid *b,
+                     char *name)
+{
+    size_t i;
+    int changed;
+
+    for (i = 0; i < self->n_paths; i++) {
+        changed = walker_path_changed(self->repo->repo, a, b,
+                                      walker_path(self, i), name);
+        if (changed != 0)
+            return changed;
+    }
+
+    return 0;
+}
+
+/*
+ * When following renames and the path is added by the commit, look for
+ * the path it was renamed from, and follow that one from now on.
+ */
+static int
+walker_follow_rename(Walker *self, git_commit *commit, git_commit *parent)
+{
+    git_tree *tree = NULL, *parent_tree = NULL;
+    git_tree_entry *entry;
+    git_diff *diff = NULL;
+    git_diff_find_options opts = GIT_DIFF_FIND_OPTIONS_INIT;
+    const git_diff_delta *delta;
+    const char *path = walker_path(self, 0);
+    char *old_path;
+    size_t i, n;
+    int err;
+
+    err = git_commit_tree(&parent_tree, parent);
+    if (err < 0)
+        goto cleanup;
+
+    err = git_tree_entry_bypath(&entry, parent_tree, path);
+    if (err == 0) {
+        /* Not added by this commit */
+        git_tree_entry_free(entry);
+        goto cleanup;
+    }
+    if (err != GIT_ENOTFOUND)
+        goto cleanup;
+
+    err = git_commit_tree(&tree, commit);
+    if (err < 0)
+        goto cleanup;
+
+    err = git_diff_tree_to_tree(&diff, self->repo->repo, parent_tree, tree,
+                                NULL);
+    if (err < 0)
+        goto cleanup;
+
+    opts.flags = GIT_DIFF_FIND_RENAMES;
+    err = git_diff_find_similar(diff, &opts);
+    if (err < 0)
+        goto cleanup;
+
+    n = git_diff_num_deltas(diff);
+    for (i = 0; i < n; i++) {
+        delta = git_diff_get_delta(diff, i);
+        if (delta->status == GIT_DELTA_RENAMED &&
+            strcmp(delta->new_file.path, path) == 0) {
+            old_path = strdup(delta->old_file.path);
+            if (old_path == NULL) {
+                err = GIT_ERROR;
+                giterr_set_oom();
+                goto cleanup;
+            }
+            free(self->followed);
+            self->followed = old_path;
+            break;
+        }
+    }
+
+cleanup:
+    git_diff_free(diff);
+    git_tree_free(tree);
+    git_tree_free(parent_tree);
+    return err;
+}
+
+/*
+ * Whether the commit touches the paths. Like git log, a merge is left out
+ * if the paths are the same as in any of its parents.
+ */
+static int
+walker_paths_match(Walker *self, git_commit *commit)
+{
+    git_commit *parent;
+    unsigned int i, n;
+    size_t size = 0;
+    char *name;
+    int err = 0;
+
+    for (i = 0; i < self->n_paths; i++)
+        if (strlen(walker_path(self, i)) > size)
+            size = strlen(walker_path(self, i));
+
+    name = malloc(size + 1);
+    if (name == NULL) {
+        giterr_set_oom();
+        return GIT_ERROR;
+    }
+
+    n = git_commit_parentcount(commit);
+    if (n == 0) {
+        err = walker_paths_changed(self, NULL, git_commit_tree_id(commit),
+                                   name);
+        goto cleanup;
+    }
+
+    for (i = 0; i < n; i++) {
+        err = git_commit_parent(&parent, commit, i);
+        if (err < 0)
+            goto cleanup;
+
+        err = walker_paths_changed(self, git_commit_tree_id(parent),
+                                   git_commit_tree_id(commit), name);
+        if (err > 0 && self->follow_renames && n == 1) {
+            err = walker_follow_rename(self, commit, parent);
+            if (err == 0)
+                err = 1;
+        }
+        git_commit_free(parent);
+        if (err <= 0)
+            goto cleanup;
+    }
+
+cleanup:
+    free(name);
+    return err;
+}
+
+/*
+ * Get the next commit matching the filter. The commit is only looked up,
+ * and kept, if 'want_commit' is true or the filter needs it. Called
+ * without the GIL.
+ */
+static int
+walker_next(Walker *self, git_oid *oid, git_commit **commit, int want_commit)
+{
+    WalkerFilter *filter = &self->filter;
+    int err, need_commit;
+
+    *commit = NULL;
+    need_commit = want_commit || self->paths != NULL ||
+                  walker_filter_needs_commit(filter);
+
+    while (1) {
+        if (filter->done)
+            return GIT_ITEROVER;
+        if (filter->max_count >= 0 && filter->count >= filter->max_count)
+            return GIT_ITEROVER;
+
+        err = git_revwalk_next(oid, self->walk);
+        if (err < 0)
+            return err;
+
+        if (!need_commit)
+            break;
+
+        err = git_commit_lookup(commit, self->repo->repo, oid);
+        if (err < 0)
+            return err;
+
+        if (walker_filter_match(self, *commit)) {
+            if (self->paths == NULL)
+                break;
+            err = walker_paths_match(self, *commit);
+            if (err < 0) {
+                git_commit_free(*commit);
+                *commit = NULL;
+                return err;
+            }
+            if (err > 0)
+                break;
+        }
+
+        git_commit_free(*commit);
+        *commit = NULL;
+    }
+
+    filter->count++;
+    if (!want_commit) {
+        git_commit_free(*commit);
+        *commit = NULL;
+    }
+
+    return 0;
+}
+
+static void
+walker_restart(Walker *self)
+{
+    self->filter.count = 0;
+    self->filter.old = 0;
+    self->filter.done = 0;
+
+    /* Start again from the path given, not the one it was renamed from */
+    free(self->followed);
+    self->followed = NULL;
+}
+
+void
+walker_paths_free(Walker *self)
+{
+    walker_filter_free_strings(self->paths, self->n_paths);
+    free(self->followed);
+    self->paths = NULL;
+    self->n_paths = 0;
+    self->follow_renames = 0;
+    self->followed = NULL;
+}
+
+int
+walker_set_paths(Walker *self, PyObject *py_paths, int follow_renames)
+{
+    PyObject *py_seq;
+    char **paths;
+    size_t i, n, len, start;
+
+    if (py_paths == NULL || py_paths == Py_None) {
+        walker_paths_free(self);
+        return 0;
+    }
+
+    if (PyBytes_Check(py_paths) || PyUnicode_Check(py_paths))
+        py_seq = Py_BuildValue("(O)", py_paths);
+    else
+        py_seq = PySequence_Fast(py_paths, "expected a list of paths");
+    if (py_seq == NULL)
+        return -1;
+
+    n = PySequence_Fast_GET_SIZE(py_seq);
+    if (n == 0) {
+        Py_DECREF(py_seq);
+        walker_paths_free(self);
+        return 0;
+    }
+
+    if (follow_renames && n != 1) {
+        Py_DECREF(py_seq);
+        PyErr_SetString(PyExc_ValueError,
+                        "follow_renames needs exactly one path");
+        return -1;
+    }
+
+    paths = calloc(n, sizeof(char *));
+    if (paths == NULL) {
+        Py_DECREF(py_seq);
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    for (i = 0; i < n; i++) {
+        paths[i] = py_path_to_c_str(PySequence_Fast_GET_ITEM(py_seq, i));
+        if (paths[i] == NULL)
+            goto error;
+
+        /* Paths are relative to the top of the tree, a leading slash would
+         * give an empty first component. Directories may be given with a
+         * trailing slash. */
+        start = strspn(paths[i], "/");
+        len = strlen(paths[i]) - start;
+        memmove(paths[i], paths[i] + start, len + 1);
+        while (len > 0 && paths[i][len - 1] == '/')
+            paths[i][--len] = '\0';
+        if (len == 0) {
+            PyErr_SetString(PyExc_ValueError, "empty path");
+            i++;
+            goto error;
+        }
+    }
+    Py_DECREF(py_seq);
+
+    walker_paths_free(self);
+    self->paths = paths;
+    self->n_paths = n;
+    self->follow_renames = follow_renames;
+    return 0;
+
+error:
+    walker_filter_free_strings(paths, i);
+    Py_DECREF(py_seq);
+    return -1;
+}
+
 void
 Walker_dealloc(Walker *self)
 {
     Py_CLEAR(self->repo);
     git_revwalk_free(self->walk);
+    walker_filter_free(&self->filter);
+    walker_paths_free(self);
     PyObject_Del(self);
 }
 
@@ -55,6 +621,8 @@ Walker_hide(Walker *self, PyObject *py_hex)
     int err;
     git_oid oid;
 
+    CHECK_BUSY(self, NULL);
+
     err = py_oid_to_git_oid_expand(self->repo->repo, py_hex, &oid);
     if (err < 0)
         return NULL;
@@ -78,6 +646,8 @@ Walker_push(Walker *self, PyObject *py_hex)
     int err;
     git_oid oid;
 
+    CHECK_BUSY(self, NULL);
+
     err = py_oid_to_git_oid_expand(self->repo->repo, py_hex, &oid);
     if (err < 0)
         return NULL;
@@ -90,6 +660,139 @@ Walker_push(Walker *self, PyObject *py_hex)
 }
 
 
+typedef int (*walker_str_cb)(git_revwalk *walk, const char *str);
+
+static PyObject *
+walker_push_str(Walker *self, PyObject *py_str, walker_str_cb cb)
+{
+    PyObject *tvalue;
+    const char *str;
+    int err;
+
+    CHECK_BUSY(self, NULL);
+
+    str = py_str_borrow_c_str(&tvalue, py_str, NULL);
+    if (str == NULL)
+        return NULL;
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = cb(self->walk, str);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+    if (err < 0) {
+        Error_set_str(err, str);
+        Py_DECREF(tvalue);
+        return NULL;
+    }
+
+    Py_DECREF(tvalue);
+    Py_RETURN_NONE;
+}
+
+
+PyDoc_STRVAR(Walker_push_range__doc__,
+  "push_range(range)\n"
+  "\n"
+  "Push and hide the ends of a range of commits, given in the 'A..B'\n"
+  "form: the commits reachable from B but not from A.");
+
+PyObject *
+Walker_push_range(Walker *self, PyObject *py_range)
+{
+    return walker_push_str(self, py_range, git_revwalk_push_range);
+}
+
+
+PyDoc_STRVAR(Walker_push_glob__doc__,
+  "push_glob(glob)\n"
+  "\n"
+  "Push the references matching the glob, e.g. 'refs/heads/*'. A glob not\n"
+  "starting with 'refs/' is taken relative to it.");
+
+PyObject *
+Walker_push_glob(Walker *self, PyObject *py_glob)
+{
+    return walker_push_str(self, py_glob, git_revwalk_push_glob);
+}
+
+
+PyDoc_STRVAR(Walker_hide_glob__doc__,
+  "hide_glob(glob)\n"
+  "\n"
+  "Hide the references matching the glob, see push_glob.");
+
+PyObject *
+Walker_hide_glob(Walker *self, PyObject *py_glob)
+{
+    return walker_push_str(self, py_glob, git_revwalk_hide_glob);
+}
+
+
+PyDoc_STRVAR(Walker_push_ref__doc__,
+  "push_ref(name)\n"
+  "\n"
+  "Push the commit the reference points to.");
+
+PyObject *
+Walker_push_ref(Walker *self, PyObject *py_name)
+{
+    return walker_push_str(self, py_name, git_revwalk_push_ref);
+}
+
+
+PyDoc_STRVAR(Walker_hide_ref__doc__,
+  "hide_ref(name)\n"
+  "\n"
+  "Hide the commit the reference points to.");
+
+PyObject *
+Walker_hide_ref(Walker *self, PyObject *py_name)
+{
+    return walker_push_str(self, py_name, git_revwalk_hide_ref);
+}
+
+
+PyDoc_STRVAR(Walker_push_head__doc__,
+  "push_head()\n"
+  "\n"
+  "Push the HEAD commit.");
+
+PyObject *
+Walker_push_head(Walker *self)
+{
+    int err;
+
+    CHECK_BUSY(self, NULL);
+
+    err = git_revwalk_push_head(self->walk);
+    if (err < 0)
+        return Error_set(err);
+
+    Py_RETURN_NONE;
+}
+
+
+PyDoc_STRVAR(Walker_hide_head__doc__,
+  "hide_head()\n"
+  "\n"
+  "Hide the HEAD commit.");
+
+PyObject *
+Walker_hide_head(Walker *self)
+{
+    int err;
+
+    CHECK_BUSY(self, NULL);
+
+    err = git_revwalk_hide_head(self->walk);
+    if (err < 0)
+        return Error_set(err);
+
+    Py_RETURN_NONE;
+}
+
+
 PyDoc_STRVAR(Walker_sort__doc__,
   "sort(mode)\n"
   "\n"
@@ -100,11 +803,15 @@ Walker_sort(Walker *self, PyObject *py_sort_mode)
 {
     int sort_mode;
 
+    CHECK_BUSY(self, NULL);
+
     sort_mode = (int)PyLong_AsLong(py_sort_mode);
     if (sort_mode == -1 && PyErr_Occurred())
         return NULL;
 
     git_revwalk_sorting(self->walk, sort_mode);
+    self->sort = sort_mode;
+    walker_restart(self);
 
     Py_RETURN_NONE;
 }
@@ -118,7 +825,10 @@ PyDoc_STRVAR(Walker_reset__doc__,
 PyObject *
 Walker_reset(Walker *self)
 {
+    CHECK_BUSY(self, NULL);
+
     git_revwalk_reset(self->walk);
+    walker_restart(self);
     Py_RETURN_NONE;
 }
 
@@ -130,10 +840,96 @@ PyDoc_STRVAR(Walker_simplify_first_parent__doc__,
 PyObject *
 Walker_simplify_first_parent(Walker *self)
 {
+    CHECK_BUSY(self, NULL);
+
     git_revwalk_simplify_first_parent(self->walk);
     Py_RETURN_NONE;
 }
 
+PyDoc_STRVAR(Walker_set_filter__doc__,
+  "set_filter(since=None, until=None, max_count=None, authors=None,\n"
+  "           committers=None, message=None)\n"
+  "\n"
+  "Only yield the commits matching all the given conditions. The filter is\n"
+  "evaluated in C, so the commits left out never become Python objects.\n"
+  "Calling set_filter again replaces the previous filter.\n"
+  "\n"
+  "Arguments:\n"
+  "\n"
+  "since, until\n"
+  "    Bounds, inclusive, on the committer time (seconds since the epoch).\n"
+  "    If the walk is sorted by time alone (GIT_SORT_TIME), it stops once\n"
+  "    it passes 'since'.\n"
+  "\n"
+  "max_count\n"
+  "    The maximum number of commits to yield.\n"
+  "\n"
+  "authors, committers\n"
+  "    Sets of emails; the author, or committer, email must be one of them.\n"
+  "\n"
+  "message\n"
+  "    A string that the commit message must contain.");
+
+PyObject *
+Walker_set_filter(Walker *self, PyObject *args, PyObject *kwds)
+{
+    char *keywords[] = {"since", "until", "max_count", "authors",
+                        "committers", "message", NULL};
+    PyObject *py_since = NULL, *py_until = NULL, *py_max_count = NULL;
+    PyObject *py_authors = NULL, *py_committers = NULL, *py_message = NULL;
+
+    CHECK_BUSY(self, NULL);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|OOOOOO", keywords,
+                                     &py_since, &py_until, &py_max_count,
+                                     &py_authors, &py_committers,
+                                     &py_message))
+        return NULL;
+
+    if (walker_set_filter(self, py_since, py_until, py_max_count,
+                          py_authors, py_committers, py_message) < 0)
+        return NULL;
+
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(Walker_set_paths__doc__,
+  "set_paths(paths, follow_renames=False)\n"
+  "\n"
+  "Only yield the commits that change the given files or directories, like\n"
+  "'git log -- paths'. A merge is left out if the paths are the same as in\n"
+  "one of its parents. The trees are compared one directory at a time,\n"
+  "so unchanged subtrees are skipped without being read. The paths are\n"
+  "relative to the top of the tree, leading and trailing slashes are\n"
+  "ignored. Pass None or an empty list to remove the limit.\n"
+  "\n"
+  "With follow_renames, the history of a single file is followed across\n"
+  "renames, like 'git log --follow'; this needs the walk to go from newer\n"
+  "to older commits, so it does not work with GIT_SORT_REVERSE.");
+
+PyObject *
+Walker_set_paths(Walker *self, PyObject *args, PyObject *kwds)
+{
+    char *keywords[] = {"paths", "follow_renames", NULL};
+    PyObject *py_paths, *py_follow = Py_False;
+    int follow;
+
+    CHECK_BUSY(self, NULL);
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|O", keywords,
+                                     &py_paths, &py_follow))
+        return NULL;
+
+    follow = PyObject_IsTrue(py_follow);
+    if (follow == -1)
+        return NULL;
+
+    if (walker_set_paths(self, py_paths, follow) < 0)
+        return NULL;
+
+    Py_RETURN_NONE;
+}
+
 PyObject *
 Walker_iter(Walker *self)
 {
@@ -141,42 +937,653 @@ Walker_iter(Walker *self)
     return (PyObject*)self;
 }
 
+static PyObject *
+walker_to_python(Walker *self, const git_oid *oid, git_commit *commit)
+{
+    Commit *py_commit;
+
+    if (self->mode == WALKER_OID)
+        return git_oid_to_python(oid);
+
+    if (self->mode == WALKER_RAW)
+        return PyBytes_FromStringAndSize((const char*)oid->id, GIT_OID_RAWSZ);
+
+    py_commit = PyObject_New(Commit, &CommitType);
+    if (py_commit == NULL) {
+        git_commit_free(commit);
+        return NULL;
+    }
+
+    py_commit->commit = commit;
+    Py_INCREF(self->repo);
+    py_commit->repo = self->repo;
+    return (PyObject*)py_commit;
+}
+
 PyObject *
 Walker_iternext(Walker *self)
 {
     int err;
-    git_commit *commit;
-    Commit *py_commit;
+    git_commit *commit = NULL;
     git_oid oid;
 
-    err = git_revwalk_next(&oid, self->walk);
-    if (err < 0)
-        return Error_set(err);
+    CHECK_BUSY(self, NULL);
 
-    err = git_commit_lookup(&commit, self->repo->repo, &oid);
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    err = walker_next(self, &oid, &commit, self->mode == WALKER_COMMIT);
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
     if (err < 0)
         return Error_set(err);
 
-    py_commit = PyObject_New(Commit, &CommitType);
-    if (py_commit) {
-        py_commit->commit = commit;
-        Py_INCREF(self->repo);
-        py_commit->repo = self->repo;
+    return walker_to_python(self, &oid, commit);
+}
+
+
+PyDoc_STRVAR(Walker_next_batch__doc__,
+  "next_batch(n) -> list or bytes\n"
+  "\n"
+  "Return the next n items of the walk at once, or less if the walk ends\n"
+  "before; an empty result means the walk is over. In 'raw' mode the ids\n"
+  "are returned packed in a single bytes string.");
+
+PyObject *
+Walker_next_batch(Walker *self, PyObject *args)
+{
+    Py_ssize_t n;
+    size_t i, count = 0;
+    git_oid *oids = NULL;
+    git_commit **commits = NULL, *commit;
+    PyObject *py_result = NULL, *py_item;
+    int err = 0;
+
+    CHECK_BUSY(self, NULL);
+
+    if (!PyArg_ParseTuple(args, "n", &n))
+        return NULL;
+
+    if (n < 0) {
+        PyErr_SetString(PyExc_ValueError, "n must be positive");
+        return NULL;
+    }
+
+    oids = malloc((n ? n : 1) * sizeof(git_oid));
+    if (oids == NULL)
+        return PyErr_NoMemory();
+
+    if (self->mode == WALKER_COMMIT) {
+        commits = calloc(n ? n : 1, sizeof(git_commit*));
+        if (commits == NULL) {
+            free(oids);
+            return PyErr_NoMemory();
+        }
+    }
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    while (count < (size_t)n) {
+        err = walker_next(self, &oids[count], &commit, commits != NULL);
+        if (err < 0)
+            break;
+        if (commits != NULL)
+            commits[count] = commit;
+        count++;
+    }
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+    if (err < 0 && err != GIT_ITEROVER) {
+        Error_set(err);
+        goto cleanup;
+    }
+
+    if (self->mode == WALKER_RAW) {
+        py_result = PyBytes_FromStringAndSize((const char*)oids,
+                                              count * GIT_OID_RAWSZ);
+        goto cleanup;
+    }
+
+    py_result = PyList_New(count);
+    if (py_result == NULL)
+        goto cleanup;
+
+    for (i = 0; i < count; i++) {
+        py_item = walker_to_python(self, &oids[i],
+                                   commits ? commits[i] : NULL);
+        if (commits)
+            commits[i] = NULL;
+        if (py_item == NULL) {
+            Py_CLEAR(py_result);
+            goto cleanup;
+        }
+        PyList_SET_ITEM(py_result, i, py_item);
+    }
+
+cleanup:
+    if (commits != NULL) {
+        for (i = 0; i < count; i++)
+            git_commit_free(commits[i]);
+        free(commits);
+    }
+    free(oids);
+    return py_result;
+}
+
+
+/*
+ * Walker.to_columns: the columns are filled in C buffers without the GIL,
+ * and turned into Python objects at the end.
+ */
+#if PY_VERSION_HEX >= 0x03030000
+# define COLUMN_INT_TYPECODE "q"
+typedef PY_LONG_LONG column_int;
+#else
+/* Arrays have no 'q' type before Python 3.3, 'l' is only 64 bits wide
+ * where long is */
+# define COLUMN_INT_TYPECODE "l"
+typedef long column_int;
+# if SIZEOF_LONG < 8
+#  define COLUMN_INT_UNSUPPORTED
+# endif
+#endif
+
+enum {
+    COLUMN_ID,
+    COLUMN_TREE_ID,
+    COLUMN_PARENTS,
+    COLUMN_COMMIT_TIME,
+    COLUMN_COMMIT_TIME_OFFSET,
+    COLUMN_AUTHOR_TIME,
+    COLUMN_AUTHOR_TIME_OFFSET,
+    COLUMN_AUTHOR_NAME,
+    COLUMN_AUTHOR_EMAIL,
+    COLUMN_COMMITTER_NAME,
+    COLUMN_COMMITTER_EMAIL,
+    COLUMN_COUNT
+};
+
+static const char *walker_column_names[] = {
+    "id", "tree_id", "parents", "commit_time", "commit_time_offset",
+    "author_time", "author_time_offset", "author_name", "author_email",
+    "committer_name", "committer_email", NULL};
+
+typedef struct {
+    char *data;
+    size_t size;
+    size_t alloc;
+} column_buffer;
+
+/* Interned strings, found through a hash table of codes + 1 */
+typedef struct {
+    char **strings;
+    size_t n;
+    size_t alloc;
+    size_t *slots;
+    size_t n_slots;
+} column_strings;
+
+typedef struct {
+    int wanted[COLUMN_COUNT];
+    column_buffer data[COLUMN_COUNT];
+    column_strings strings[COLUMN_COUNT];
+    column_buffer parent_offsets;
+    column_int n_parents;
+} walker_columns;
+
+static int
+column_append(column_buffer *buffer, const void *data, size_t size)
+{
+    size_t alloc;
+    char *new_data;
+
+    if (buffer->size + size > buffer->alloc) {
+        alloc = buffer->alloc ? buffer->alloc : 4096;
+        while (alloc < buffer->size + size)
+            alloc *= 2;
+        new_data = realloc(buffer->data, alloc);
+        if (new_data == NULL)
+            return -1;
+        buffer->data = new_data;
+        buffer->alloc = alloc;
+    }
+
+    memcpy(buffer->data + buffer->size, data, size);
+    buffer->size += size;
+    return 0;
+}
+
+static int
+column_append_int(column_buffer *buffer, column_int value)
+{
+    return column_append(buffer, &value, sizeof(column_int));
+}
+
+static size_t
+column_hash(const char *str)
+{
+    size_t hash = 2166136261u;
+
+    for (; *str; str++)
+        hash = (hash ^ (unsigned char)*str) * 16777619u;
+    return hash;
+}
+
+static int
+column_strings_grow(column_strings *strings)
+{
+    size_t *slots, n_slots, i, j;
+
+    n_slots = strings->n_slots ? strings->n_slots * 2 : 256;
+    slots = calloc(n_slots, sizeof(size_t));
+    if (slots == NULL)
+        return -1;
+
+    for (i = 0; i < strings->n; i++) {
+        j = column_hash(strings->strings[i]) & (n_slots - 1);
+        while (slots[j] != 0)
+            j = (j + 1) & (n_slots - 1);
+        slots[j] = i + 1;
+    }
+
+    free(strings->slots);
+    strings->slots = slots;
+    strings->n_slots = n_slots;
+    return 0;
+}
+
+/* Append the code of the string to the buffer, interning it if new */
+static int
+column_append_string(column_buffer *buffer, column_strings *strings,
+                     const char *str)
+{
+    size_t j, alloc;
+    unsigned int code;
+    char **new_strings;
+
+    if (strings->n * 2 >= strings->n_slots && column_strings_grow(strings) < 0)
+        return -1;
+
+    j = column_hash(str) & (strings->n_slots - 1);
+    while (strings->slots[j] != 0) {
+        if (strcmp(strings->strings[strings->slots[j] - 1], str) == 0)
+            break;
+        j = (j + 1) & (strings->n_slots - 1);
+    }
+
+    if (strings->slots[j] == 0) {
+        if (strings->n == strings->alloc) {
+            alloc = strings->alloc ? strings->alloc * 2 : 64;
+            new_strings = realloc(strings->strings, alloc * sizeof(char *));
+            if (new_strings == NULL)
+                return -1;
+            strings->strings = new_strings;
+            strings->alloc = alloc;
+        }
+        strings->strings[strings->n] = strdup(str);
+        if (strings->strings[strings->n] == NULL)
+            return -1;
+        strings->slots[j] = ++strings->n;
+    }
+
+    code = (unsigned int)(strings->slots[j] - 1);
+    return column_append(buffer, &code, sizeof(code));
+}
+
+static void
+walker_columns_free(walker_columns *columns)
+{
+    size_t i, j;
+
+    for (i = 0; i < COLUMN_COUNT; i++) {
+        free(columns->data[i].data);
+        for (j = 0; j < columns->strings[i].n; j++)
+            free(columns->strings[i].strings[j]);
+        free(columns->strings[i].strings);
+        free(columns->strings[i].slots);
+    }
+    free(columns->parent_offsets.data);
+}
+
+static int
+walker_columns_add(walker_columns *columns, const git_oid *oid,
+                   const git_commit *commit)
+{
+    column_buffer *data = columns->data;
+    column_strings *strings = columns->strings;
+    const git_signature *author, *committer;
+    unsigned int i, n;
+
+    author = git_commit_author(commit);
+    committer = git_commit_committer(commit);
+
+#define WANTED(column) (columns->wanted[column])
+    if (WANTED(COLUMN_ID) &&
+        column_append(&data[COLUMN_ID], oid->id, GIT_OID_RAWSZ) < 0)
+        return -1;
+    if (WANTED(COLUMN_TREE_ID) &&
+        column_append(&data[COLUMN_TREE_ID], git_commit_tree_id(commit)->id,
+                      GIT_OID_RAWSZ) < 0)
+        return -1;
+    if (WANTED(COLUMN_PARENTS)) {
+        n = git_commit_parentcount(commit);
+        for (i = 0; i < n; i++)
+            if (column_append(&data[COLUMN_PARENTS],
+                              git_commit_parent_id(commit, i)->id,
+                              GIT_OID_RAWSZ) < 0)
+                return -1;
+        columns->n_parents += n;
+        if (column_append_int(&columns->parent_offsets,
+                              columns->n_parents) < 0)
+            return -1;
+    }
+    if (WANTED(COLUMN_COMMIT_TIME) &&
+        column_append_int(&data[COLUMN_COMMIT_TIME],
+                          git_commit_time(commit)) < 0)
+        return -1;
+    if (WANTED(COLUMN_COMMIT_TIME_OFFSET) &&
+        column_append_int(&data[COLUMN_COMMIT_TIME_OFFSET],
+                          git_commit_time_offset(commit)) < 0)
+        return -1;
+    if (WANTED(COLUMN_AUTHOR_TIME) &&
+        column_append_int(&data[COLUMN_AUTHOR_TIME], author->when.time) < 0)
+        return -1;
+    if (WANTED(COLUMN_AUTHOR_TIME_OFFSET) &&
+        column_append_int(&data[COLUMN_AUTHOR_TIME_OFFSET],
+                          author->when.offset) < 0)
+        return -1;
+    if (WANTED(COLUMN_AUTHOR_NAME) &&
+        column_append_string(&data[COLUMN_AUTHOR_NAME],
+                             &strings[COLUMN_AUTHOR_NAME], author->name) < 0)
+        return -1;
+    if (WANTED(COLUMN_AUTHOR_EMAIL) &&
+        column_append_string(&data[COLUMN_AUTHOR_EMAIL],
+                             &strings[COLUMN_AUTHOR_EMAIL], author->email) < 0)
+        return -1;
+    if (WANTED(COLUMN_COMMITTER_NAME) &&
+        column_append_string(&data[COLUMN_COMMITTER_NAME],
+                             &strings[COLUMN_COMMITTER_NAME],
+                             committer->name) < 0)
+        return -1;
+    if (WANTED(COLUMN_COMMITTER_EMAIL) &&
+        column_append_string(&data[COLUMN_COMMITTER_EMAIL],
+                             &strings[COLUMN_COMMITTER_EMAIL],
+                             committer->email) < 0)
+        return -1;
+#undef WANTED
+
+    return 0;
+}
+
+static PyObject *
+walker_column_to_python(walker_columns *columns, int column)
+{
+    column_buffer *data = &columns->data[column];
+    column_strings *strings = &columns->strings[column];
+    PyObject *py_table, *py_string, *py_codes, *py_ids, *py_offsets;
+    size_t i;
+
+    switch (column) {
+        case COLUMN_ID:
+        case COLUMN_TREE_ID:
+            return PyBytes_FromStringAndSize(data->data, data->size);
+
+        case COLUMN_PARENTS:
+            py_offsets = get_pyarray_from_buffer(
+                COLUMN_INT_TYPECODE, columns->parent_offsets.data,
+                columns->parent_offsets.size);
+            if (py_offsets == NULL)
+                return NULL;
+            py_ids = PyBytes_FromStringAndSize(data->data, data->size);
+            if (py_ids == NULL) {
+                Py_DECREF(py_offsets);
+                return NULL;
+            }
+            return Py_BuildValue("(NN)", py_offsets, py_ids);
+
+        case COLUMN_AUTHOR_NAME:
+        case COLUMN_AUTHOR_EMAIL:
+        case COLUMN_COMMITTER_NAME:
+        case COLUMN_COMMITTER_EMAIL:
+            py_table = PyList_New(strings->n);
+            if (py_table == NULL)
+                return NULL;
+            for (i = 0; i < strings->n; i++) {
+                py_string = to_unicode(strings->strings[i], NULL, NULL);
+                if (py_string == NULL) {
+                    Py_DECREF(py_table);
+                    return NULL;
+                }
+                PyList_SET_ITEM(py_table, i, py_string);
+            }
+            py_codes = get_pyarray_from_buffer("I", data->data, data->size);
+            if (py_codes == NULL) {
+                Py_DECREF(py_table);
+                return NULL;
+            }
+            return Py_BuildValue("(NN)", py_codes, py_table);
+
+        default:
+            return get_pyarray_from_buffer(COLUMN_INT_TYPECODE, data->data,
+                                           data->size);
     }
-    return (PyObject*)py_commit;
+}
+
+
+PyDoc_STRVAR(Walker_to_columns__doc__,
+  "to_columns(fields=None) -> dict\n"
+  "\n"
+  "Walk the remaining commits and return their metadata as columns, in a\n"
+  "dictionary with one item per field, all the fields if not given:\n"
+  "\n"
+  "id, tree_id\n"
+  "    The ids packed in a bytes string, 20 bytes each.\n"
+  "\n"
+  "parents\n"
+  "    A tuple (offsets, ids): the parent ids of the commit i are packed\n"
+  "    in ids, from offsets[i] to offsets[i + 1] times 20 bytes.\n"
+  "\n"
+  "commit_time, commit_time_offset, author_time, author_time_offset\n"
+  "    Arrays of 64 bits integers; the offsets are in minutes.\n"
+  "\n"
+  "author_name, author_email, committer_name, committer_email\n"
+  "    A tuple (codes, table): the value for the commit i is\n"
+  "    table[codes[i]], each string appears once in the table.\n"
+  "\n"
+  "The walk and the columns are built without holding the GIL, and no\n"
+  "Commit nor Signature objects are created. The filter and the paths set\n"
+  "on the walker apply.\n"
+  "\n"
+  "Before Python 3.3 the arrays use the 'l' type, and NotImplementedError\n"
+  "is raised on the platforms where it is not 64 bits wide.");
+
+PyObject *
+Walker_to_columns(Walker *self, PyObject *args, PyObject *kwds)
+{
+    char *keywords[] = {"fields", NULL};
+    walker_columns columns;
+    PyObject *py_fields = Py_None, *py_seq, *py_result = NULL, *py_column;
+    const char *name;
+    git_commit *commit;
+    git_oid oid;
+    Py_ssize_t i, n;
+    int column, err = 0, nomem = 0;
+
+    CHECK_BUSY(self, NULL);
+
+#ifdef COLUMN_INT_UNSUPPORTED
+    PyErr_SetString(PyExc_NotImplementedError,
+                    "to_columns needs 64 bits integer arrays, which this "
+                    "Python only has from version 3.3");
+    return NULL;
+#endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|O", keywords, &py_fields))
+        return NULL;
+
+    memset(&columns, 0, sizeof(walker_columns));
+
+    if (py_fields == Py_None) {
+        for (column = 0; column < COLUMN_COUNT; column++)
+            columns.wanted[column] = 1;
+    } else {
+        py_seq = PySequence_Fast(py_fields, "fields must be a list");
+        if (py_seq == NULL)
+            return NULL;
+        n = PySequence_Fast_GET_SIZE(py_seq);
+        for (i = 0; i < n; i++) {
+            name = py_str_borrow_c_str(&py_column,
+                                       PySequence_Fast_GET_ITEM(py_seq, i),
+                                       NULL);
+            if (name == NULL) {
+                Py_DECREF(py_seq);
+                return NULL;
+            }
+            for (column = 0; column < COLUMN_COUNT; column++)
+                if (strcmp(name, walker_column_names[column]) == 0)
+                    break;
+            if (column == COLUMN_COUNT) {
+                PyErr_Format(PyExc_ValueError, "unknown field '%s'", name);
+                Py_DECREF(py_column);
+                Py_DECREF(py_seq);
+                return NULL;
+            }
+            columns.wanted[column] = 1;
+            Py_DECREF(py_column);
+        }
+        Py_DECREF(py_seq);
+    }
+
+    if (columns.wanted[COLUMN_PARENTS] &&
+        column_append_int(&columns.parent_offsets, 0) < 0) {
+        PyErr_NoMemory();
+        goto cleanup;
+    }
+
+    self->busy = 1;
+    Py_BEGIN_ALLOW_THREADS
+    while (1) {
+        err = walker_next(self, &oid, &commit, 1);
+        if (err < 0)
+            break;
+        nomem = walker_columns_add(&columns, &oid, commit) < 0;
+        git_commit_free(commit);
+        if (nomem)
+            break;
+    }
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+
+    if (nomem) {
+        PyErr_NoMemory();
+        goto cleanup;
+    }
+    if (err < 0 && err != GIT_ITEROVER) {
+        Error_set(err);
+        goto cleanup;
+    }
+
+    py_result = PyDict_New();
+    if (py_result == NULL)
+        goto cleanup;
+
+    for (column = 0; column < COLUMN_COUNT; column++) {
+        if (!columns.wanted[column])
+            continue;
+        py_column = walker_column_to_python(&columns, column);
+        if (py_column == NULL) {
+            Py_CLEAR(py_result);
+            goto cleanup;
+        }
+        err = PyDict_SetItemString(py_result, walker_column_names[column],
+                                   py_column);
+        Py_DECREF(py_column);
+        if (err < 0) {
+            Py_CLEAR(py_result);
+            goto cleanup;
+        }
+    }
+
+cleanup:
+    walker_columns_free(&columns);
+    return py_result;
+}
+
+
+PyDoc_STRVAR(Walker_mode__doc__,
+  "What the walker yields: 'commit' (the default) for Commit objects, 'oid'\n"
+  "for Oid objects, or 'raw' for 20 bytes raw ids. The 'oid' and 'raw'\n"
+  "modes do not load the commits.");
+
+static const char *walker_modes[] = {"commit", "oid", "raw", NULL};
+
+PyObject *
+Walker_mode__get__(Walker *self)
+{
+    return to_encoding(walker_modes[self->mode]);
+}
+
+int
+Walker_mode__set__(Walker *self, PyObject *py_mode)
+{
+    char *mode;
+    int i;
+
+    CHECK_BUSY(self, -1);
+
+    if (py_mode == NULL) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete mode");
+        return -1;
+    }
+
+    mode = py_str_to_c_str(py_mode, NULL);
+    if (mode == NULL)
+        return -1;
+
+    for (i = 0; walker_modes[i] != NULL; i++) {
+        if (strcmp(mode, walker_modes[i]) == 0) {
+            self->mode = i;
+            free(mode);
+            return 0;
+        }
+    }
+
+    PyErr_Format(PyExc_ValueError, "unknown walker mode '%s'", mode);
+    free(mode);
+    return -1;
 }
 
 PyMethodDef Walker_methods[] = {
     METHOD(Walker, hide, METH_O),
+    METHOD(Walker, hide_glob, METH_O),
+    METHOD(Walker, hide_head, METH_NOARGS),
+    METHOD(Walker, hide_ref, METH_O),
     METHOD(Walker, push, METH_O),
+    METHOD(Walker, push_glob, METH_O),
+    METHOD(Walker, push_head, METH_NOARGS),
+    METHOD(Walker, push_range, METH_O),
+    METHOD(Walker, push_ref, METH_O),
     METHOD(Walker, reset, METH_NOARGS),
     METHOD(Walker, simplify_first_parent, METH_NOARGS),
     METHOD(Walker, sort, METH_O),
+    METHOD(Walker, next_batch, METH_VARARGS),
+    METHOD(Walker, set_filter, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Walker, set_paths, METH_VARARGS | METH_KEYWORDS),
+    METHOD(Walker, to_columns, METH_VARARGS | METH_KEYWORDS),
+    {NULL}
+};
+
+PyGetSetDef Walker_getseters[] = {
+    GETSET(Walker, mode),
     {NULL}
 };
 
 
-PyDoc_STRVAR(Walker__doc__, "Revision walker.");
+PyDoc_STRVAR(Walker__doc__,
+  "Revision walker.\n"
+  "\n"
+  "Walker objects must not be shared between threads: while a method runs\n"
+  "without the GIL the object is busy, and using it meanwhile (from another\n"
+  "thread or a callback) raises RuntimeError.");
 
 PyTypeObject WalkerType = {
     PyVarObject_HEAD_INIT(NULL, 0)
@@ -208,7 +1615,7 @@ PyTypeObject WalkerType = {
     (iternextfunc)Walker_iternext,             /* tp_iternext       */
     Walker_methods,                            /* tp_methods        */
     0,                                         /* tp_members        */
-    0,                                         /* tp_getset         */
+    Walker_getseters,                          /* tp_getset         */
     0,                                         /* tp_base           */
     0,                                         /* tp_dict           */
     0,                                         /* tp_descr_get      */
@@ -33,12 +33,40 @@
 #include <git2.h>
 #include "types.h"
 
+/* What the walker yields */
+#define WALKER_COMMIT 0
+#define WALKER_OID 1
+#define WALKER_RAW 2
+
+/* WalkerFilter flags */
+#define WALKER_SINCE 1
+#define WALKER_UNTIL 2
+
+void walker_filter_init(WalkerFilter *filter);
+void walker_filter_free(WalkerFilter *filter);
+int walker_set_filter(Walker *self, PyObject *py_since, PyObject *py_until,
+                      PyObject *py_max_count, PyObject *py_authors,
+                      PyObject *py_committers, PyObject *py_message);
+void walker_paths_free(Walker *self);
+int walker_set_paths(Walker *self, PyObject *py_paths, int follow_renames);
+
 void Walker_dealloc(Walker *self);
 PyObject* Walker_hide(Walker *self, PyObject *py_hex);
 PyObject* Walker_push(Walker *self, PyObject *py_hex);
+PyObject* Walker_push_range(Walker *self, PyObject *py_range);
+PyObject* Walker_push_glob(Walker *self, PyObject *py_glob);
+PyObject* Walker_hide_glob(Walker *self, PyObject *py_glob);
+PyObject* Walker_push_ref(Walker *self, PyObject *py_name);
+PyObject* Walker_hide_ref(Walker *self, PyObject *py_name);
+PyObject* Walker_push_head(Walker *self);
+PyObject* Walker_hide_head(Walker *self);
 PyObject* Walker_sort(Walker *self, PyObject *py_sort_mode);
 PyObject* Walker_reset(Walker *self);
 PyObject* Walker_iter(Walker *self);
 PyObject* Walker_iternext(Walker *self);
+PyObject* Walker_next_batch(Walker *self, PyObject *args);
+PyObject* Walker_set_filter(Walker *self, PyObject *args, PyObject *kwds);
+PyObject* Walker_set_paths(Walker *self, PyObject *args, PyObject *kwds);
+PyObject* Walker_to_columns(Walker *self, PyObject *args, PyObject *kwds);
 
 #endif
@@ -30,6 +30,7 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 from os.path import dirname, join
+import io
 import unittest
 
 import pygit2
@@ -59,6 +60,15 @@ class BlobTest(utils.RepoTestCase):
         self.assertEqual(len(BLOB_CONTENT), blob.size)
         self.assertEqual(BLOB_CONTENT, blob.read_raw())
 
+    def test_blob_buffer(self):
+        blob = self.repo[BLOB_SHA]
+        view = memoryview(blob)
+        self.assertTrue(view.readonly)
+        self.assertEqual(len(view), blob.size)
+        self.assertEqual(view.tobytes(), BLOB_CONTENT)
+        del blob
+        self.assertEqual(view.tobytes(), BLOB_CONTENT)
+
     def test_create_blob(self):
         blob_oid = self.repo.create_blob(BLOB_NEW_CONTENT)
         blob = self.repo[blob_oid]
@@ -93,6 +103,32 @@ class BlobTest(utils.RepoTestCase):
         self.assertEqual(BLOB_FILE_CONTENT, blob.read_raw())
 
 
+    def test_create_blob_fromiobase(self):
+        data = BLOB_NEW_CONTENT * 10000
+        blob_oid = self.repo.create_blob_fromiobase(io.BytesIO(data))
+        self.assertEqual(utils.gen_blob_sha1(data), blob_oid.hex)
+        self.assertEqual(data, self.repo[blob_oid].data)
+
+        blob_oid = self.repo.create_blob_fromiobase(io.BytesIO(b''))
+        self.assertEqual(utils.gen_blob_sha1(b''), blob_oid.hex)
+        self.assertRaises(TypeError, self.repo.create_blob_fromiobase, 42)
+
+    def test_create_blob_fromiter(self):
+        chunks = [b'foo', b'', bytearray(b' bar'), b'\n' * 70000]
+        data = b''.join(chunks)
+        blob_oid = self.repo.create_blob_fromiter(iter(chunks))
+        self.assertEqual(utils.gen_blob_sha1(data), blob_oid.hex)
+        self.assertEqual(data, self.repo[blob_oid].data)
+
+    def test_create_blob_fromiter_error(self):
+        def chunks():
+            yield b'foo'
+            raise ValueError('broken')
+
+        self.assertRaises(ValueError, self.repo.create_blob_fromiter,
+                          chunks())
+        self.assertRaises(TypeError, self.repo.create_blob_fromiter, [42])
+
     def test_create_blob_outside_workdir(self):
         path = __file__
         self.assertRaises(KeyError, self.repo.create_blob_fromworkdir, path)
@@ -111,6 +147,30 @@ class BlobTest(utils.RepoTestCase):
         patch = blob.diff(old_blob, old_as_path="hello.txt")
         self.assertEqual(len(patch.hunks), 1)
 
+    def test_diff_blobs(self):
+        blob = self.repo[BLOB_SHA]
+        old_blob = self.repo['3b18e512dba79e4c8300dd08aeb37f8e728b8dad']
+        patch = blob.diff(old_blob, old_as_path="hello.txt")
+
+        pairs = [(blob, old_blob, 'hello.txt'),
+                 (None, BLOB_SHA, None),
+                 (blob.oid, None, 'hello.txt')]
+        stats = self.repo.diff_blobs(pairs)
+        self.assertEqual(stats, [(patch.additions, patch.deletions),
+                                 (3, 0), (0, 3)])
+
+        patches = self.repo.diff_blobs(pairs, patches=True)
+        self.assertEqual(len(patches), 3)
+        self.assertEqual(len(patches[0].hunks), 1)
+        self.assertEqual(patches[0].new_file_path, 'hello.txt')
+        self.assertEqual([p.additions for p in patches], [x[0] for x in stats])
+
+        self.assertEqual(len(self.repo.diff(blob, old_blob).hunks), 1)
+        self.assertEqual(
+            len(self.repo.diff(blob, old_blob, context_lines=0).hunks), 1)
+        self.assertRaises(TypeError, self.repo.diff, blob, old_blob,
+                          paths=['hello.txt'])
+
     def test_diff_blob_to_buffer(self):
         blob = self.repo[BLOB_SHA]
         patch = blob.diff_to_buffer("hello world")
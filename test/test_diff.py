@@ -29,6 +29,9 @@
 
 from __future__ import absolute_import
 from __future__ import unicode_literals
+import io
+import os
+import tempfile
 import unittest
 import pygit2
 from pygit2 import GIT_DIFF_INCLUDE_UNMODIFIED
@@ -217,6 +220,23 @@ class DiffTest(utils.BareRepoTestCase):
         self.assertTrue(diff is not None)
         self.assertEqual(1, len(diff[0].hunks))
 
+    def test_diff_tree_paths(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+
+        diff = commit_a.tree.diff_to_tree(commit_b.tree, paths=['c'])
+        self.assertEqual([p.new_file_path for p in diff], ['c/d'])
+
+        diff = self.repo.diff(COMMIT_SHA1_1, COMMIT_SHA1_2, paths=['a'])
+        self.assertEqual([p.new_file_path for p in diff], ['a'])
+
+    def test_diff_tree_prefix(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree, paths=['a'],
+                                          old_prefix='x', new_prefix='y')
+        self.assertTrue(diff.patch.startswith('diff --git x/a y/a\n'))
+
     def test_diff_merge(self):
         commit_a = self.repo[COMMIT_SHA1_1]
         commit_b = self.repo[COMMIT_SHA1_2]
@@ -257,6 +277,104 @@ class DiffTest(utils.BareRepoTestCase):
         self.assertEqual(diff.patch, PATCH)
         self.assertEqual(len(diff), len([patch for patch in diff]))
 
+    def test_diff_stats(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        stats = commit_a.tree.diff_to_tree(commit_b.tree).stats
+        self.assertEqual(stats.files_changed, 2)
+        self.assertEqual(stats.insertions, 1)
+        self.assertEqual(stats.deletions, 2)
+        self.assertEqual(stats.files, [('a', 1, 1), ('c/d', 0, 1)])
+
+    def test_diff_deltas(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree)
+        deltas = list(diff.deltas)
+        self.assertEqual(len(deltas), len(diff))
+
+        status, old_path, new_path, old_oid, new_oid, similarity = deltas[0]
+        self.assertEqual(status, 'M')
+        self.assertEqual(old_path, 'a')
+        self.assertEqual(new_path, 'a')
+        self.assertEqual(old_oid.hex,
+                         '7f129fd57e31e935c6d60a0c794efe4e6927664b')
+        self.assertEqual(new_oid.hex,
+                         'af431f20fc541ed6d5afede3e2dc7160f6f01f16')
+        self.assertEqual(similarity, 0)
+        self.assertEqual(deltas[1][0], 'D')
+
+    def test_diff_iter_patches(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree)
+        expected = [(p.new_file_path, p.additions, p.deletions) for p in diff]
+        patches = [(p.new_file_path, p.additions, p.deletions)
+                   for p in diff.iter_patches()]
+        self.assertEqual(patches, expected)
+
+    def test_diff_iter_patches_blocks_changes(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree)
+        patches = diff.iter_patches()
+        next(patches)
+        self.assertRaises(RuntimeError, diff.find_similar)
+        self.assertRaises(RuntimeError, diff.merge, diff)
+        del patches
+        diff.find_similar()
+
+    def test_diff_write_patch(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree)
+
+        out = io.BytesIO()
+        diff.write_patch(out)
+        self.assertEqual(out.getvalue(), PATCH.encode('utf-8'))
+
+        fd, path = tempfile.mkstemp()
+        try:
+            diff.write_patch(fd)
+            os.close(fd)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), PATCH.encode('utf-8'))
+        finally:
+            os.remove(path)
+
+    def test_diff_patch_chunks(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree)
+
+        chunks = list(diff.patch_chunks())
+        self.assertEqual(b''.join(chunks), PATCH.encode('utf-8'))
+
+        chunks = list(diff.patch_chunks(size=16))
+        self.assertAll(lambda x: 0 < len(x) <= 16, chunks)
+        self.assertEqual(b''.join(chunks), PATCH.encode('utf-8'))
+
+        # Dropping an unfinished iterator stops the printer
+        chunks = diff.patch_chunks(size=16)
+        next(chunks)
+        del chunks
+
+    def test_diff_patch_text_blocks_changes(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree)
+
+        chunks = diff.patch_chunks(size=16)
+        next(chunks)
+        self.assertRaises(RuntimeError, diff.find_similar)
+        del chunks
+        diff.find_similar()
+
+        class Writer(object):
+            def write(self, data):
+                diff.find_similar()
+        self.assertRaises(RuntimeError, diff.write_patch, Writer())
+
     def test_diff_oids(self):
         commit_a = self.repo[COMMIT_SHA1_1]
         commit_b = self.repo[COMMIT_SHA1_2]
@@ -274,6 +392,58 @@ class DiffTest(utils.BareRepoTestCase):
         lines = ('{0} {1}'.format(*x) for x in hunk.lines)
         self.assertEqual(HUNK_EXPECTED, ''.join(lines))
 
+    def test_hunk_lines_sequence(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        patch = commit_a.tree.diff_to_tree(commit_b.tree)[0]
+        hunk = patch.hunks[-1]
+        lines = hunk.lines
+        self.assertTrue(hunk is patch.hunks[-1])
+        self.assertTrue(lines is hunk.lines)
+        self.assertEqual(lines[-1:], tuple(lines)[-1:])
+        self.assertRaises(IndexError, lines.__getitem__, len(lines))
+        self.assertRaises(IndexError, patch.hunks.__getitem__, 1)
+
+    def test_hunk_raw_lines(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        patch = commit_a.tree.diff_to_tree(commit_b.tree)[0]
+        lines = patch.hunks[0].raw_lines
+        self.assertEqual(len(lines), 2)
+
+        line = lines[0]
+        self.assertEqual(line.origin, '-')
+        self.assertEqual(line.old_lineno, 1)
+        self.assertEqual(line.new_lineno, -1)
+        self.assertEqual(line.content, b'a contents 2\n')
+
+        origin, old_lineno, new_lineno, content, offset = lines[1]
+        self.assertEqual(origin, '+')
+        self.assertEqual((old_lineno, new_lineno), (-1, 1))
+        self.assertEqual(content, b'a contents\n')
+
+    def test_patch_outlives_diff(self):
+        commit_a = self.repo[COMMIT_SHA1_1]
+        commit_b = self.repo[COMMIT_SHA1_2]
+        patch = commit_a.tree.diff_to_tree(commit_b.tree)[0]
+        hunk = patch.hunks[0]
+        del patch
+        lines = ('{0} {1}'.format(*x) for x in hunk.lines)
+        self.assertEqual(HUNK_EXPECTED, ''.join(lines))
+
+    def test_patch_outlives_find_similar(self):
+        commit_a = self.repo[COMMIT_SHA1_6]
+        commit_b = self.repo[COMMIT_SHA1_7]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree,
+                                          GIT_DIFF_INCLUDE_UNMODIFIED)
+        patches = list(diff)
+        expected = [(p.old_file_path, p.new_file_path, p.status, p.old_oid)
+                    for p in patches]
+        diff.find_similar()
+        self.assertEqual(expected,
+                         [(p.old_file_path, p.new_file_path, p.status,
+                           p.old_oid) for p in patches])
+
     def test_find_similar(self):
         commit_a = self.repo[COMMIT_SHA1_6]
         commit_b = self.repo[COMMIT_SHA1_7]
@@ -286,5 +456,86 @@ class DiffTest(utils.BareRepoTestCase):
         diff.find_similar()
         self.assertAny(lambda x: x.status == 'R', diff)
 
+        diff = commit_a.tree.diff_to_tree(commit_b.tree,
+                                          GIT_DIFF_INCLUDE_UNMODIFIED,
+                                          find_similar=0)
+        self.assertAny(lambda x: x.status == 'R', diff)
+
+    def test_find_similar_options(self):
+        commit_a = self.repo[COMMIT_SHA1_6]
+        commit_b = self.repo[COMMIT_SHA1_7]
+        diff = commit_a.tree.diff_to_tree(commit_b.tree,
+                                          GIT_DIFF_INCLUDE_UNMODIFIED)
+        diff.find_similar(rename_threshold=50, copy_threshold=50,
+                          break_rewrite_threshold=60, rename_limit=10)
+        self.assertAny(lambda x: x.status == 'R', diff)
+        self.assertRaises(ValueError, diff.find_similar, rename_limit=-1)
+
+    def test_find_similar_cache(self):
+        commit_a = self.repo[COMMIT_SHA1_6]
+        commit_b = self.repo[COMMIT_SHA1_7]
+        cache = pygit2.SimilarityCache(size=100)
+        self.assertEqual(cache.size, 100)
+
+        diff = commit_a.tree.diff_to_tree(commit_b.tree,
+                                          GIT_DIFF_INCLUDE_UNMODIFIED)
+        diff.find_similar(cache=cache)
+        self.assertAny(lambda x: x.status == 'R', diff)
+        hits, misses = cache.hits, cache.misses
+        self.assertEqual(len(cache), misses)
+
+        # The same blobs again, all the signatures are reused
+        diff = commit_a.tree.diff_to_tree(commit_b.tree,
+                                          GIT_DIFF_INCLUDE_UNMODIFIED)
+        diff.find_similar(cache=cache)
+        self.assertAny(lambda x: x.status == 'R', diff)
+        self.assertEqual(cache.hits, 2 * hits + misses)
+        self.assertEqual(cache.misses, misses)
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+        # Without __init__ the cache is refused instead of crashing
+        cache = pygit2.SimilarityCache.__new__(pygit2.SimilarityCache)
+        self.assertRaises(RuntimeError, cache.clear)
+        self.assertRaises(RuntimeError, diff.find_similar, cache=cache)
+
+
+class DiffCacheTest(utils.BareRepoTestCase):
+
+    def test_diff_summary(self):
+        summary = self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2)
+        self.assertEqual(summary.files_changed, 2)
+        self.assertEqual(summary.insertions, 1)
+        self.assertEqual(summary.deletions, 2)
+        self.assertEqual(summary.files, (('a', 1, 1), ('c/d', 0, 1)))
+        self.assertEqual([d[2] for d in summary.deltas], ['a', 'c/d'])
+
+    def test_diff_cache(self):
+        cache = self.repo.enable_diff_cache(size=1)
+        summary = self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(
+            self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2), summary)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # The cached summary cannot be changed by its users
+        self.assertRaises(TypeError, summary.files.__setitem__, 0, None)
+
+        # Other options, other entry; the first one is evicted
+        self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2, paths=['a'])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(len(cache), 1)
+        self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_diff_cache_persistent(self):
+        self.repo.enable_diff_cache(persistent=True)
+        summary = self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2)
+
+        cache = self.repo.enable_diff_cache(persistent=True)
+        self.assertEqual(
+            self.repo.diff_summary(COMMIT_SHA1_1, COMMIT_SHA1_2), summary)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
 if __name__ == '__main__':
     unittest.main()
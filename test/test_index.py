@@ -31,10 +31,12 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import os
 import unittest
+from array import array
+from binascii import hexlify
 import tempfile
 
 import pygit2
-from pygit2 import Repository
+from pygit2 import Repository, GIT_FILEMODE_BLOB
 from . import utils
 
 
@@ -110,6 +112,83 @@ class IndexTest(utils.RepoTestCase):
         self.assertEqual(index['bye.txt'].hex, sha_bye)
         self.assertEqual(index['hello.txt'].hex, sha_hello)
 
+    def test_add_all_callback(self):
+        index = self.repo.index
+        index.clear()
+
+        batches = []
+        index.add_all('*.txt', callback=batches.append, batch_size=1)
+        self.assertEqual(batches, [['bye.txt'], ['hello.txt']])
+
+        index.clear()
+        batches = []
+        index.add_all(['*.txt'], pygit2.GIT_INDEX_ADD_DEFAULT, batches.append)
+        self.assertEqual(batches, [['bye.txt', 'hello.txt']])
+
+        def fail(paths):
+            raise ZeroDivisionError()
+        index.clear()
+        self.assertRaises(ZeroDivisionError, index.add_all, callback=fail)
+        self.assertRaises(ValueError, index.add_all, callback=fail,
+                          batch_size=0)
+
+    def test_busy(self):
+        index = self.repo.index
+        index.clear()
+
+        def reenter(paths):
+            len(index)
+        self.assertRaises(RuntimeError, index.add_all, callback=reenter,
+                          batch_size=1)
+        # The index is usable again once add_all returns
+        index.add_all('*.txt')
+        self.assertTrue('hello.txt' in index)
+
+    def test_update_all(self):
+        index = self.repo.index
+        os.remove(os.path.join(self.repo.workdir, 'hello.txt'))
+
+        batches = []
+        index.update_all('*.txt', callback=batches.append)
+        self.assertEqual(batches, [['hello.txt']])
+        self.assertFalse('hello.txt' in index)
+        # update_all does not add new files
+        self.assertFalse('bye.txt' in index)
+
+    def test_remove_all(self):
+        index = self.repo.index
+
+        batches = []
+        index.remove_all(['*.txt'], callback=batches.append)
+        self.assertEqual(batches, [['hello.txt']])
+        self.assertFalse('hello.txt' in index)
+        self.assertEqual(len(index), 1)
+
+    def test_add_entries(self):
+        index = self.repo.index
+        entries = list(index)
+        sha_bye = '0907563af06c7464d62a70cdd135a6ba7d2b41d8'
+        sha_hello = 'a520c24d85fbfc815d385957eed41406ca5a860b'
+
+        index.clear()
+        index.add_entries([
+            ('z/hello.txt', sha_hello, GIT_FILEMODE_BLOB),
+            ('bye.txt', sha_bye, GIT_FILEMODE_BLOB),
+            ('bye.txt', sha_hello, GIT_FILEMODE_BLOB)] + entries)
+
+        self.assertEqual(len(index), 4)
+        self.assertEqual(
+            [x.path for x in index],
+            sorted(['bye.txt', 'z/hello.txt'] + [x.path for x in entries]))
+        # The last entry for a path wins
+        self.assertEqual(index['bye.txt'].hex, sha_hello)
+        self.assertEqual(index['z/hello.txt'].hex, sha_hello)
+        self.assertEqual(index['z/hello.txt'].mode, GIT_FILEMODE_BLOB)
+        index.write_tree()
+
+        self.assertRaises(TypeError, index.add_entries, [('a.txt',)])
+        self.assertRaises(TypeError, index.add_entries, None)
+
     def test_clear(self):
         index = self.repo.index
         self.assertEqual(len(index), 2)
@@ -155,6 +234,25 @@ class IndexTest(utils.RepoTestCase):
         entries = [index[x].hex for x in range(n)]
         self.assertEqual(list(x.hex for x in index), entries)
 
+    def test_export(self):
+        index = self.repo.index
+        columns = index.export()
+        n = len(index)
+
+        self.assertEqual(columns['paths'], [x.path for x in index])
+        oids = columns['oids']
+        self.assertEqual(len(oids), 20 * n)
+        self.assertEqual(
+            [hexlify(oids[i * 20:(i + 1) * 20]).decode('ascii')
+             for i in range(n)],
+            [x.hex for x in index])
+
+        for name in ('mode', 'size', 'mtime', 'flags'):
+            self.assertTrue(isinstance(columns[name], array))
+            self.assertEqual(columns[name].typecode, 'I')
+            self.assertEqual(len(columns[name]), n)
+        self.assertEqual(list(columns['mode']), [x.mode for x in index])
+
     def test_mode(self):
         """
             Testing that we can access an index entry mode.
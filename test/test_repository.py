@@ -35,6 +35,7 @@ from __future__ import unicode_literals
 import binascii
 import unittest
 import tempfile
+import threading
 import os
 from os.path import join, realpath
 
@@ -84,6 +85,29 @@ class RepositoryTest(utils.BareRepoTestCase):
         a3 = self.repo.read(a_hex_prefix)
         self.assertEqual((GIT_OBJ_BLOB, b'a contents\n'), a3)
 
+    def test_read_header(self):
+        self.assertRaises(TypeError, self.repo.read_header, 123)
+        self.assertRaisesWithArg(KeyError, '1' * 40, self.repo.read_header,
+                                 '1' * 40)
+        self.assertEqual((GIT_OBJ_BLOB, 11), self.repo.read_header(BLOB_OID))
+        self.assertEqual((GIT_OBJ_BLOB, 11), self.repo.read_header(BLOB_HEX))
+        self.assertEqual((GIT_OBJ_BLOB, 11),
+                         self.repo.read_header(BLOB_HEX[:4]))
+
+    def test_read_headers(self):
+        a2 = '7f129fd57e31e935c6d60a0c794efe4e6927664b'
+        expected = [(GIT_OBJ_BLOB, 11), (GIT_OBJ_BLOB, 13),
+                    (GIT_OBJ_COMMIT, len(self.repo.read(HEAD_SHA)[1]))]
+        headers = self.repo.read_headers([BLOB_OID, a2, HEAD_SHA])
+        self.assertEqual(headers, expected)
+
+        raw = BLOB_RAW + binascii.unhexlify(a2.encode('ascii'))
+        self.assertEqual(self.repo.read_headers(raw), expected[:2])
+        self.assertEqual(self.repo.read_headers([]), [])
+        self.assertRaises(ValueError, self.repo.read_headers, b'x' * 21)
+        self.assertRaises(KeyError, self.repo.read_headers, [BLOB_HEX,
+                                                             '1' * 40])
+
     def test_write(self):
         data = b"hello world"
         # invalid object type
@@ -105,6 +129,40 @@ class RepositoryTest(utils.BareRepoTestCase):
         oid = Oid(hex=BLOB_HEX)
         self.assertTrue(oid in l)
 
+    def test_iter_oids(self):
+        oids = [oid.hex for oid in self.repo.iter_oids()]
+        self.assertEqual(sorted(oids), sorted(oid.hex for oid in self.repo))
+        self.assertTrue(BLOB_HEX in oids)
+
+    def test_iter_oids_type(self):
+        blobs = list(self.repo.iter_oids(GIT_OBJ_BLOB))
+        self.assertTrue(BLOB_OID in blobs)
+        for oid in blobs:
+            self.assertEqual(self.repo[oid].type, GIT_OBJ_BLOB)
+        commits = list(self.repo.iter_oids(type=GIT_OBJ_COMMIT))
+        self.assertTrue(Oid(hex=HEAD_SHA) in commits)
+        self.assertRaises(ValueError, self.repo.iter_oids, 42)
+
+    def test_iter_oids_batch(self):
+        chunks = list(self.repo.iter_oids(batch_size=3))
+        raw = b''.join(chunks)
+        self.assertTrue(all(0 < len(chunk) <= 60 for chunk in chunks))
+        oids = [Oid(raw=raw[i:i + 20]).hex for i in range(0, len(raw), 20)]
+        self.assertEqual(sorted(oids), sorted(oid.hex for oid in self.repo))
+        self.assertRaises(ValueError, self.repo.iter_oids, batch_size=0)
+        self.assertRaises(ValueError, self.repo.iter_oids, batch_size=-1)
+
+    def test_iter_oids_early_stop(self):
+        self.assertTrue(len(list(self.repo.iter_oids())) > 1)
+        it = self.repo.iter_oids(batch_size=1)
+        first = next(it)
+        self.assertEqual(len(first), 20)
+        # The walk stops there, the other ids are never handed over
+        it.close()
+        self.assertEqual(list(it), [])
+        it.close()
+        del it
+
     def test_lookup_blob(self):
         self.assertRaises(TypeError, lambda: self.repo[123])
         self.assertEqual(self.repo[BLOB_OID].hex, BLOB_HEX)
@@ -232,6 +290,25 @@ class RepositoryTest_II(utils.RepoTestCase):
         self.repo.checkout('HEAD', pygit2.GIT_CHECKOUT_FORCE)
         self.assertTrue('bye.txt' not in self.repo.status())
 
+    def test_status_threads(self):
+        # Each thread works on its own handle; libgit2 runs without the GIL
+        results = []
+
+        def run():
+            repo = pygit2.Repository(self.repo_path)
+            results.append(repo.status())
+
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = self.repo.status()
+        self.assertEqual(len(results), 4)
+        for status in results:
+            self.assertEqual(status, expected)
+
     def test_merge_base(self):
         commit = self.repo.merge_base(
             '5ebeeebb320790caf276b9fc8b24546d63316533',
@@ -29,9 +29,12 @@
 
 from __future__ import absolute_import
 from __future__ import unicode_literals
+import binascii
+import os
 import unittest
 
 from pygit2 import GIT_SORT_NONE, GIT_SORT_TIME, GIT_SORT_REVERSE
+from pygit2 import GIT_FILEMODE_BLOB, Signature, WalkCheckpoint
 from . import utils
 
 
@@ -43,6 +46,9 @@ log = [
     '6aaa262e655dd54252e5813c8e5acd7780ed097d',
     'acecd5ea2924a4b900e7e149496e1f4b57976e51']
 
+# The tip of the i18n branch, which is not merged into master
+I18N = '5470a671a80ac3789f1a6a8cefbcf43ce7af0563'
+
 REVLOGS = [
     ('Nico von Geyso', 'checkout: moving from i18n to master'),
     ('Nico von Geyso', 'commit: added bye.txt and new'),
@@ -97,6 +103,42 @@ class WalkerTest(utils.RepoTestCase):
         walker.push(log[0])
         self.assertEqual([x.hex for x in walker], log)
 
+    def test_push_range(self):
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_range('5ebeeebb..2be57191')
+        self.assertEqual([x.hex for x in walker], [log[0]] + log[2:4])
+
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_range('master..i18n')
+        self.assertEqual([x.hex for x in walker], [I18N])
+
+    def test_push_glob(self):
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_glob('refs/heads/*')
+        self.assertEqual([x.hex for x in walker], [I18N] + log)
+
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_glob('heads/*')
+        walker.hide_glob('heads/mas*')
+        self.assertEqual([x.hex for x in walker], [I18N])
+
+    def test_push_head_ref(self):
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_head()
+        self.assertEqual([x.hex for x in walker], log)
+
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_ref('refs/heads/i18n')
+        walker.hide_head()
+        self.assertEqual([x.hex for x in walker], [I18N])
+
+        walker = self.repo.walk(None, GIT_SORT_TIME)
+        walker.push_head()
+        walker.hide_ref('refs/heads/i18n')
+        self.assertEqual([x.hex for x in walker], log[:2])
+
+        self.assertRaises(KeyError, walker.push_ref, 'refs/heads/nothere')
+
     def test_sort(self):
         walker = self.repo.walk(log[0], GIT_SORT_TIME)
         walker.sort(GIT_SORT_TIME | GIT_SORT_REVERSE)
@@ -115,5 +157,207 @@ class WalkerTest(utils.RepoTestCase):
 
         self.assertEqual(list1, list2)
 
+    def test_mode_oid(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        self.assertEqual(walker.mode, 'commit')
+        walker.mode = 'oid'
+        self.assertEqual(walker.mode, 'oid')
+        self.assertEqual([x.hex for x in walker], log)
+
+    def test_mode_raw(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        walker.mode = 'raw'
+        self.assertEqual([binascii.hexlify(x).decode() for x in walker], log)
+
+    def test_mode_invalid(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        self.assertRaises(ValueError, setattr, walker, 'mode', 'tree')
+
+    def test_next_batch(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        self.assertEqual([x.hex for x in walker.next_batch(3)], log[:3])
+        walker.mode = 'oid'
+        self.assertEqual([x.hex for x in walker.next_batch(3)], log[3:])
+        self.assertEqual(walker.next_batch(3), [])
+
+    def test_next_batch_raw(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        walker.mode = 'raw'
+        raw = walker.next_batch(10)
+        self.assertEqual(binascii.hexlify(raw).decode(), ''.join(log))
+
+    def test_filter_time(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, since=1297696908)
+        self.assertEqual([x.hex for x in walker], log[:3])
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, until=1297696908)
+        self.assertEqual([x.hex for x in walker], log[2:])
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME | GIT_SORT_REVERSE,
+                                since=1297696877, until=1297696974)
+        self.assertEqual([x.hex for x in walker], list(reversed(log[1:4])))
+
+    def test_filter_max_count(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, max_count=2)
+        self.assertEqual([x.hex for x in walker], log[:2])
+        walker.reset()
+        walker.push(log[0])
+        walker.mode = 'oid'
+        self.assertEqual([x.hex for x in walker.next_batch(10)], log[:2])
+        self.assertRaises(ValueError, self.repo.walk, log[0], max_count=-1)
+
+    def test_filter_emails(self):
+        walker = self.repo.walk(I18N, GIT_SORT_TIME)
+        walker.set_filter(authors={'Nico.Geyso@FU-Berlin.de'})
+        self.assertEqual([x.hex for x in walker], [I18N])
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME,
+                                committers=['nobody@example.com',
+                                            'jdavid@itaapy.com'])
+        self.assertEqual(len(list(walker)), 5)
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, authors=[])
+        self.assertEqual(list(walker), [])
+
+    def test_filter_message(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, message='Say hello')
+        walker.mode = 'raw'
+        self.assertEqual([binascii.hexlify(x).decode() for x in walker],
+                         log[2:4])
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, message='hello',
+                                since=1297696908)
+        self.assertEqual([x.hex for x in walker], log[2:3])
+
+    def test_to_columns(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        columns = walker.to_columns()
+        self.assertEqual(binascii.hexlify(columns['id']).decode(),
+                         ''.join(log))
+        self.assertEqual(list(columns['commit_time']),
+                         [1297697074, 1297696974, 1297696908, 1297696877,
+                          1297179898])
+        self.assertEqual(len(columns['author_time_offset']), 5)
+
+        offsets, ids = columns['parents']
+        self.assertEqual(list(offsets), [0, 2, 3, 4, 5, 5])
+        self.assertEqual(binascii.hexlify(ids).decode(),
+                         ''.join([log[1], log[2], log[4], log[3], log[4]]))
+
+        codes, table = columns['committer_email']
+        self.assertEqual(table, ['jdavid@itaapy.com'])
+        self.assertEqual(list(codes), [0] * 5)
+
+        # The walk is over
+        self.assertEqual(walker.to_columns(['id']), {'id': b''})
+
+    def test_to_columns_fields(self):
+        walker = self.repo.walk(None, GIT_SORT_TIME, since=1297696908)
+        walker.push_glob('heads/*')
+        columns = walker.to_columns(fields=['tree_id', 'author_name'])
+        self.assertEqual(sorted(columns), ['author_name', 'tree_id'])
+        self.assertEqual(len(columns['tree_id']), 4 * 20)
+
+        codes, table = columns['author_name']
+        self.assertEqual([table[x] for x in codes],
+                         ['Nico von Geyso'] + ['J. David Ibañez'] * 3)
+
+        self.assertRaises(ValueError, walker.to_columns, ['message'])
+
+    def test_paths(self):
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, paths=['hello.txt'])
+        self.assertEqual([x.hex for x in walker], log[2:])
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME, paths=['/hello.txt'])
+        self.assertEqual([x.hex for x in walker], log[2:])
+
+        walker = self.repo.walk(log[0], GIT_SORT_TIME)
+        walker.mode = 'oid'
+        walker.set_paths(['.gitignore', 'nothere/'])
+        self.assertEqual([x.hex for x in walker], log[1:2])
+
+        walker.reset()
+        walker.push(log[0])
+        walker.set_paths(None)
+        self.assertEqual([x.hex for x in walker], log)
+
+        self.assertRaises(ValueError, walker.set_paths, ['/'])
+
+    def test_paths_follow_renames(self):
+        repo = self.repo
+        head = repo[log[0]]
+        bld = repo.TreeBuilder(head.tree)
+        bld.insert('hola.txt', head.tree['hello.txt'].oid, GIT_FILEMODE_BLOB)
+        bld.remove('hello.txt')
+        signature = Signature('Foo', 'foo@example.com', head.commit_time + 60,
+                              0)
+        oid = repo.create_commit(None, signature, signature, 'Rename',
+                                 bld.write(), [head.id])
+
+        walker = repo.walk(oid, GIT_SORT_TIME, paths='hola.txt')
+        self.assertEqual([x.id for x in walker], [oid])
+
+        walker = repo.walk(oid, GIT_SORT_TIME, paths='hola.txt',
+                           follow_renames=True)
+        expected = [oid.hex] + log[2:]
+        self.assertEqual([x.hex for x in walker], expected)
+
+        # Starting again follows the new name again
+        walker.reset()
+        walker.push(oid)
+        self.assertEqual([x.hex for x in walker], expected)
+
+        self.assertRaises(ValueError, walker.set_paths, ['a', 'b'], True)
+
+
+class WalkCheckpointTest(utils.RepoTestCase):
+
+    def test_checkpoint(self):
+        checkpoint = self.repo.checkpoint()
+        self.assertEqual(checkpoint.tips, {'refs/heads/master': log[0],
+                                           'refs/heads/i18n': I18N})
+        self.assertEqual(self.repo.checkpoint('refs/heads/i*').tips,
+                         {'refs/heads/i18n': I18N})
+
+        path = os.path.join(self.repo.workdir, 'checkpoint.json')
+        checkpoint.save(path)
+        self.assertEqual(WalkCheckpoint.load(path), checkpoint)
+
+    def test_walk_since(self):
+        repo = self.repo
+        update = repo.walk_since(None, GIT_SORT_TIME)
+        self.assertEqual([x.hex for x in update.walker], [I18N] + log)
+        self.assertEqual(update.created, ['refs/heads/i18n',
+                                          'refs/heads/master'])
+        checkpoint = update.checkpoint
+
+        update = repo.walk_since(checkpoint, GIT_SORT_TIME)
+        self.assertEqual(list(update.walker), [])
+        self.assertEqual(update.created + update.moved + update.deleted, [])
+
+        head = repo[log[0]]
+        signature = Signature('Foo', 'foo@example.com', head.commit_time + 60,
+                              0)
+        oid = repo.create_commit('refs/heads/master', signature, signature,
+                                 'New', head.tree.id, [head.id])
+        repo.lookup_reference('refs/heads/i18n').delete()
+        repo.create_reference('refs/heads/old', log[-1])
+
+        update = repo.walk_since(checkpoint, GIT_SORT_TIME)
+        self.assertEqual([x.id for x in update.walker], [oid])
+        self.assertEqual(update.created, ['refs/heads/old'])
+        self.assertEqual(update.moved, ['refs/heads/master'])
+        self.assertEqual(update.deleted, ['refs/heads/i18n'])
+        self.assertEqual(update.checkpoint.tips['refs/heads/master'],
+                         oid.hex)
+
+    def test_walk_since_missing_tip(self):
+        checkpoint = WalkCheckpoint({'refs/heads/gone': '1' * 40})
+        update = self.repo.walk_since(checkpoint, GIT_SORT_TIME,
+                                      pattern='refs/heads/master')
+        self.assertEqual([x.hex for x in update.walker], log)
+        self.assertEqual(update.deleted, ['refs/heads/gone'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -32,6 +32,7 @@ from __future__ import unicode_literals
 import operator
 import unittest
 
+from pygit2 import GIT_OBJ_BLOB, GIT_OBJ_TREE
 from . import utils
 
 
@@ -128,5 +129,40 @@ class TreeTest(utils.BareRepoTestCase):
         self.assertFalse('c/e' in tree)
         self.assertFalse('d' in tree)
 
+    def test_walk(self):
+        tree = self.repo[TREE_SHA]
+        paths = [path for path, entry in tree.walk()]
+        self.assertEqual(paths, ['a', 'b', 'c', 'c/d'])
+        paths = [path for path, entry in tree.walk(mode='post')]
+        self.assertEqual(paths, ['a', 'b', 'c/d', 'c'])
+        path, entry = list(tree.walk())[3]
+        self.assertTreeEntryEqual(entry,
+                                  '297efb891a47de80be0cfe9c639e4b8c9b450989',
+                                  'd', 0o0100644)
+        self.assertRaises(ValueError, tree.walk, mode='in')
+
+    def test_walk_types(self):
+        tree = self.repo[TREE_SHA]
+        paths = [path for path, entry in tree.walk(types=GIT_OBJ_BLOB)]
+        self.assertEqual(paths, ['a', 'b', 'c/d'])
+        paths = [path for path, entry in tree.walk(types=[GIT_OBJ_TREE])]
+        self.assertEqual(paths, ['c'])
+
+    def test_walk_prefix(self):
+        tree = self.repo[TREE_SHA]
+        self.assertEqual([p for p, e in tree.walk(prefix='c')], ['c/d'])
+        self.assertEqual([p for p, e in tree.walk(prefix='c/')], ['c/d'])
+        self.assertEqual([p for p, e in tree.walk(prefix='/c')], ['c/d'])
+        self.assertEqual([p for p, e in tree.walk(prefix='//c/d')], ['c/d'])
+        self.assertEqual([p for p, e in tree.walk(prefix='c/d')], ['c/d'])
+        self.assertEqual([p for p, e in tree.walk(prefix='x')], [])
+
+    def test_walk_compact(self):
+        tree = self.repo[TREE_SHA]
+        path, oid, filemode = list(tree.walk(compact=True))[0]
+        self.assertEqual(path, 'a')
+        self.assertEqual(oid.hex, '7f129fd57e31e935c6d60a0c794efe4e6927664b')
+        self.assertEqual(filemode, 0o0100644)
+
 if __name__ == '__main__':
     unittest.main()